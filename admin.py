@@ -2,12 +2,11 @@ import argparse
 import os
 import subprocess
 import sys
-import shutil
-from pathlib import Path
 
 # Ensure the tracks module can be imported
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 from tracks.config import settings
+from tracks.clients.gemini_client import prepare_gemini_home
 
 def main():
     parser = argparse.ArgumentParser(description="Admin CLI for Tracks")
@@ -17,8 +16,62 @@ def main():
     agent_parser.add_argument("agent_type", choices=["codex", "gemini"], help="The agent to run")
     agent_parser.add_argument("agent_args", nargs=argparse.REMAINDER, help="Arguments to pass to the agent")
     
+    subparsers.add_parser("reindex", help="Rebuild the history index from the JSONL files")
+    
+    compact_parser = subparsers.add_parser(
+        "compact-history",
+        help="Rewrite serialized_output in the history logs in the compact (or plain) encoding; stop the server first"
+    )
+    compact_parser.add_argument("--encoding", choices=["compact", "plain"], help="Default: HISTORY_OUTPUT_ENCODING")
+    compact_parser.add_argument("--compression", choices=["auto", "zstd", "gzip", "none"], help="Default: HISTORY_OUTPUT_COMPRESSION")
+    compact_parser.add_argument("--dry-run", action="store_true", help="Only report the sizes, leave the files alone")
+    
+    archive_parser = subparsers.add_parser(
+        "archive-history",
+        help="Apply the history retention settings and roll closed months into monthly archives"
+    )
+    archive_parser.add_argument("--after-days", type=int, help="Archive months ended this many days ago (default: HISTORY_ARCHIVE_AFTER_DAYS)")
+    archive_parser.add_argument("--dry-run", action="store_true", help="Only report what would change")
+    
     args = parser.parse_args()
     
+    if args.command == "reindex":
+        from tracks.services.history_index import history_index
+        counts = history_index.rebuild()
+        for source, count in sorted(counts.items()):
+            print(f"{source}: {count} conversations")
+        print(f"Index: {history_index.db_path}")
+        return
+    
+    if args.command == "compact-history":
+        from tracks.services.history_codec import convert_history
+        report = convert_history(args.encoding, args.compression, dry_run=args.dry_run)
+        total_before = total_after = 0
+        for directory, (files, before, after) in report.items():
+            total_before += before
+            total_after += after
+            print(f"{directory}: {files} files, {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB")
+        if total_before:
+            print(f"Total: {total_before / 1e6:.1f} MB -> {total_after / 1e6:.1f} MB "
+                  f"({100 * (total_after / total_before - 1):+.0f}%)")
+        if args.dry_run:
+            print("Dry run, no files were changed")
+        return
+    
+    if args.command == "archive-history":
+        from tracks.services.history_archive import run_maintenance
+        if args.after_days is not None:
+            settings.HISTORY_ARCHIVE_AFTER_DAYS = args.after_days
+        report = run_maintenance(dry_run=args.dry_run)
+        for action in ("expired", "archived"):
+            for directory, (logs, size) in report[action].items():
+                print(f"{directory}: {action} {logs} logs, {size / 1e6:.1f} MB")
+        if not any(report.values()):
+            print("Nothing to do, set HISTORY_ARCHIVE_AFTER_DAYS or a retention period")
+        if args.dry_run:
+            print("Dry run, no files were changed")
+        return
+    
     if args.command == "agent":
         agent_type = args.agent_type
         agent_home_path = settings.AGENT_HOME_PATH
@@ -49,26 +102,16 @@ def main():
             if cmd_args and not cmd_args[0].startswith("-"):
                 profile_id = cmd_args.pop(0)
                 
-            config_dir = os.path.join(storage_path, "gemini_homes", profile_id)
-            gemini_home_dir = str(Path.home() / ".gemini")
-            if os.path.exists(gemini_home_dir):
-                shutil.rmtree(gemini_home_dir)
-            symlink_failed = False
-            try:
-                os.symlink(config_dir, gemini_home_dir)
-            except Exception as e:
-                print(f"Warning: Could not create symlink: {e}")
-                symlink_failed = True
-                shutil.copytree(config_dir, gemini_home_dir)
-
-            os.makedirs(config_dir, exist_ok=True)
+            # Same per-profile HOME the API uses, the real ~/.gemini is left alone
+            gemini_home_dir = prepare_gemini_home(profile_id)
             os.makedirs(agent_home_path, exist_ok=True)
             
-            # env["GEMINI_CONFIG_DIR"] = config_dir
-            cmd = ["gemini"] + args.agent_args
+            env["HOME"] = gemini_home_dir
+            cmd = ["gemini"] + cmd_args
             
             print(f"Running gemini in {agent_home_path}")
-            print(f"GEMINI_CONFIG_DIR_SOURCE: {config_dir}")
+            print(f"Profile ID: {profile_id}")
+            print(f"HOME: {gemini_home_dir}")
             
         try:
             subprocess.run(cmd, env=env, cwd=agent_home_path)
@@ -79,10 +122,6 @@ def main():
             pass
         except Exception as e:
             print(f"Error running {agent_type}: {e}")
-        finally:
-            if symlink_failed:
-                shutil.copytree(gemini_home_dir, config_dir)
-                shutil.rmtree(gemini_home_dir)
 
 if __name__ == "__main__":
     main()
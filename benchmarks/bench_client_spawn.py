@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Benchmark for time-to-spawn of a CLI client run.
+
+"uncached" repeats what every run used to do: build a new client, rewrite its
+config file from the template and rebuild the child environment from
+os.environ, the vault and the secrets. "cached" goes through
+ClientState.get_client(), which reuses the per-profile client, its config
+file and its environment.
+
+Each case reports the median preparation time and the median time until the
+first output line of a fake CLI that prints one line and exits.
+
+Usage: python benchmarks/bench_client_spawn.py [iterations]
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import tempfile
+import statistics
+import contextlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+FAKE_CLI = "#!/bin/sh\necho ok\n"
+
+
+def uncached_client(client_class, cwd):
+    client = client_class(cwd=cwd)
+    # Old constructor: unconditional template write
+    config_path = os.path.join(cwd, '.codex', 'config.toml')
+    if os.path.exists(config_path):
+        with open(config_path) as f:
+            content = f.read()
+        with open(config_path, 'w') as f:
+            f.write(content)
+    # Old exec_prompt: environment rebuilt on every run
+    client._build_env = client._compose_env
+    return client
+
+
+def cached_client(client_class, cwd):
+    from tracks.services.client_service import client_state
+    return client_state.get_client(cwd=cwd)
+
+
+def run_once(factory, client_class, cwd, binary):
+    """Return (prepare seconds, seconds until the first output line)."""
+    # Silence the clients' [cli] progress prints
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        client = factory(client_class, cwd)
+        client.binary_path = binary
+        client._build_env()
+        prepared = time.perf_counter() - start
+        first_line = None
+        for _ in client.exec_prompt("bench", skip_git_repo_check=True):
+            if first_line is None:
+                first_line = time.perf_counter() - start
+    return prepared, first_line
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    workdir = tempfile.mkdtemp()
+    os.environ.setdefault("TRACKS_AGENT_HOME_PATH", os.path.join(workdir, "agent"))
+    os.environ.setdefault("TRACKS_STORAGE_PATH", os.path.join(workdir, "storage"))
+    os.environ.setdefault("TRACKS_VAULT_PATH", os.path.join(workdir, "vault.json"))
+    os.makedirs(os.environ["TRACKS_AGENT_HOME_PATH"], exist_ok=True)
+
+    # A vault of realistic size: a handful of OAuth token blobs
+    with open(os.environ["TRACKS_VAULT_PATH"], "w") as f:
+        json.dump({f"SERVICE_{i}_TOKEN": json.dumps({"access_token": "x" * 400, "refresh_token": "y" * 200}) for i in range(20)}, f)
+
+    binary = os.path.join(workdir, "fake-cli")
+    with open(binary, "w") as f:
+        f.write(FAKE_CLI)
+    os.chmod(binary, 0o755)
+
+    from tracks.config import settings
+    from tracks.clients.codex_client import CodexClient
+    from tracks.services.client_service import client_state
+    client_state.set_client_type("codex")
+    cwd = settings.AGENT_HOME_PATH
+
+    # Interleave the cases so machine noise hits both equally
+    results = {"uncached": [], "cached": []}
+    for _ in range(iterations):
+        results["uncached"].append(run_once(uncached_client, CodexClient, cwd, binary))
+        results["cached"].append(run_once(cached_client, CodexClient, cwd, binary))
+
+    medians = {}
+    for label, samples in results.items():
+        prepare = statistics.median(s[0] for s in samples)
+        first_line = statistics.median(s[1] for s in samples)
+        medians[label] = (prepare, first_line)
+        print(f"{label:<9} prepare {prepare * 1e3:7.3f} ms  first output line {first_line * 1e3:7.3f} ms (median of {iterations})")
+    print(f"prepare speedup: {medians['uncached'][0] / medians['cached'][0]:.1f}x, "
+          f"saved per spawn: {(medians['uncached'][1] - medians['cached'][1]) * 1e3:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
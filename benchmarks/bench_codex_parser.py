@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the Codex text protocol parser.
+
+Replays the recorded transcripts in benchmarks/corpus/codex/ (see
+codex_corpus.py) through the previous if/elif parser and the current
+table-driven CodexClient.serialize_output, checks that both produce the same
+events, and reports lines/sec for each.
+
+Usage: python benchmarks/bench_codex_parser.py [repeat]
+"""
+
+import os
+import re
+import sys
+import json
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from codex_corpus import load_corpus
+
+OUTPUT_TAG_STDOUT = 0
+
+
+def old_serialize_output(output):
+    """The previous parser: if/elif chain with uncompiled patterns."""
+    output_tag = None
+    meta_done = False
+    meta_dict = {}
+
+    for tag, line in output:
+        trimmed_line = line.strip()
+
+        if tag == OUTPUT_TAG_STDOUT:
+            if output_tag != 'stdout':
+                output_tag = 'stdout'
+                yield ('title', 'Stdout')
+            yield ('stdout', line)
+            continue
+
+        if trimmed_line == 'user':
+            output_tag = 'user'
+            yield ('title', 'User')
+            continue
+        elif trimmed_line == 'thinking':
+            output_tag = 'thinking'
+            yield ('title', 'Thinking')
+            continue
+        elif trimmed_line == 'exec':
+            output_tag = 'exec'
+            yield ('title', 'Run')
+            continue
+        elif trimmed_line in ('kori', 'codex'):
+            output_tag = 'agent'
+            yield ('title', 'Agent')
+            continue
+        elif trimmed_line == 'file update:':
+            output_tag = 'file_update'
+            yield ('title', 'File Update')
+            continue
+        elif trimmed_line == 'tokens used':
+            output_tag = 'tokens_used'
+            continue
+        elif trimmed_line == 'non zero exit code':
+            output_tag = 'error'
+            yield ('title', 'Error')
+            continue
+
+        if not meta_done and re.match(r'^[-]{3,}$', trimmed_line):
+            if output_tag != 'meta':
+                output_tag = 'meta'
+            else:
+                output_tag = None
+                meta_done = True
+                yield ('meta', json.dumps(meta_dict))
+            continue
+
+        if output_tag == 'meta':
+            colon_index = line.find(':')
+            if colon_index != -1:
+                key = line[:colon_index].strip().replace(' ', '_')
+                value = line[colon_index + 1:].strip()
+                meta_dict[key] = value
+        elif output_tag == 'exec':
+            exec_match = re.match(
+                r'^(.*) succeeded in ([0-9.,]+ms)(:)?(\s)*$',
+                line
+            )
+            if exec_match:
+                yield ('exec', exec_match.group(1) + '\n')
+                yield ('exec_time', exec_match.group(2))
+            else:
+                yield ('exec_output', line)
+        elif output_tag == 'tokens_used':
+            yield ('tokens_used', trimmed_line.replace(',', ''))
+        elif output_tag is not None:
+            yield (output_tag, line)
+
+    yield ('done', '')
+
+
+def old_check(client_state, events):
+    for tag, line in events:
+        client_state.check_and_update_state([{"tag": tag, "data": line}])
+
+
+def new_check(client_state, events):
+    for tag, line in events:
+        client_state.check_event(tag, line)
+
+
+def bench(label, func, iterations):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<22} {iterations / elapsed / 1e6:6.2f} M lines/s ({elapsed:.3f}s)")
+    return elapsed
+
+
+def main():
+    from tracks.clients.codex_client import CodexClient
+    from tracks.services.client_service import client_state
+
+    transcript = load_corpus()
+    if not transcript:
+        print("No corpus found, run benchmarks/codex_corpus.py first")
+        return
+
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    client = CodexClient.__new__(CodexClient)
+
+    expected = list(old_serialize_output(transcript))
+    actual = list(client.serialize_output(transcript))
+    if expected != actual:
+        raise SystemExit("Parsers disagree on the corpus")
+
+    # Replay the corpus as one long session, like a busy agent run
+    stream = transcript * repeat
+    print(f"corpus: {len(transcript)} lines x {repeat}")
+    before = bench("old parser", lambda: list(old_serialize_output(stream)), len(stream))
+    after = bench("new parser", lambda: list(client.serialize_output(stream)), len(stream))
+    print(f"parser speedup: {before / after:.2f}x")
+
+    events = expected * repeat
+    client_state._client_type = "codex"
+    before = bench("check (list per event)", lambda: old_check(client_state, events), len(events))
+    after = bench("check_event", lambda: new_check(client_state, events), len(events))
+    print(f"check speedup: {before / after:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
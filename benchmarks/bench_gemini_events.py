@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the Gemini stream-json pipeline on a tool-heavy run.
+
+"old" is the previous pipeline: the reader json.loads every stdout line to
+append it to the session file, reopening the file (plus an exists() check)
+per event, and serialize_output json.loads the same line again. "new" is
+GeminiClient._route_stdout_line + _serialize_line: one parse per line and one
+buffered SessionWriter per run.
+
+Reports wall time, json.loads/json.dumps calls and file opens for each.
+
+Usage: python benchmarks/bench_gemini_events.py [tool_calls]
+"""
+
+import os
+import sys
+import json
+import time
+import builtins
+import tempfile
+from pathlib import Path
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def make_stream(tool_calls):
+    """stream-json lines of a run that calls many tools and streams its answer"""
+    lines = [json.dumps({"type": "init", "session_id": "cli", "model": "gemini-2.5-pro"})]
+    for i in range(tool_calls):
+        lines.append(json.dumps({"type": "tool_use", "tool_name": "run_shell_command", "tool_id": f"t{i}", "parameters": {"command": f"grep -rn item{i} ."}}))
+        lines.append(json.dumps({"type": "tool_result", "tool_id": f"t{i}", "status": "success", "output": f"./notes/{i}.md:3: item{i} found\n" * 20}))
+        for w in range(5):
+            lines.append(json.dumps({"type": "message", "role": "assistant", "content": f"step {i} word {w} ", "delta": True}))
+    lines.append(json.dumps({"type": "result", "status": "success", "stats": {"total_tokens": 12345}}))
+    return [line + "\r\n" for line in lines]
+
+
+def old_pipeline(client, lines, session_path):
+    def append_to_session(event):
+        if not session_path.exists():
+            session_path.touch()
+        with open(session_path, 'a') as f:
+            f.write(json.dumps(event) + '\n')
+
+    state = {'meta_dict': {}, 'meta_emitted': False}
+    count = 0
+    for line in lines:
+        try:
+            append_to_session(json.loads(line.strip()))
+        except json.JSONDecodeError:
+            pass
+        # Second parse inside serialize_output
+        event = json.loads(line.strip())
+        for _ in client._serialize_event(state, event.get('type', 'unknown'), event, line.strip()):
+            count += 1
+    return count
+
+
+def new_pipeline(client, lines, session_path):
+    from tracks.clients.gemini_session import SessionWriter
+    state = {'meta_dict': {}, 'meta_emitted': False}
+    count = 0
+    writer = SessionWriter(session_path)
+    try:
+        for line in lines:
+            tag, item = client._route_stdout_line(writer, line)
+            for _ in client._serialize_line(state, tag, item):
+                count += 1
+    finally:
+        writer.close()
+    return count
+
+
+def count_calls(func, *args):
+    """Run func counting json.loads/json.dumps calls and file opens."""
+    counters = {"loads": 0, "dumps": 0, "opens": 0}
+    originals = (json.loads, json.dumps, builtins.open)
+
+    def loads(*a, **k):
+        counters["loads"] += 1
+        return originals[0](*a, **k)
+
+    def dumps(*a, **k):
+        counters["dumps"] += 1
+        return originals[1](*a, **k)
+
+    def opener(*a, **k):
+        counters["opens"] += 1
+        return originals[2](*a, **k)
+
+    json.loads, json.dumps, builtins.open = loads, dumps, opener
+    try:
+        func(*args)
+    finally:
+        json.loads, json.dumps, builtins.open = originals
+    return counters
+
+
+def main():
+    tool_calls = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    workdir = tempfile.mkdtemp()
+    os.environ.setdefault("TRACKS_STORAGE_PATH", workdir)
+
+    from tracks.clients.gemini_client import GeminiClient
+    client = GeminiClient.__new__(GeminiClient)
+    lines = make_stream(tool_calls)
+    print(f"{len(lines)} stream-json lines ({tool_calls} tool calls)")
+
+    for label, pipeline in (("old", old_pipeline), ("new", new_pipeline)):
+        session_path = Path(workdir) / f"{label}.jsonl"
+        calls = count_calls(pipeline, client, lines, session_path)
+        session_path.unlink()
+
+        start = time.perf_counter()
+        for _ in range(5):
+            pipeline(client, lines, session_path)
+            session_path.unlink()
+        elapsed = (time.perf_counter() - start) / 5
+        print(f"{label}: {elapsed * 1e3:7.2f} ms/run  json.loads {calls['loads']:5d}  json.dumps {calls['dumps']:5d}  opens {calls['opens']:5d}")
+
+
+if __name__ == "__main__":
+    main()
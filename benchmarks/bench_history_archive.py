@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark for monthly archival of an aging history tree.
+
+Writes N sessions spread over the past two years, then reports the number
+of files and directories under history/ and heartbeat/, the time of a full
+walk of the trees (what rebuilds and file relocation pay) and the latency of
+opening a conversation, before and after history_archive.archive() rolls
+every month older than 30 days into its zip. Opening reads an archived
+conversation from its zip member afterwards.
+
+Usage: python benchmarks/bench_history_archive.py [sessions]
+"""
+
+import os
+import sys
+import time
+import tempfile
+import statistics
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def tree_stats(agent_home):
+    files = dirs = 0
+    start = time.perf_counter()
+    for name in ("history", "heartbeat"):
+        for root, subdirs, names in os.walk(os.path.join(agent_home, name)):
+            dirs += 1
+            files += len(names)
+    return files, dirs, (time.perf_counter() - start) * 1e3
+
+
+def median_ms(func, samples):
+    times = []
+    for sample in samples:
+        start = time.perf_counter()
+        func(sample)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1e3
+
+
+def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    workdir = tempfile.mkdtemp()
+    os.environ.setdefault("TRACKS_AGENT_HOME_PATH", os.path.join(workdir, "agent"))
+    os.environ.setdefault("TRACKS_STORAGE_PATH", os.path.join(workdir, "storage"))
+
+    from tracks.config import settings
+    from tracks.services import history_service, heartbeat_history_service, history_archive
+
+    now = datetime.now()
+    ids = []
+    for i in range(sessions):
+        created = now - timedelta(days=730 * (sessions - i) / sessions)
+        service = heartbeat_history_service if i % 4 == 3 else history_service
+        session_id = f"s{i:06d}"
+        service.save_message(session_id, "user", "question", timestamp=created)
+        service.save_message(session_id, "assistant", "answer " * 50, timestamp=created)
+        mtime = created.timestamp()
+        path = service.resolve_log_file(session_id, created)[0]
+        os.utime(path, (mtime, mtime))
+        if service is history_service:
+            ids.append(session_id)
+
+    # Spread over the whole period, most of them archived afterwards
+    samples = ids[::max(len(ids) // 50, 1)]
+    print(f"{sessions} sessions over two years")
+    files, dirs, walk = tree_stats(settings.AGENT_HOME_PATH)
+    open_ms = median_ms(history_service.get_conversation, samples)
+    print(f"before  {files:6d} files {dirs:5d} dirs  walk {walk:7.1f} ms  open {open_ms:.3f} ms")
+
+    start = time.perf_counter()
+    history_archive.archive(30)
+    elapsed = time.perf_counter() - start
+    files, dirs, walk = tree_stats(settings.AGENT_HOME_PATH)
+    open_ms = median_ms(history_service.get_conversation, samples)
+    print(f"after   {files:6d} files {dirs:5d} dirs  walk {walk:7.1f} ms  open {open_ms:.3f} ms  "
+          f"(archived in {elapsed:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
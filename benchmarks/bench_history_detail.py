@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Benchmark for opening a conversation with large agent outputs.
+
+Writes one conversation of N turns whose assistant messages carry a large
+serialized_output, then reports the median latency and response size of
+history_service.get_conversation() (every message in full, the previous
+/api/history/{id}), get_conversation_summary() (the new default) and
+get_message_output() for one message in the middle, which seeks to its line
+through the byte-offset sidecar.
+
+Usage: python benchmarks/bench_history_detail.py [turns] [events_per_run]
+"""
+
+import os
+import sys
+import time
+import tempfile
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def median_ms(func, repeat=15):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1e3
+
+
+def main():
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else 25
+    events = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    workdir = tempfile.mkdtemp()
+    os.environ.setdefault("TRACKS_AGENT_HOME_PATH", os.path.join(workdir, "agent"))
+    os.environ.setdefault("TRACKS_STORAGE_PATH", os.path.join(workdir, "storage"))
+
+    from tracks.services import history_service
+    from tracks.services.history_index import history_index, SOURCE_CHAT
+
+    session_id = "bench-detail"
+    output = [{"tag": "exec_output" if i % 3 else "agent", "data": f"line {i} of the run output\n"} for i in range(events)]
+    for turn in range(turns):
+        history_service.save_message(session_id, "user", f"question {turn}")
+        history_service.save_message(session_id, "assistant", f"answer {turn}", serialized_output=output)
+    file_path = history_index.resolve(SOURCE_CHAT, session_id)[0]
+    print(f"{2 * turns} messages, {os.path.getsize(file_path) / 1e6:.1f} MB log")
+
+    middle = turns // 2 * 2 + 1
+    cases = {
+        "full": lambda: history_service.get_conversation(session_id),
+        "summary": lambda: history_service.get_conversation_summary(session_id),
+        "one output": lambda: history_service.get_message_output(session_id, middle),
+    }
+    for label, func in cases.items():
+        size = len(func().model_dump_json())
+        print(f"{label:<11} {median_ms(func):8.2f} ms  {size / 1e3:9.1f} KB response")
+
+
+if __name__ == "__main__":
+    main()
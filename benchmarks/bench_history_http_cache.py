@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Benchmark for revalidating the history APIs with If-None-Match.
+
+Writes N conversations carrying agent output, then requests the sidebar
+listing and a conversation with ?full=true through the ASGI app, with the
+compression middleware, three ways: a plain GET, a GET accepting gzip (and
+brotli if installed), and a GET with the ETag of the previous response,
+which is what a web UI tab re-polling an unchanged conversation sends.
+Reports latency and bytes on the wire.
+
+Usage: python benchmarks/bench_history_http_cache.py [conversations]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import tempfile
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+REPEAT = 15
+
+
+async def get(app, path, query, headers):
+    """Run one GET through the ASGI app, return (status, response headers, body)."""
+    body = bytearray()
+    start = {}
+    requested = False
+    done = asyncio.Event()
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # Streaming responses listen for the client going away
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            start["status"] = message["status"]
+            start["headers"] = {k.decode(): v.decode() for k, v in message["headers"]}
+        elif message["type"] == "http.response.body":
+            body.extend(message.get("body", b""))
+            if not message.get("more_body", False):
+                done.set()
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": query.encode(),
+        "root_path": "", "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+        "client": ("127.0.0.1", 1), "server": ("127.0.0.1", 80)
+    }
+    await app(scope, receive, send)
+    return start["status"], start["headers"], bytes(body)
+
+
+def main():
+    conversations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    workdir = tempfile.mkdtemp()
+    os.environ.setdefault("TRACKS_AGENT_HOME_PATH", os.path.join(workdir, "agent"))
+    os.environ.setdefault("TRACKS_STORAGE_PATH", os.path.join(workdir, "storage"))
+
+    from fastapi import FastAPI
+    from tracks.controllers.history import router
+    from tracks.http_cache import CompressionMiddleware, brotli
+    from tracks.services import history_service
+
+    app = FastAPI()
+    app.include_router(router)
+    app.add_middleware(CompressionMiddleware)
+
+    output = [{"tag": "exec_output", "data": f"tests/test_{i}.py::test_case PASSED\n"} for i in range(400)]
+    for i in range(conversations):
+        session_id = f"cache-{i:05d}"
+        for turn in range(5):
+            history_service.save_message(session_id, "user", f"question {turn}")
+            history_service.save_message(session_id, "assistant", f"answer {turn}", serialized_output=output)
+
+    async def measure(path, query):
+        results = {}
+        _, headers, _ = await get(app, path, query, {})
+        variants = {
+            "plain": {},
+            "compressed": {"Accept-Encoding": "br, gzip"},
+            "revalidated": {"If-None-Match": headers["etag"]}
+        }
+        for name, request_headers in variants.items():
+            times = []
+            for _ in range(REPEAT):
+                start = time.perf_counter()
+                status, response_headers, body = await get(app, path, query, request_headers)
+                times.append(time.perf_counter() - start)
+            results[name] = (status, statistics.median(times) * 1e3, len(body),
+                             response_headers.get("content-encoding", "-"))
+        return results
+
+    print(f"{conversations} conversations, brotli {'installed' if brotli is not None else 'not installed'}")
+    for label, path, query in (
+        ("sidebar", "/api/history", "limit=100"),
+        ("full conversation", f"/api/history/cache-{conversations - 1:05d}", "full=true")
+    ):
+        results = asyncio.run(measure(path, query))
+        print(label)
+        for name, (status, ms, size, encoding) in results.items():
+            print(f"  {name:<12} {status}  {ms:7.3f} ms  {size:8d} bytes  encoding {encoding}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Benchmark for GET /api/history/{id}?full=true on a large conversation.
+
+Writes a conversation of about 5 MB of agent output, then requests it
+through the ASGI app two ways: the passthrough endpoint, which streams the
+stored lines, and the previous implementation, which builds a
+HistoryMessage per line and has FastAPI validate and serialize the
+HistoryDetailResponse again (response_model). Runs once with the logs in the
+plain encoding, where lines are sent verbatim, and once in the compact
+encoding, where only serialized_output is expanded. Checks that both
+endpoints return the same JSON. Uses orjson when it is installed.
+
+Usage: python benchmarks/bench_history_passthrough.py [megabytes]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import tempfile
+import statistics
+from typing import Union
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORDS = (
+    "build test deploy server error fix module import config cache index query "
+    "request response timeout retry handler worker queue session token file path"
+).split()
+
+REPEAT = 7
+
+
+def agent_run(rng):
+    output = [{"tag": "meta", "data": json.dumps({"model": "gpt-5-codex"})}]
+    for _ in range(rng.randint(2, 8)):
+        output.append({"tag": "thinking", "data": " ".join(rng.choices(WORDS, k=30)) + "\n"})
+        output.append({"tag": "exec", "data": f"bash -lc 'pytest -q tests/test_{rng.choice(WORDS)}.py'\n"})
+        for i in range(rng.randint(20, 300)):
+            output.append({"tag": "exec_output", "data": f"{rng.choice(WORDS)}.py:{i} "
+                                                          f"{' '.join(rng.choices(WORDS, k=6))}\n"})
+    output.append({"tag": "agent", "data": " ".join(rng.choices(WORDS, k=80)) + "\n"})
+    output.append({"tag": "done", "data": ""})
+    return output
+
+
+async def get(app, path, query):
+    """Run one GET through the ASGI app, return (status, body)."""
+    body = bytearray()
+    status = None
+    requested = False
+    done = asyncio.Event()
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # Streaming responses listen for the client going away
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            body.extend(message.get("body", b""))
+            if not message.get("more_body", False):
+                done.set()
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": query.encode(),
+        "root_path": "", "headers": [], "client": ("127.0.0.1", 1), "server": ("127.0.0.1", 80)
+    }
+    await app(scope, receive, send)
+    return status, bytes(body)
+
+
+def main():
+    megabytes = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    workdir = tempfile.mkdtemp()
+    os.environ.setdefault("TRACKS_AGENT_HOME_PATH", os.path.join(workdir, "agent"))
+    os.environ.setdefault("TRACKS_STORAGE_PATH", os.path.join(workdir, "storage"))
+
+    from fastapi import FastAPI, HTTPException
+    from tracks.config import settings
+    from tracks.controllers.history import router
+    from tracks.services import history_service, history_reader
+    from tracks.models import HistoryDetailResponse, HistorySummaryResponse
+
+    app = FastAPI()
+    app.include_router(router)
+
+    @app.get("/previous/{session_id}", response_model=Union[HistorySummaryResponse, HistoryDetailResponse])
+    async def previous(session_id: str):
+        conversation = await asyncio.to_thread(history_service.get_conversation, session_id)
+        if conversation is None:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        return conversation
+
+    # The same turns for both encodings, as many as make the plain log that large
+    rng = random.Random(5)
+    turns = []
+    size = 0
+    while size < megabytes * 1e6:
+        turns.append((" ".join(rng.choices(WORDS, k=12)), agent_run(rng)))
+        size += len(json.dumps(turns[-1][1], ensure_ascii=False, separators=(',', ':')))
+
+    print(f"json codec: {'orjson' if history_reader.orjson is not None else 'json'}, {len(turns)} turns")
+    for encoding in ("plain", "compact"):
+        settings.HISTORY_OUTPUT_ENCODING = encoding
+        session_id = f"bench-{encoding}"
+        for question, output in turns:
+            history_service.save_message(session_id, "user", question)
+            path = history_service.save_message(session_id, "assistant", "done", serialized_output=output)
+        size = os.path.getsize(path)
+
+        async def measure(url, query):
+            times = []
+            for _ in range(REPEAT):
+                start = time.perf_counter()
+                status, body = await get(app, url, query)
+                times.append(time.perf_counter() - start)
+                assert status == 200, status
+            return statistics.median(times) * 1e3, body
+
+        results = {
+            "previous": asyncio.run(measure(f"/previous/{session_id}", "")),
+            "passthrough": asyncio.run(measure(f"/api/history/{session_id}", "full=true"))
+        }
+
+        same = json.loads(results["previous"][1]) == json.loads(results["passthrough"][1])
+        print(f"{encoding:<8} log {size / 1e6:4.1f} MB, response {len(results['passthrough'][1]) / 1e6:4.1f} MB  "
+              f"previous {results['previous'][0]:7.1f} ms  passthrough {results['passthrough'][0]:7.1f} ms  "
+              f"{results['previous'][0] / results['passthrough'][0]:4.1f}x  same JSON {'yes' if same else 'NO'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Benchmark for full-text history search at scale.
+
+Writes a synthetic history of N messages (chat, Telegram and heartbeat logs
+with a realistic vocabulary), builds the index with `admin.py reindex`'s
+HistoryIndex.rebuild(), then reports the median latency of
+history_service.search_messages() for rare and common words, a phrase,
+filtered queries and a second page fetched with the cursor. Also checks that
+paging through every result with the cursor returns each match exactly once,
+for a common query spanning several ranking windows while messages are being
+indexed too.
+
+Usage: python benchmarks/bench_history_search.py [messages]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+import statistics
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORDS = (
+    "the agent ran tests build deploy server error fix calendar meeting email "
+    "invoice budget report weather garden recipe travel flight hotel python "
+    "docker database query index cache latency memory disk network backup "
+    "photo music reminder schedule project review release branch commit"
+).split()
+
+
+def write_history(agent_home, messages):
+    from tracks.services.history_service import get_history_file_path
+    from tracks.services.heartbeat_history_service import get_heartbeat_file_path
+
+    rng = random.Random(7)
+    start = datetime(2024, 1, 1)
+    per_session = 20
+    for session in range(messages // per_session):
+        created = start + timedelta(minutes=37 * session)
+        kind = session % 10
+        if kind < 6:
+            session_id = f"chat{session:07d}"
+            path = get_history_file_path(session_id, created)
+        elif kind < 8:
+            session_id = f"telegram-{session:07d}"
+            path = get_history_file_path(session_id, created)
+        else:
+            session_id = f"hb{session:07d}"
+            path = get_heartbeat_file_path(session_id, created)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            for i in range(per_session):
+                words = rng.choices(WORDS, k=rng.randint(8, 60))
+                if rng.random() < 0.001:
+                    words.append("zanzibar")
+                f.write(json.dumps({
+                    "role": "user" if i % 2 == 0 else "assistant",
+                    "content": " ".join(words),
+                    "timestamp": (created + timedelta(seconds=30 * i)).isoformat(),
+                    "serialized_output": None,
+                    "metadata": None
+                }) + "\n")
+
+
+def median_ms(func, repeat=9):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1e3
+
+
+def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 300_000
+    workdir = tempfile.mkdtemp()
+    os.environ.setdefault("TRACKS_AGENT_HOME_PATH", os.path.join(workdir, "agent"))
+    os.environ.setdefault("TRACKS_STORAGE_PATH", os.path.join(workdir, "storage"))
+
+    from tracks.config import settings
+    from tracks.services import history_service
+    from tracks.services.history_index import history_index
+
+    write_history(settings.AGENT_HOME_PATH, messages)
+    start = time.perf_counter()
+    history_index.rebuild()
+    print(f"reindex {messages} messages: {time.perf_counter() - start:.1f}s, "
+          f"index {os.path.getsize(history_index.db_path) / 1e6:.0f} MB")
+
+    search = history_service.search_messages
+    first = search("deploy server")
+    cases = {
+        "rare word": lambda: search("zanzibar"),
+        "common word": lambda: search("agent"),
+        "two words": lambda: search("deploy server"),
+        "phrase": lambda: search('"database query"'),
+        "source filter": lambda: search("meeting", sources=["heartbeat"]),
+        "date filter": lambda: search("meeting", date_from="2024-06-01", date_to="2024-06-30"),
+        "second page": lambda: search("deploy server", cursor=first.next_cursor),
+    }
+    for label, func in cases.items():
+        print(f"{label:<14} {median_ms(func):8.2f} ms")
+
+    # Cursor paging must visit every match exactly once
+    seen = []
+    cursor = None
+    while True:
+        page = search("zanzibar", limit=7, cursor=cursor)
+        seen.extend((r.session_id, r.message_index) for r in page.results)
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+    total = len(search("zanzibar", limit=100_000).results)
+    print(f"cursor paging: {len(seen)} results, {len(set(seen))} unique, {total} expected")
+
+    seen = []
+    windows = 1
+    cursor = None
+    expected = history_index._reader().execute(
+        "SELECT COUNT(*) FROM messages_fts WHERE messages_fts MATCH ?", ('"backup"*',)
+    ).fetchone()[0]
+    while True:
+        page = search("backup", limit=100, cursor=cursor)
+        seen.extend((r.session_id, r.message_index) for r in page.results)
+        windows += page.older_matches
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+        # New matches indexed between pages neither shift nor join the ranking
+        history_index.record_message(
+            "chat", "benchnew", os.path.join(settings.AGENT_HOME_PATH, "new.jsonl"),
+            "2030-01-01T00:00:00", "user", "backup backup backup", "2030-01-01T00:00:00"
+        )
+    print(f"paging while indexing: {len(seen)} results, {len(set(seen))} unique, "
+          f"{expected} expected, {windows} windows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Disk usage of the serialized_output encodings on a sample history tree.
+
+Writes a tree of chat, Telegram and heartbeat conversations in the plain
+encoding, with agent runs shaped like the Codex client's output (one event
+per exec output line, thinking, agent messages, metadata events). Then
+converts copies of it with history_codec.convert_history() to the compact
+encoding without compression, with gzip and with zstd (if installed), and
+reports the size of each, the conversion time and the time to load every
+conversation back. Checks that each conversion expands to the same text per
+tag as the original.
+
+Usage: python benchmarks/bench_history_storage.py [conversations]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORDS = (
+    "build test deploy server error fix module import config cache index query "
+    "request response timeout retry handler worker queue session token file path"
+).split()
+
+
+def agent_run(rng):
+    output = [{"tag": "meta", "data": json.dumps({"model": "gpt-5-codex", "session_id": "x" * 36})}]
+    for _ in range(rng.randint(2, 12)):
+        output.append({"tag": "title", "data": "Thinking"})
+        output.append({"tag": "thinking", "data": " ".join(rng.choices(WORDS, k=rng.randint(10, 40))) + "\n"})
+        output.append({"tag": "title", "data": "Run"})
+        output.append({"tag": "exec", "data": f"bash -lc 'pytest -q tests/test_{rng.choice(WORDS)}.py'\n"})
+        for i in range(rng.randint(5, 400)):
+            output.append({"tag": "exec_output", "data": f"{rng.choice(WORDS)}/{rng.choice(WORDS)}.py:{i} "
+                                                          f"{' '.join(rng.choices(WORDS, k=6))}\n"})
+        output.append({"tag": "exec_time", "data": f"{rng.randint(5, 9000)}ms"})
+    output.append({"tag": "title", "data": "Agent"})
+    output.append({"tag": "agent", "data": " ".join(rng.choices(WORDS, k=80)) + "\n"})
+    output.append({"tag": "tokens_used", "data": str(rng.randint(1000, 90000))})
+    output.append({"tag": "done", "data": ""})
+    return output
+
+
+def tag_text(output):
+    """Text per tag run, what a coalescing encoding must preserve"""
+    runs = []
+    for item in output or []:
+        if runs and runs[-1][0] == item["tag"]:
+            runs[-1][1] += item["data"]
+        else:
+            runs.append([item["tag"], item["data"]])
+    return runs
+
+
+def tree_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, dirs, names in os.walk(path) for name in names)
+
+
+def main():
+    conversations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    workdir = tempfile.mkdtemp()
+    os.environ.setdefault("TRACKS_AGENT_HOME_PATH", os.path.join(workdir, "agent"))
+    os.environ.setdefault("TRACKS_STORAGE_PATH", os.path.join(workdir, "storage"))
+
+    from tracks.config import settings
+    from tracks.services import history_service, heartbeat_history_service
+    from tracks.services.history_codec import convert_history, zstandard
+    from tracks.services.history_index import history_index
+
+    settings.HISTORY_OUTPUT_ENCODING = "plain"
+    rng = random.Random(3)
+    expected = {}
+    for i in range(conversations):
+        service = heartbeat_history_service if i % 5 == 4 else history_service
+        session_id = f"telegram-{i:05d}" if i % 5 == 3 else f"s{i:05d}"
+        for turn in range(rng.randint(1, 4)):
+            output = agent_run(rng)
+            service.save_message(session_id, "user", " ".join(rng.choices(WORDS, k=12)))
+            service.save_message(session_id, "assistant", "done", serialized_output=output)
+            expected.setdefault((service, session_id), []).extend([None, tag_text(output)])
+
+    agent_home = settings.AGENT_HOME_PATH
+    plain = os.path.join(workdir, "plain")
+    shutil.copytree(agent_home, plain)
+    base = tree_size(plain)
+    print(f"{conversations} conversations, plain encoding {base / 1e6:.1f} MB")
+
+    variants = [("plain", "none"), ("compact", "none"), ("compact", "gzip")]
+    if zstandard is not None:
+        variants.append(("compact", "zstd"))
+    for encoding, compression in variants:
+        shutil.rmtree(agent_home)
+        shutil.copytree(plain, agent_home)
+        history_index.rebuild()
+
+        start = time.perf_counter()
+        convert_history(encoding, compression)
+        convert_time = time.perf_counter() - start
+        size = tree_size(agent_home)
+
+        start = time.perf_counter()
+        ok = True
+        for (service, session_id), runs in expected.items():
+            conversation = service.get_conversation(session_id)
+            got = [tag_text(m.serialized_output) if m.role == "assistant" else None for m in conversation.messages]
+            ok = ok and got == runs
+        load_time = time.perf_counter() - start
+        print(f"{encoding + '/' + compression:<13} {size / 1e6:7.1f} MB  {100 * (1 - size / base):3.0f}% smaller  "
+              f"convert {convert_time:5.2f}s  load all {load_time:5.2f}s  round trip {'ok' if ok else 'MISMATCH'}")
+
+
+if __name__ == "__main__":
+    main()
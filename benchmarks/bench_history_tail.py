@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Benchmark for reading the newest messages of conversations of growing length.
+
+For conversations of 100 to 10000 messages, each assistant message carrying
+agent output, reports the time to:
+  - summarize every message (what the Telegram rotation context and the web
+    UI used to load)
+  - read the last 50 summaries, ?tail=50, once the line offsets are stored
+  - read the first 15 and last 20 summaries with the reverse reader, what the
+    rotation context reads now, with no line offsets stored
+
+Usage: python benchmarks/bench_history_tail.py
+"""
+
+import os
+import sys
+import time
+import tempfile
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+LENGTHS = (100, 1000, 10000)
+REPEAT = 9
+
+
+def median_ms(func):
+    times = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1e3
+
+
+def main():
+    workdir = tempfile.mkdtemp()
+    os.environ.setdefault("TRACKS_AGENT_HOME_PATH", os.path.join(workdir, "agent"))
+    os.environ.setdefault("TRACKS_STORAGE_PATH", os.path.join(workdir, "storage"))
+
+    from tracks.services import history_service
+    from tracks.services.history_index import history_index
+
+    output = [{"tag": "exec_output", "data": f"line {i} of the command output\n"} for i in range(200)]
+    for length in LENGTHS:
+        session_id = f"tail-{length}"
+        for i in range(length // 2):
+            history_service.save_message(session_id, "user", f"question {i}")
+            path = history_service.save_message(session_id, "assistant", f"answer {i}", serialized_output=output)
+        size = os.path.getsize(path)
+
+        everything = median_ms(lambda: history_service.get_conversation_summary(session_id))
+        tail = median_ms(lambda: history_service.get_conversation_summary(session_id, tail=50))
+
+        def edges():
+            history_index.clear_line_offsets()
+            history_service.get_conversation_edges(session_id, 15, 20)
+        rotation = median_ms(edges)
+        print(f"{length:6d} messages {size / 1e6:6.1f} MB  all summaries {everything:7.2f} ms  "
+              f"tail=50 {tail:5.2f} ms  first 15 + last 20 {rotation:5.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark for history_service.save_message on a large history tree.
+
+"walk" is the previous lookup: os.walk over history/ until a file name
+contains the session id. "resolve" is HistoryIndex.resolve(), the in-memory
+LRU backed by the SQLite manifest. Both are measured on a tree of N sessions
+spread over many day directories, then full save_message() latency is
+reported for a chat turn (user + assistant message).
+
+Usage: python benchmarks/bench_history_write.py [sessions]
+"""
+
+import os
+import sys
+import time
+import tempfile
+import statistics
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def walk_lookup(history_dir, session_id):
+    for root, dirs, files in os.walk(history_dir):
+        for filename in files:
+            if session_id in filename and filename.endswith('.user.jsonl'):
+                return os.path.join(root, filename)
+    return None
+
+
+def median_ms(func, samples):
+    times = []
+    for sample in samples:
+        start = time.perf_counter()
+        func(sample)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1e3
+
+
+def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    workdir = tempfile.mkdtemp()
+    os.environ.setdefault("TRACKS_AGENT_HOME_PATH", os.path.join(workdir, "agent"))
+    os.environ.setdefault("TRACKS_STORAGE_PATH", os.path.join(workdir, "storage"))
+
+    from tracks.config import settings
+    from tracks.services import history_service
+    from tracks.services.history_index import history_index, SOURCE_CHAT
+
+    # One session every few hours over the past years
+    start = datetime(2024, 1, 1)
+    ids = []
+    for i in range(sessions):
+        session_id = f"0199{i:08x}-0000-7000-8000-000000000000"
+        path = history_service.get_history_file_path(session_id, start + timedelta(hours=5 * i))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write('{"role": "user", "content": "hi", "timestamp": "2024-01-01T00:00:00"}\n')
+        ids.append(session_id)
+    history_index.rebuild()
+
+    history_dir = os.path.join(settings.AGENT_HOME_PATH, "history")
+    # Newest sessions are the ones being written to
+    recent = ids[-50:]
+    print(f"{sessions} sessions")
+    walk = median_ms(lambda sid: walk_lookup(history_dir, sid), recent)
+    resolve = median_ms(lambda sid: history_index.resolve(SOURCE_CHAT, sid), recent)
+    print(f"walk    {walk:9.3f} ms/lookup")
+    print(f"resolve {resolve:9.3f} ms/lookup ({walk / resolve:.0f}x)")
+
+    def turn(session_id):
+        history_service.save_message(session_id, "user", "question")
+        history_service.save_message(session_id, "assistant", "answer")
+
+    print(f"save_message turn {median_ms(turn, recent):.3f} ms (was ~{2 * walk:.1f} ms in lookups alone)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Benchmark for history writes from concurrent async handlers.
+
+Several sessions finish a run at the same time, each saving its user message
+and an assistant message with a large serialized_output. "sync" calls
+history_service.save_message() inside the handlers like before; "async" uses
+asave_message() and awaits the commit future. A ticker task measures how long
+the event loop is blocked (the stall an SSE stream would see), and the total
+wall time gives the throughput.
+
+Usage: python benchmarks/bench_history_writer.py [sessions] [events_per_run]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+async def ticker(stalls, stop):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.001)
+        stalls.append(time.perf_counter() - start - 0.001)
+
+
+async def run(label, sessions, output, save):
+    stalls = []
+    stop = asyncio.Event()
+    tick = asyncio.create_task(ticker(stalls, stop))
+    await asyncio.sleep(0.01)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(save(f"{label}-{i}", output) for i in range(sessions)))
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await tick
+    print(f"{label:<6} {elapsed * 1e3:8.1f} ms total  {sessions / elapsed:7.1f} runs/s  "
+          f"worst loop stall {max(stalls) * 1e3:7.2f} ms")
+
+
+async def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    events = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    workdir = tempfile.mkdtemp()
+    os.environ.setdefault("TRACKS_AGENT_HOME_PATH", os.path.join(workdir, "agent"))
+    os.environ.setdefault("TRACKS_STORAGE_PATH", os.path.join(workdir, "storage"))
+
+    from tracks.services import history_service
+    from tracks.services.history_writer import history_writer
+
+    output = [{"tag": "exec_output" if i % 3 else "agent", "data": f"line {i} of the run output\n"} for i in range(events)]
+
+    async def sync_save(session_id, serialized_output):
+        await asyncio.sleep(0)
+        history_service.save_message(session_id, "user", "question")
+        await asyncio.sleep(0)
+        history_service.save_message(session_id, "assistant", "answer", serialized_output=serialized_output)
+
+    async def async_save(session_id, serialized_output):
+        history_service.asave_message(session_id, "user", "question")
+        await history_service.asave_message(session_id, "assistant", "answer", serialized_output=serialized_output)
+
+    print(f"{sessions} concurrent runs, {events} output events each")
+    await run("sync", sessions, output, sync_save)
+    await run("async", sessions, output, async_save)
+    await history_writer.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
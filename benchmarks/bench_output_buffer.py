@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Benchmark for CLI output buffering.
+
+1. Splitter: the old `bytes +=` / `split(b'\\n', 1)` loop against LineSplitter
+   on synthetic in-memory output.
+2. End to end: pipes a synthetic 100 MB output through CodexClient and
+   GeminiClient (sync and async readers) using a fake CLI binary, reporting
+   wall time and peak RSS of each run in a fresh process.
+
+Usage: python benchmarks/bench_output_buffer.py [size_mb]
+"""
+
+import os
+import sys
+import time
+import json
+import asyncio
+import resource
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+FAKE_CLI = """#!{python}
+import sys
+size = int({size})
+line = b'x' * 199 + b'\\n'
+chunk = line * 512
+written = 0
+while written < size:
+    sys.stdout.buffer.write(chunk)
+    written += len(chunk)
+sys.stdout.flush()
+sys.stderr.write('done\\n')
+sys.exit(1)
+"""
+
+
+def old_split(chunks):
+    buffer = b''
+    count = 0
+    for data in chunks:
+        buffer += data
+        while b'\n' in buffer:
+            line, buffer = buffer.split(b'\n', 1)
+            line.decode('utf-8', errors='replace')
+            count += 1
+    return count
+
+
+def new_split(chunks):
+    from tracks.clients.output_buffer import LineSplitter
+    splitter = LineSplitter()
+    count = 0
+    for data in chunks:
+        count += len(splitter.feed(data))
+    return count + len(splitter.flush())
+
+
+def bench_splitters(size):
+    print(f"== splitter ({size // (1024 * 1024)} MB) ==")
+    for label, line_length in (("short lines", 200), ("4 MB lines", 4 * 1024 * 1024)):
+        line = b'y' * (line_length - 1) + b'\n'
+        payload = line * (size // line_length)
+        chunks = [payload[i:i + 65536] for i in range(0, len(payload), 65536)]
+        for name, func in (("old", old_split), ("new", new_split)):
+            start = time.perf_counter()
+            func(chunks)
+            elapsed = time.perf_counter() - start
+            print(f"{label:<12} {name}: {elapsed:.3f}s ({len(payload) / elapsed / 1e6:.0f} MB/s)")
+
+
+def run_case(case, binary):
+    from tracks.clients.codex_client import CodexClient
+    from tracks.clients.gemini_client import GeminiClient
+
+    client_name, mode = case.split("-")
+    client_class = CodexClient if client_name == "codex" else GeminiClient
+    client = client_class(binary_path=binary)
+
+    lines = 0
+    start = time.perf_counter()
+    if mode == "sync":
+        for _ in client.exec_prompt("bench"):
+            lines += 1
+    else:
+        async def consume():
+            count = 0
+            async for _ in client.aexec_prompt("bench"):
+                count += 1
+            return count
+        lines = asyncio.run(consume())
+    elapsed = time.perf_counter() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({"case": case, "lines": lines, "seconds": elapsed, "peak_rss_mb": peak_mb}))
+
+
+def bench_clients(size):
+    print(f"== clients ({size // (1024 * 1024)} MB through a fake CLI) ==")
+    with tempfile.TemporaryDirectory() as workdir:
+        binary = os.path.join(workdir, "fake-cli")
+        with open(binary, "w") as f:
+            f.write(FAKE_CLI.format(python=sys.executable, size=size))
+        os.chmod(binary, 0o755)
+
+        env = os.environ.copy()
+        env["PYTHONPATH"] = ROOT
+        env["TRACKS_AGENT_HOME_PATH"] = os.path.join(workdir, "agent")
+        env["TRACKS_STORAGE_PATH"] = os.path.join(workdir, "storage")
+        env["TRACKS_VAULT_PATH"] = os.path.join(workdir, "vault.json")
+        env["TRACKS_API_KEY"] = "bench"
+        os.makedirs(env["TRACKS_AGENT_HOME_PATH"])
+
+        for case in ("codex-sync", "codex-async", "gemini-sync", "gemini-async"):
+            # Keep Gemini's home and session files away from the real ones
+            env["HOME"] = os.path.join(workdir, "home-" + case)
+            os.makedirs(env["HOME"])
+            result = subprocess.run(
+                [sys.executable, __file__, "--case", case, binary],
+                env=env,
+                capture_output=True,
+                text=True
+            )
+            lines = [l for l in result.stdout.splitlines() if l.startswith("{")]
+            if not lines:
+                print(f"{case}: failed\n{result.stderr[-2000:]}")
+                continue
+            stats = json.loads(lines[-1])
+            print(f"{case:<13} {stats['lines']} lines in {stats['seconds']:.2f}s, peak RSS {stats['peak_rss_mb']:.0f} MB")
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--case":
+        run_case(sys.argv[2], sys.argv[3])
+        return
+
+    size = int(sys.argv[1]) * 1024 * 1024 if len(sys.argv) > 1 else 100 * 1024 * 1024
+    bench_splitters(min(size, 16 * 1024 * 1024))
+    bench_clients(size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark for watching one chat run from many clients.
+
+A run publishes N output events in bursts, like an agent printing command
+output, to V attached clients. One client in ten is stalled (a background
+tab, a slow link) and reads a burst only every 50 ms. Reports the time until
+every client has the whole run and the events each stalled client received,
+two ways: the previous attach, which woke every client on each event to
+rescan the run's log, and the broadcast hub with per-client queues.
+
+Usage: python benchmarks/bench_run_fanout.py [events]
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+VIEWERS = (1, 10, 50)
+BURST = 200
+
+
+async def previous_attach(run, changed, after=0):
+    """The log scan attach, woken through the `changed` event list on every append."""
+    while True:
+        waiter = changed[0]
+        for seq, event, data in list(run.events):
+            if seq <= after:
+                continue
+            yield {"event": event, "id": str(seq), "data": data}
+            after = seq
+        if run.status != "running" and after >= run.last_seq:
+            return
+        await waiter.wait()
+
+
+async def measure(events, viewers, previous):
+    from tracks.services.run_manager import Run, RUN_DONE
+
+    run = Run("benchmark", None)
+    changed = [asyncio.Event()]
+    if previous:
+        append = run.append
+
+        def append_and_wake(event, data):
+            append(event, data)
+            changed[0].set()
+            changed[0] = asyncio.Event()
+        run.append = append_and_wake
+
+    async def viewer(stalled):
+        received = 0
+        stream = previous_attach(run, changed) if previous else run.attach()
+        async for _ in stream:
+            received += 1
+            if stalled and received % BURST == 0:
+                await asyncio.sleep(0.05)
+        return received
+
+    tasks = [asyncio.create_task(viewer(i % 10 == 9)) for i in range(viewers)]
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    for i in range(events):
+        run.append("output", {"tag": "exec_output", "data": f"tests/test_module.py::test_{i} PASSED\n"})
+        if i % BURST == BURST - 1:
+            await asyncio.sleep(0.001)
+    run.finish(RUN_DONE)
+    received = await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    stalled = [count for i, count in enumerate(received) if i % 10 == 9]
+    return elapsed * 1e3, stalled
+
+
+def main():
+    events = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    workdir = tempfile.mkdtemp()
+    os.environ.setdefault("TRACKS_AGENT_HOME_PATH", os.path.join(workdir, "agent"))
+    os.environ.setdefault("TRACKS_STORAGE_PATH", os.path.join(workdir, "storage"))
+
+    from tracks.config import settings
+    settings.RUN_EVENT_LOG_SIZE = events + 10
+
+    print(f"{events} events, queue of {settings.RUN_SUBSCRIBER_QUEUE_SIZE} per client")
+    for viewers in VIEWERS:
+        previous_ms, _ = asyncio.run(measure(events, viewers, True))
+        hub_ms, stalled = asyncio.run(measure(events, viewers, False))
+        stalled_events = f"{min(stalled)}-{max(stalled)}" if stalled else "-"
+        print(f"{viewers:3d} clients  previous {previous_ms:8.1f} ms  hub {hub_ms:7.1f} ms  "
+              f"{previous_ms / hub_ms:5.1f}x  events to a stalled client {stalled_events}")
+
+
+if __name__ == "__main__":
+    main()
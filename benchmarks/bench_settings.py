@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for settings access on the request path.
+
+Compares the old behaviour (re-reading and validating config.json on every
+attribute access) with the cached SettingsProxy, using the same attribute
+reads verify_api_key performs per request.
+
+Usage: python benchmarks/bench_settings.py [iterations]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tracks.config import get_settings, settings
+
+
+class ReparsingProxy:
+    """The previous SettingsProxy: reload config.json on every access."""
+    def __getattr__(self, name):
+        return getattr(get_settings(), name)
+
+
+def simulate_request(proxy):
+    # verify_api_key reads API_KEY twice per request
+    if proxy.API_KEY:
+        return proxy.API_KEY
+
+
+def bench(label, proxy, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        simulate_request(proxy)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<12} {iterations} requests in {elapsed:.3f}s ({elapsed / iterations * 1e6:.1f} us/request)")
+    return elapsed
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    before = bench("reparsing", ReparsingProxy(), iterations)
+    after = bench("cached", settings, iterations)
+    print(f"speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Build the Codex parser corpus from recorded chat history.
+
+Every assistant message in `history/**/*.user.jsonl` keeps the events the
+parser produced (`serialized_output`). This script renders those events back
+into the raw (stream, line) transcript the Codex CLI printed, and writes one
+corpus file per conversation to benchmarks/corpus/codex/.
+
+Corpus files are JSONL, one `[stream, line]` pair per line, where stream is
+0 for stdout and 1 for stderr (the tags exec_prompt yields).
+
+Usage: python benchmarks/codex_corpus.py [history_dir]
+"""
+
+import os
+import sys
+import json
+import glob
+from typing import Any, Dict, Iterator, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPUS_DIR = os.path.join(ROOT, "benchmarks", "corpus", "codex")
+
+STDOUT = 0
+STDERR = 1
+
+# Section titles emitted by the parser -> header line the CLI printed
+TITLE_HEADERS = {
+    "User": "user",
+    "Thinking": "thinking",
+    "Run": "exec",
+    "Agent": "codex",
+    "File Update": "file update:",
+    "Error": "non zero exit code",
+}
+
+
+def render_transcript(serialized_output: List[Dict[str, Any]]) -> Iterator[Tuple[int, str]]:
+    """Turn stored parser events back into raw (stream, line) output."""
+    pending_exec = None
+    for event in serialized_output:
+        tag, data = event.get("tag"), event.get("data", "")
+
+        if pending_exec is not None and tag != "exec_time":
+            # Command without a timing line, keep it as plain exec output
+            yield (STDERR, pending_exec)
+            pending_exec = None
+
+        if tag == "meta":
+            yield (STDERR, "--------\n")
+            for key, value in json.loads(data).items():
+                yield (STDERR, f"{key.replace('_', ' ')}: {value}\n")
+            yield (STDERR, "--------\n")
+        elif tag == "title":
+            header = TITLE_HEADERS.get(data)
+            if header:
+                yield (STDERR, header + "\n")
+        elif tag == "stdout":
+            yield (STDOUT, data)
+        elif tag == "exec":
+            pending_exec = data
+        elif tag == "exec_time":
+            command = (pending_exec or "\n")[:-1]
+            yield (STDERR, f"{command} succeeded in {data}:\n")
+            pending_exec = None
+        elif tag == "tokens_used":
+            yield (STDERR, "tokens used\n")
+            yield (STDERR, f"{int(data):,}\n")
+        elif tag in ("user", "thinking", "agent", "file_update", "exec_output", "error"):
+            yield (STDERR, data)
+
+    if pending_exec is not None:
+        yield (STDERR, pending_exec)
+
+
+def load_corpus(corpus_dir: str = CORPUS_DIR) -> List[Tuple[int, str]]:
+    """Read every corpus file into a single list of (stream, line) pairs."""
+    lines = []
+    for path in sorted(glob.glob(os.path.join(corpus_dir, "*.jsonl"))):
+        with open(path, "r", encoding="utf-8") as f:
+            for raw in f:
+                stream, line = json.loads(raw)
+                lines.append((stream, line))
+    return lines
+
+
+def main():
+    sys.path.insert(0, ROOT)
+    if len(sys.argv) > 1:
+        history_dir = sys.argv[1]
+    else:
+        from tracks.config import settings
+        history_dir = os.path.join(settings.AGENT_HOME_PATH, "history")
+
+    os.makedirs(CORPUS_DIR, exist_ok=True)
+    written = 0
+    for path in sorted(glob.glob(os.path.join(history_dir, "**", "*.user.jsonl"), recursive=True)):
+        transcript = []
+        with open(path, "r", encoding="utf-8") as f:
+            for raw in f:
+                try:
+                    message = json.loads(raw)
+                except json.JSONDecodeError:
+                    continue
+                if message.get("role") == "assistant" and message.get("serialized_output"):
+                    transcript.extend(render_transcript(message["serialized_output"]))
+        if not transcript:
+            continue
+
+        name = os.path.basename(path)[:-len(".user.jsonl")] + ".jsonl"
+        with open(os.path.join(CORPUS_DIR, name), "w", encoding="utf-8") as f:
+            for stream, line in transcript:
+                f.write(json.dumps([stream, line], ensure_ascii=False) + "\n")
+        written += 1
+
+    print(f"Wrote {written} transcripts to {CORPUS_DIR}")
+
+
+if __name__ == "__main__":
+    main()
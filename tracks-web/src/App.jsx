@@ -11,6 +11,12 @@ import { getApiKey, getAuthHeaders, clearApiKey, validateApiKey } from './auth'
 
 import './App.css'
 
+// Messages fetched at a time when opening a conversation or scrolling back
+const TAIL_MESSAGES = 50
+
+// Delay before following a conversation again after the stream drops
+const FOLLOW_RETRY_MS = 3000
+
 function ChatPage({ onLogout, showSettings, showBrowser, showConnections }) {
 
   const navigate = useNavigate()
@@ -20,32 +26,36 @@ function ChatPage({ onLogout, showSettings, showBrowser, showConnections }) {
   const [sidebarOpen, setSidebarOpen] = useState(false)
   const [sessionId, setSessionId] = useState(urlSessionId === 'new' ? null : urlSessionId)
   const [messages, setMessages] = useState([])
+  // Where earlier messages of a long conversation can be fetched from, null when all are loaded
+  const [earlierMessages, setEarlierMessages] = useState(null)
+  // Telegram conversation or heartbeat run followed for new messages, null when none is
+  const [followedLog, setFollowedLog] = useState(null)
   const [isScrolled, setIsScrolled] = useState(false)
   const [utcOffset, setUtcOffset] = useState(null)
 
   // History state
   const [conversations, setConversations] = useState([])
   const [hasMoreHistory, setHasMoreHistory] = useState(false)
-  const [historyOffset, setHistoryOffset] = useState(0)
+  const [historyCursor, setHistoryCursor] = useState(null)
   const [isLoadingHistory, setIsLoadingHistory] = useState(false)
 
   // Heartbeat sessions state
   const [heartbeatSessions, setHeartbeatSessions] = useState([])
   const [hasMoreHeartbeat, setHasMoreHeartbeat] = useState(false)
-  const [heartbeatOffset, setHeartbeatOffset] = useState(0)
+  const [heartbeatCursor, setHeartbeatCursor] = useState(null)
   const [isLoadingHeartbeat, setIsLoadingHeartbeat] = useState(false)
 
   // Telegram sessions state
   const [telegramSessions, setTelegramSessions] = useState([])
   const [hasMoreTelegram, setHasMoreTelegram] = useState(false)
-  const [telegramOffset, setTelegramOffset] = useState(0)
+  const [telegramCursor, setTelegramCursor] = useState(null)
   const [isLoadingTelegram, setIsLoadingTelegram] = useState(false)
 
   // Load initial history on mount
   useEffect(() => {
-    loadHistory(0)
-    loadHeartbeatHistory(0)
-    loadTelegramHistory(0)
+    loadHistory(null)
+    loadHeartbeatHistory(null)
+    loadTelegramHistory(null)
     fetchConfig()
 
     const handleWindowScroll = () => {
@@ -72,6 +82,97 @@ function ChatPage({ onLogout, showSettings, showBrowser, showConnections }) {
     }
   }
 
+  // Convert a message summary of the history API, outputs are fetched as they scroll into view
+  const historyMessage = (baseUrl, msg) => ({
+    role: msg.role,
+    content: msg.content,
+    timestamp: msg.timestamp,
+    outputUrl: msg.has_output ? `${baseUrl}/messages/${msg.index}/output` : null
+  })
+
+  const setEarlierFrom = (baseUrl, loaded) => {
+    const first = loaded.length > 0 ? loaded[0].index : 0
+    setEarlierMessages(first > 0 ? { baseUrl, before: first } : null)
+  }
+
+  const loadEarlierMessages = async () => {
+    if (!earlierMessages) return
+    const { baseUrl, before } = earlierMessages
+    try {
+      const response = await fetch(`${baseUrl}?tail=${TAIL_MESSAGES}&before=${before}`, {
+        headers: { ...getAuthHeaders() }
+      })
+      if (response.ok) {
+        const data = await response.json()
+        setMessages(prev => [...data.messages.map(msg => historyMessage(baseUrl, msg)), ...prev])
+        setEarlierFrom(baseUrl, data.messages)
+      }
+    } catch (error) {
+      console.error('Error loading earlier messages:', error)
+    }
+  }
+
+  // Append messages of the followed conversation as the server writes them
+  useEffect(() => {
+    if (!followedLog) return
+    const { baseUrl } = followedLog
+    const controller = new AbortController()
+    let lastEventId = null
+
+    const follow = async () => {
+      while (!controller.signal.aborted) {
+        try {
+          // A reconnect resumes after the last message received
+          const headers = { ...getAuthHeaders() }
+          if (lastEventId) headers['Last-Event-ID'] = lastEventId
+          const response = await fetch(`${baseUrl}/follow?start=${followedLog.start}`, {
+            headers,
+            signal: controller.signal
+          })
+          if (!response.ok) return
+
+          const reader = response.body.getReader()
+          const decoder = new TextDecoder()
+          let buffer = ''
+          let event = {}
+          while (true) {
+            const { done, value } = await reader.read()
+            if (done) break
+            buffer += decoder.decode(value, { stream: true })
+            const lines = buffer.split('\n')
+            buffer = lines.pop()
+            for (const rawLine of lines) {
+              const line = rawLine.replace(/\r$/, '')
+              if (line === '') {
+                if (event.type === 'message' && event.data) {
+                  const msg = JSON.parse(event.data)
+                  setMessages(prev => [...prev, historyMessage(baseUrl, msg)])
+                  lastEventId = event.id
+                } else if (event.type === 'reset') {
+                  return
+                }
+                event = {}
+              } else if (line.startsWith('event:')) {
+                event.type = line.slice(6).trim()
+              } else if (line.startsWith('id:')) {
+                event.id = line.slice(3).trim()
+              } else if (line.startsWith('data:')) {
+                event.data = line.slice(5).trim()
+              }
+            }
+          }
+        } catch (error) {
+          if (error.name === 'AbortError') return
+          console.error('Error following conversation:', error)
+        }
+        await new Promise(resolve => setTimeout(resolve, FOLLOW_RETRY_MS))
+      }
+    }
+
+    follow()
+    return () => controller.abort()
+  }, [followedLog])
+
   // Track if we should skip the next URL-based load (e.g., during active streaming)
   const skipNextLoadRef = useRef(false)
 
@@ -86,14 +187,16 @@ function ChatPage({ onLogout, showSettings, showBrowser, showConnections }) {
 
       if (urlSessionId && urlSessionId !== 'new') {
         try {
-          // Try regular history first
-          let response = await fetch(`/api/history/${urlSessionId}`, {
+          // Try regular history first, newest messages only
+          let baseUrl = `/api/history/${urlSessionId}`
+          let response = await fetch(`${baseUrl}?tail=${TAIL_MESSAGES}`, {
             headers: { ...getAuthHeaders() }
           })
 
           // If not found, try heartbeat history
           if (!response.ok) {
-            response = await fetch(`/api/heartbeat/history/${urlSessionId}`, {
+            baseUrl = `/api/heartbeat/history/${urlSessionId}`
+            response = await fetch(`${baseUrl}?tail=${TAIL_MESSAGES}`, {
               headers: { ...getAuthHeaders() }
             })
           }
@@ -102,17 +205,23 @@ function ChatPage({ onLogout, showSettings, showBrowser, showConnections }) {
             const data = await response.json()
 
             // Set messages from history
-            setMessages(data.messages.map(msg => ({
-              role: msg.role,
-              content: msg.content,
-              serialized_output: msg.serialized_output,
-              timestamp: msg.timestamp
-            })))
+            setMessages(data.messages.map(msg => historyMessage(baseUrl, msg)))
+            setEarlierFrom(baseUrl, data.messages)
+
+            // Telegram conversations and heartbeat runs are written by the server, follow them
+            const isHeartbeat = baseUrl.startsWith('/api/heartbeat/')
+            if (isHeartbeat || urlSessionId.startsWith('telegram-')) {
+              const last = data.messages[data.messages.length - 1]
+              setFollowedLog({ baseUrl, start: last ? last.index + 1 : 0 })
+            } else {
+              setFollowedLog(null)
+            }
 
             // Set session ID
             setSessionId(urlSessionId)
           } else {
             console.error('Session not found:', urlSessionId)
+            setFollowedLog(null)
           }
         } catch (error) {
           console.error('Error loading conversation:', error)
@@ -121,6 +230,8 @@ function ChatPage({ onLogout, showSettings, showBrowser, showConnections }) {
         // New chat or root path
         setSessionId(null)
         setMessages([])
+        setEarlierMessages(null)
+        setFollowedLog(null)
       }
     }
 
@@ -128,24 +239,24 @@ function ChatPage({ onLogout, showSettings, showBrowser, showConnections }) {
   }, [urlSessionId])
 
   // Load history from API
-  const loadHistory = async (offset) => {
+  const loadHistory = async (cursor) => {
     if (isLoadingHistory) return
 
     setIsLoadingHistory(true)
     try {
-      const response = await fetch(`/api/history?limit=30&offset=${offset}`, {
+      const response = await fetch(`/api/history?limit=30${cursor ? `&cursor=${encodeURIComponent(cursor)}` : ''}`, {
         headers: { ...getAuthHeaders() }
       })
       const data = await response.json()
 
-      if (offset === 0) {
+      if (!cursor) {
         setConversations(data.conversations)
       } else {
         setConversations(prev => [...prev, ...data.conversations])
       }
 
       setHasMoreHistory(data.has_more)
-      setHistoryOffset(offset + data.conversations.length)
+      setHistoryCursor(data.next_cursor || null)
     } catch (error) {
       console.error('Error loading history:', error)
     } finally {
@@ -154,28 +265,28 @@ function ChatPage({ onLogout, showSettings, showBrowser, showConnections }) {
   }
 
   const handleLoadMore = () => {
-    loadHistory(historyOffset)
+    loadHistory(historyCursor)
   }
 
   // Load heartbeat history from API
-  const loadHeartbeatHistory = async (offset) => {
+  const loadHeartbeatHistory = async (cursor) => {
     if (isLoadingHeartbeat) return
 
     setIsLoadingHeartbeat(true)
     try {
-      const response = await fetch(`/api/heartbeat/history?limit=30&offset=${offset}`, {
+      const response = await fetch(`/api/heartbeat/history?limit=30${cursor ? `&cursor=${encodeURIComponent(cursor)}` : ''}`, {
         headers: { ...getAuthHeaders() }
       })
       const data = await response.json()
 
-      if (offset === 0) {
+      if (!cursor) {
         setHeartbeatSessions(data.conversations || [])
       } else {
         setHeartbeatSessions(prev => [...prev, ...(data.conversations || [])])
       }
 
       setHasMoreHeartbeat(data.has_more || false)
-      setHeartbeatOffset(offset + (data.conversations?.length || 0))
+      setHeartbeatCursor(data.next_cursor || null)
     } catch (error) {
       console.error('Error loading heartbeat history:', error)
     } finally {
@@ -184,28 +295,28 @@ function ChatPage({ onLogout, showSettings, showBrowser, showConnections }) {
   }
 
   const handleLoadMoreHeartbeat = () => {
-    loadHeartbeatHistory(heartbeatOffset)
+    loadHeartbeatHistory(heartbeatCursor)
   }
 
   // Load telegram history from API
-  const loadTelegramHistory = async (offset) => {
+  const loadTelegramHistory = async (cursor) => {
     if (isLoadingTelegram) return
 
     setIsLoadingTelegram(true)
     try {
-      const response = await fetch(`/api/telegram/history?limit=30&offset=${offset}`, {
+      const response = await fetch(`/api/telegram/history?limit=30${cursor ? `&cursor=${encodeURIComponent(cursor)}` : ''}`, {
         headers: { ...getAuthHeaders() }
       })
       const data = await response.json()
 
-      if (offset === 0) {
+      if (!cursor) {
         setTelegramSessions(data.conversations || [])
       } else {
         setTelegramSessions(prev => [...prev, ...(data.conversations || [])])
       }
 
       setHasMoreTelegram(data.has_more || false)
-      setTelegramOffset(offset + (data.conversations?.length || 0))
+      setTelegramCursor(data.next_cursor || null)
     } catch (error) {
       console.error('Error loading telegram history:', error)
     } finally {
@@ -214,7 +325,7 @@ function ChatPage({ onLogout, showSettings, showBrowser, showConnections }) {
   }
 
   const handleLoadMoreTelegram = () => {
-    loadTelegramHistory(telegramOffset)
+    loadTelegramHistory(telegramCursor)
   }
 
   const handleLoadHeartbeatSession = async (loadSessionId) => {
@@ -293,7 +404,7 @@ function ChatPage({ onLogout, showSettings, showBrowser, showConnections }) {
     // Update URL to new session
     navigate(`/sessions/${newSessionId}`)
     // Reload history to show new conversation
-    loadHistory(0)
+    loadHistory(null)
   }
 
   return (
@@ -348,6 +459,7 @@ function ChatPage({ onLogout, showSettings, showBrowser, showConnections }) {
           <ChatArea
 
             messages={messages}
+            onLoadEarlier={earlierMessages ? loadEarlierMessages : null}
             sessionId={sessionId}
             onSendMessage={handleSendMessage}
             onStreamMessage={handleStreamMessage}
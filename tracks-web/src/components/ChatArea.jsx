@@ -3,7 +3,7 @@ import Message from './Message'
 import ChatInput from './ChatInput'
 import './ChatArea.css'
 
-function ChatArea({ messages, sessionId, onSendMessage, onStreamMessage, onSessionUpdate, utcOffset }) {
+function ChatArea({ messages, onLoadEarlier, sessionId, onSendMessage, onStreamMessage, onSessionUpdate, utcOffset }) {
     const messagesEndRef = useRef(null)
     const [isResponseLoading, setIsResponseLoading] = useState(false)
 
@@ -11,9 +11,11 @@ function ChatArea({ messages, sessionId, onSendMessage, onStreamMessage, onSessi
         messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' })
     }
 
+    // Only new messages at the end scroll, not earlier ones loaded above
+    const lastMessage = messages[messages.length - 1]
     useEffect(() => {
         scrollToBottom()
-    }, [messages, isResponseLoading])
+    }, [lastMessage, isResponseLoading])
 
     return (
         <div className="chat-area">
@@ -24,12 +26,18 @@ function ChatArea({ messages, sessionId, onSendMessage, onStreamMessage, onSessi
                     </div>
                 ) : (
                     <>
+                        {onLoadEarlier && (
+                            <button className="load-earlier-button" onClick={onLoadEarlier}>
+                                Load earlier messages
+                            </button>
+                        )}
                         {messages.map((message, index) => (
                             <Message
                                 key={index}
                                 role={message.role}
                                 content={message.content}
                                 serialized_output={message.serialized_output}
+                                outputUrl={message.outputUrl}
                                 timestamp={message.timestamp}
                                 utcOffset={utcOffset}
                             />
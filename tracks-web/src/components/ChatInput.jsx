@@ -2,11 +2,45 @@ import { useState, useRef, useEffect } from 'react'
 import { getAuthHeaders } from '../auth'
 import './ChatInput.css'
 
+// Delay before reattaching to a run after the connection dropped
+const RUN_RETRY_MS = 2000
+const RUN_FINAL_EVENTS = ['done', 'cancelled', 'failed']
+
+// Read server-sent events from a fetch response, calling onEvent({ type, id, data }) for each
+async function readEvents(response, onEvent) {
+    const reader = response.body.getReader()
+    const decoder = new TextDecoder()
+    let buffer = ''
+    let event = {}
+    while (true) {
+        const { done, value } = await reader.read()
+        if (done) break
+        buffer += decoder.decode(value, { stream: true })
+        const lines = buffer.split('\n')
+        buffer = lines.pop()
+        for (const rawLine of lines) {
+            const line = rawLine.replace(/\r$/, '')
+            if (line === '') {
+                if (event.type) onEvent(event)
+                event = {}
+            } else if (line.startsWith('event:')) {
+                event.type = line.slice(6).trim()
+            } else if (line.startsWith('id:')) {
+                event.id = line.slice(3).trim()
+            } else if (line.startsWith('data:')) {
+                event.data = line.slice(5).trim()
+            }
+        }
+    }
+}
+
 function ChatInput({ sessionId, onSendMessage, onStreamMessage, onSessionUpdate, onLoadingChange }) {
     const [input, setInput] = useState('')
     const [isLoading, setIsLoading] = useState(false)
     const textareaRef = useRef(null)
     const abortControllerRef = useRef(null)
+    // Run being streamed: { runId, lastEventId, detached }
+    const runRef = useRef(null)
 
     const adjustTextareaHeight = () => {
         const textarea = textareaRef.current
@@ -20,103 +54,178 @@ function ChatInput({ sessionId, onSendMessage, onStreamMessage, onSessionUpdate,
         adjustTextareaHeight()
     }, [input])
 
-    const handleStop = () => {
+    const handleStop = async () => {
+        const run = runRef.current
+        if (run && run.runId) {
+            // The run ends with a "cancelled" event once its agent has stopped
+            try {
+                await fetch(`/api/runs/${run.runId}/cancel`, {
+                    method: 'POST',
+                    headers: { ...getAuthHeaders() }
+                })
+                return
+            } catch (error) {
+                console.error('Error cancelling run:', error)
+            }
+        }
         if (abortControllerRef.current) {
             abortControllerRef.current.abort()
             abortControllerRef.current = null
         }
     }
 
+    // Handle one event of a run, returns true for its final event
+    const handleRunEvent = (event) => {
+        const run = runRef.current
+        if (event.id) run.lastEventId = event.id
+        if (event.type === 'reset') {
+            // Output between the last event received and now is no longer kept by the server
+            onStreamMessage('\n\n[Output skipped, reload the conversation to see all of it]\n\n', 'error')
+            return false
+        }
+
+        let parsed
+        try {
+            parsed = JSON.parse(event.data)
+        } catch (e) {
+            console.error('Error parsing SSE data:', e, 'Data:', event.data)
+            return false
+        }
+
+        if (event.type === 'run') {
+            run.runId = parsed.run_id
+        } else if (event.type === 'session') {
+            if (parsed.session_id !== sessionId) onSessionUpdate(parsed.session_id)
+        } else if (event.type === 'output') {
+            // Check for error messages in 'user' tag
+            if (parsed.tag === 'user' && parsed.data.startsWith('ERROR:')) {
+                // Send error as a special error tag
+                onStreamMessage(parsed.data, 'error')
+            } else {
+                onStreamMessage(parsed.data, parsed.tag)
+            }
+        } else if (event.type === 'cancelled') {
+            onStreamMessage('\n\n[Stopped by user]', 'agent')
+        }
+        return RUN_FINAL_EVENTS.includes(event.type)
+    }
+
+    // Stream a run until its final event, reattaching if the connection drops
+    const streamRun = async (firstRequest) => {
+        const run = runRef.current
+        setIsLoading(true)
+        if (onLoadingChange) onLoadingChange(true)
+        let request = firstRequest
+        let finished = false
+
+        try {
+            while (!finished) {
+                abortControllerRef.current = new AbortController()
+                try {
+                    const response = await request(abortControllerRef.current.signal)
+                    if (!response.ok) {
+                        console.error('Run request failed:', response.status)
+                        break
+                    }
+                    await readEvents(response, (event) => {
+                        if (handleRunEvent(event)) finished = true
+                    })
+                } catch (error) {
+                    if (error.name === 'AbortError') {
+                        if (!run.detached) {
+                            console.log('Stream aborted by user')
+                            onStreamMessage('\n\n[Stopped by user]', 'agent')
+                        }
+                        break
+                    }
+                    console.error('Error streaming run:', error)
+                }
+                if (finished || !run.runId) break
+
+                // The run goes on without us, resume after the last event received
+                await new Promise(resolve => setTimeout(resolve, RUN_RETRY_MS))
+                const { runId, lastEventId } = run
+                request = (signal) => fetch(`/api/runs/${runId}/events`, {
+                    headers: {
+                        ...getAuthHeaders(),
+                        ...(lastEventId ? { 'Last-Event-ID': lastEventId } : {})
+                    },
+                    signal
+                })
+            }
+        } finally {
+            // Unless another run was attached meanwhile
+            if (runRef.current === run) {
+                abortControllerRef.current = null
+                runRef.current = null
+                setIsLoading(false)
+                if (onLoadingChange) onLoadingChange(false)
+            }
+        }
+    }
+
     const handleSubmit = async (e) => {
         e.preventDefault()
         if (!input.trim() || isLoading) return
 
         const message = input.trim()
         setInput('')
-        setIsLoading(true)
-        if (onLoadingChange) onLoadingChange(true)
 
         // Send user message to parent
         onSendMessage(message)
 
-        try {
-            abortControllerRef.current = new AbortController()
-
-            // Make API request with SSE
-            const response = await fetch('/api/chat', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                    ...getAuthHeaders()
-                },
-                body: JSON.stringify({
-                    message,
-                    session_id: sessionId
-                }),
-                signal: abortControllerRef.current.signal
-            })
-
-            const reader = response.body.getReader()
-            const decoder = new TextDecoder()
-
-            let currentEvent = ''
-            let hasStartedStreaming = false
-
-            while (true) {
-                const { done, value } = await reader.read()
-                if (done) break
-
-                if (!hasStartedStreaming) {
-                    hasStartedStreaming = true
-                    // Keep loading indicator during streaming
-                    // It will be turned off in the finally block
-                }
+        runRef.current = { runId: null, lastEventId: null, detached: false }
+        await streamRun((signal) => fetch('/api/chat', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                ...getAuthHeaders()
+            },
+            body: JSON.stringify({
+                message,
+                session_id: sessionId
+            }),
+            signal
+        }))
+    }
 
-                const chunk = decoder.decode(value)
-                const lines = chunk.split('\n')
-
-                for (const line of lines) {
-                    if (line.startsWith('event: ')) {
-                        currentEvent = line.slice(7).trim()
-                    } else if (line.startsWith('data: ')) {
-                        const data = line.slice(6)
-                        if (data === '[DONE]') continue
-
-                        try {
-                            const parsed = JSON.parse(data)
-
-                            if (currentEvent === 'session') {
-                                onSessionUpdate(parsed.session_id)
-                            } else if (currentEvent === 'message') {
-                                onStreamMessage(parsed.content)
-                            } else if (currentEvent === 'output') {
-                                // Check for error messages in 'user' tag
-                                if (parsed.tag === 'user' && parsed.data.startsWith('ERROR:')) {
-                                    // Send error as a special error tag
-                                    onStreamMessage(parsed.data, 'error')
-                                } else {
-                                    onStreamMessage(parsed.data, parsed.tag)
-                                }
-                            }
-                        } catch (e) {
-                            console.error('Error parsing SSE data:', e, 'Data:', data)
-                        }
-                    }
-                }
+    // Reattach to a run of this conversation still in progress, e.g. after a page refresh
+    useEffect(() => {
+        if (!sessionId || runRef.current) return
+        let cancelled = false
+        let attached = null
+
+        const reattach = async () => {
+            try {
+                const response = await fetch(`/api/runs?session_id=${encodeURIComponent(sessionId)}&active=true`, {
+                    headers: { ...getAuthHeaders() }
+                })
+                if (!response.ok) return
+                const data = await response.json()
+                const run = data.runs[data.runs.length - 1]
+                if (cancelled || !run || runRef.current) return
+
+                attached = { runId: run.run_id, lastEventId: null, detached: false }
+                runRef.current = attached
+                await streamRun((signal) => fetch(`/api/runs/${run.run_id}/events`, {
+                    headers: { ...getAuthHeaders() },
+                    signal
+                }))
+            } catch (error) {
+                console.error('Error checking for runs in progress:', error)
             }
-        } catch (error) {
-            if (error.name === 'AbortError') {
-                console.log('Stream aborted by user')
-                onStreamMessage('\n\n[Stopped by user]', 'agent')
-            } else {
-                console.error('Error sending message:', error)
+        }
+
+        reattach()
+        return () => {
+            cancelled = true
+            // Leaving the conversation only stops watching its run
+            if (attached && runRef.current === attached && abortControllerRef.current) {
+                attached.detached = true
+                abortControllerRef.current.abort()
             }
-        } finally {
-            abortControllerRef.current = null
-            setIsLoading(false)
-            if (onLoadingChange) onLoadingChange(false)
         }
-    }
+    }, [sessionId])
 
     const handleKeyDown = (e) => {
         if (e.key === 'Enter' && !e.shiftKey) {
@@ -1,8 +1,9 @@
-import { useState } from 'react'
+import { useState, useEffect, useRef } from 'react'
 import ReactMarkdown from 'react-markdown'
 import remarkGfm from 'remark-gfm'
 import { parseDiff, Diff, Hunk } from 'react-diff-view'
 import 'react-diff-view/style/index.css'
+import { getAuthHeaders } from '../auth'
 import './Message.css'
 
 function ThinkingBlock({ content }) {
@@ -259,7 +260,50 @@ function formatLocalTime(isoString, utcOffset = 9) {
     }
 }
 
-function Message({ role, content, serialized_output, timestamp, utcOffset }) {
+// Fetch a history message's serialized_output once it comes near the viewport
+function useLazyOutput(outputUrl, serialized_output) {
+    const ref = useRef(null)
+    const [loaded, setLoaded] = useState(null)
+
+    useEffect(() => {
+        if (!outputUrl || serialized_output || !ref.current) return
+        let cancelled = false
+
+        const load = async () => {
+            try {
+                const response = await fetch(outputUrl, {
+                    headers: { ...getAuthHeaders() }
+                })
+                if (response.ok) {
+                    const data = await response.json()
+                    if (!cancelled) setLoaded({ url: outputUrl, output: data.serialized_output || [] })
+                }
+            } catch (error) {
+                console.error('Error loading message output:', error)
+            }
+        }
+
+        const observer = new IntersectionObserver(entries => {
+            if (entries.some(entry => entry.isIntersecting)) {
+                observer.disconnect()
+                load()
+            }
+        }, { rootMargin: '1000px' })
+        observer.observe(ref.current)
+
+        return () => {
+            cancelled = true
+            observer.disconnect()
+        }
+    }, [outputUrl, serialized_output])
+
+    // Messages are keyed by position, which shifts when earlier ones are loaded
+    return [ref, serialized_output || (loaded && loaded.url === outputUrl ? loaded.output : null)]
+}
+
+function Message({ role, content, serialized_output, outputUrl, timestamp, utcOffset }) {
+    const [messageRef, output] = useLazyOutput(outputUrl, serialized_output)
+
     const components = {
         // Custom rendering for code blocks
         code({ node, inline, className, children, ...props }) {
@@ -293,12 +337,12 @@ function Message({ role, content, serialized_output, timestamp, utcOffset }) {
     }
 
     const renderContent = () => {
-        if (role === 'assistant' && serialized_output && serialized_output.length > 0) {
+        if (role === 'assistant' && output && output.length > 0) {
             // Pass 1: Group consecutive items by tag
             const rawGroups = []
             let currentGroup = null
 
-            serialized_output.forEach(item => {
+            output.forEach(item => {
                 // Skip non-display tags
                 if (['meta', 'user', 'title', 'tokens_used', 'done', 'session'].includes(item.tag)) return
 
@@ -398,7 +442,7 @@ function Message({ role, content, serialized_output, timestamp, utcOffset }) {
     }
 
     return (
-        <div className={`message ${role}`}>
+        <div className={`message ${role}`} ref={messageRef}>
             <div className="message-wrapper">
                 <div className="message-content">
                     {renderContent()}
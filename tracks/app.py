@@ -11,10 +11,15 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
 from .config import settings
+from .http_cache import CompressionMiddleware
 from .controllers import routers
 from .services.heartbeat_service import heartbeat_state
 from .services.heartbeat_runner import trigger_heartbeat_task
 from .services.cron_service import cron_service
+from .clients.agent_session import agent_session_pool
+from .services.history_writer import history_writer
+from .services.run_manager import run_manager
+from .services import history_archive
 
 
 @asynccontextmanager
@@ -24,6 +29,9 @@ async def lifespan(app: FastAPI):
     
     heartbeat_state.set_trigger_callback(trigger_heartbeat_task)
     
+    # Watch config.json so settings subscribers receive changes while idle
+    settings_watch_task = asyncio.create_task(settings.watch())
+    
     print(f"[app] Heartbeat system initialized")
 
     # Copy standard-skills to agent home path upon startup
@@ -68,12 +76,20 @@ async def lifespan(app: FastAPI):
     # Start Cron service
     cron_service.start()
     
+    # Archive and expire old history logs per the retention settings
+    history_maintenance_task = asyncio.create_task(history_archive.run_periodically())
+    
     yield
     
     # Shutdown: cleanup
     telegram_service.is_running = False
     initial_task.cancel()
+    settings_watch_task.cancel()
+    history_maintenance_task.cancel()
     cron_service.stop()
+    await run_manager.shutdown()
+    await agent_session_pool.shutdown()
+    await history_writer.close()
     print(f"[app] Shutting down heartbeat system, telegram service, and cron service")
 
 
@@ -154,6 +170,7 @@ class App:
             allow_methods=["*"],
             allow_headers=["*"],
         )
+        self.web_app.add_middleware(CompressionMiddleware)
     
     def setup_routers(self):
         """Register all routers."""
@@ -0,0 +1,355 @@
+"""
+Long-lived agent processes driven over the MCP stdio transport.
+
+A warm `codex mcp-server` keeps Node, its modules and the auth state loaded
+between prompts. AgentSession speaks newline-delimited JSON-RPC to one such
+child, and AgentSessionPool keeps one per profile, restarting it after a
+crash or a failed health check and shutting it down once it has been idle
+for AGENT_SESSION_IDLE_TIMEOUT seconds.
+
+Gemini has no pooled session: each of its turns replays the compacted session
+file (gemini_session) into a new process, which ACP's in-process
+conversations can't take over without losing that history on a restart.
+"""
+
+from typing import Optional, AsyncGenerator, Tuple, List, Dict, Any, Set
+
+import asyncio
+import json
+import os
+import signal
+import time
+
+from tracks.config import settings
+
+MCP_PROTOCOL_VERSION = "2025-06-18"
+
+# Largest single JSON-RPC message we accept from the child (exec output is inlined)
+MAX_MESSAGE_SIZE = 64 * 1024 * 1024
+
+# How long the child may take to answer `initialize`
+START_TIMEOUT = 60.0
+
+# Interval and timeout of the idle/health check loop
+HEALTH_CHECK_INTERVAL = 30.0
+HEALTH_CHECK_TIMEOUT = 10.0
+
+# Grace period between SIGTERM and SIGKILL on shutdown
+STOP_TIMEOUT = 3.0
+
+
+class AgentSessionError(Exception):
+    """Raised when the agent process fails to start, dies or rejects a call."""
+
+
+class AgentSession:
+    """One warm agent process and the JSON-RPC calls in flight on it."""
+
+    def __init__(self, cmd: List[str], cwd: str, env: Dict[str, str]):
+        self.cmd = cmd
+        self.cwd = cwd
+        self.env = env
+
+        self.proc: Optional[asyncio.subprocess.Process] = None
+        self.last_used = time.monotonic()
+        self.active_calls = 0
+        # Conversations started in this process, the only ones it can continue
+        self.conversations: Set[str] = set()
+
+        self._next_id = 1
+        self._calls: Dict[int, asyncio.Queue] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._closed = False
+
+    @property
+    def alive(self) -> bool:
+        return not self._closed and self.proc is not None and self.proc.returncode is None
+
+    async def start(self):
+        """Spawn the child and complete the MCP initialize handshake."""
+        try:
+            self.proc = await asyncio.create_subprocess_exec(
+                *self.cmd,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                cwd=self.cwd,
+                env=self.env,
+                start_new_session=True,
+                limit=MAX_MESSAGE_SIZE
+            )
+        except OSError as e:
+            raise AgentSessionError(f"Failed to spawn {self.cmd[0]}: {e}")
+
+        self._tasks.append(asyncio.create_task(self._read_stdout()))
+        self._tasks.append(asyncio.create_task(self._read_stderr()))
+
+        try:
+            await asyncio.wait_for(self.request("initialize", {
+                "protocolVersion": MCP_PROTOCOL_VERSION,
+                "capabilities": {},
+                "clientInfo": {"name": "tracks", "version": "1.0"}
+            }), START_TIMEOUT)
+            await self.notify("notifications/initialized")
+        except BaseException as e:
+            await self.close()
+            if isinstance(e, asyncio.TimeoutError):
+                raise AgentSessionError("Agent process did not answer initialize")
+            raise
+
+        print(f"[agent_session] Started {' '.join(self.cmd)} (pid {self.proc.pid})")
+
+    async def _send(self, message: Dict[str, Any]):
+        if not self.alive:
+            raise AgentSessionError("Agent process is not running")
+        message["jsonrpc"] = "2.0"
+        try:
+            self.proc.stdin.write((json.dumps(message) + "\n").encode("utf-8"))
+            await self.proc.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError) as e:
+            raise AgentSessionError(f"Agent process closed its input: {e}")
+
+    def _register_call(self) -> Tuple[int, asyncio.Queue]:
+        request_id = self._next_id
+        self._next_id += 1
+        queue = asyncio.Queue()
+        self._calls[request_id] = queue
+        return request_id, queue
+
+    async def notify(self, method: str, params: Optional[Dict[str, Any]] = None):
+        message = {"method": method}
+        if params is not None:
+            message["params"] = params
+        await self._send(message)
+
+    async def request(self, method: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Send a request and return its result, ignoring progress notifications."""
+        request_id, queue = self._register_call()
+        try:
+            message = {"id": request_id, "method": method}
+            if params is not None:
+                message["params"] = params
+            await self._send(message)
+            while True:
+                kind, payload = await queue.get()
+                if kind == "result":
+                    return payload
+                if kind == "error":
+                    raise AgentSessionError(payload.get("message", "Unknown error"))
+        finally:
+            self._calls.pop(request_id, None)
+
+    async def call_tool(self, name: str, arguments: Dict[str, Any]) -> AsyncGenerator[Tuple[str, Dict[str, Any]], None]:
+        """
+        Call an MCP tool and stream its progress.
+
+        Yields:
+            Tuple[str, Dict]: ("event", msg) for every agent event, then ("result", tool_result)
+
+        Closing the generator before the result arrives cancels the call on the server.
+        """
+        request_id, queue = self._register_call()
+        self.active_calls += 1
+        finished = False
+        try:
+            await self._send({
+                "id": request_id,
+                "method": "tools/call",
+                "params": {"name": name, "arguments": arguments}
+            })
+            while True:
+                kind, payload = await queue.get()
+                if kind == "event":
+                    yield (kind, payload)
+                    continue
+                finished = True
+                if kind == "error":
+                    raise AgentSessionError(payload.get("message", "Unknown error"))
+                yield (kind, payload)
+                return
+        finally:
+            self._calls.pop(request_id, None)
+            self.active_calls -= 1
+            self.last_used = time.monotonic()
+            if not finished and self.alive:
+                try:
+                    await self.notify("notifications/cancelled", {"requestId": request_id, "reason": "Cancelled by client"})
+                except AgentSessionError:
+                    pass
+
+    async def ping(self, timeout: float = HEALTH_CHECK_TIMEOUT) -> bool:
+        try:
+            await asyncio.wait_for(self.request("ping"), timeout)
+            return True
+        except (AgentSessionError, asyncio.TimeoutError):
+            return False
+
+    def _dispatch(self, message: Dict[str, Any]):
+        method = message.get("method")
+
+        # Response to one of our requests
+        if method is None:
+            queue = self._calls.get(message.get("id"))
+            if queue is None:
+                return
+            if "error" in message:
+                queue.put_nowait(("error", message["error"]))
+            else:
+                queue.put_nowait(("result", message.get("result", {})))
+            return
+
+        # Request from the server (ping, approvals); approvals are disabled per call
+        if "id" in message:
+            if method == "ping":
+                reply = {"id": message["id"], "result": {}}
+            else:
+                reply = {"id": message["id"], "error": {"code": -32601, "message": f"Unsupported request: {method}"}}
+            asyncio.create_task(self._reply(reply))
+            return
+
+        # Notification, route agent events to the call that caused them
+        params = message.get("params") or {}
+        if method == "codex/event":
+            request_id = (params.get("_meta") or {}).get("requestId")
+            queue = self._calls.get(request_id)
+            if queue is None and len(self._calls) == 1:
+                queue = next(iter(self._calls.values()))
+            if queue is not None:
+                queue.put_nowait(("event", params.get("msg") or {}))
+
+    async def _reply(self, message: Dict[str, Any]):
+        try:
+            await self._send(message)
+        except AgentSessionError:
+            pass
+
+    async def _read_stdout(self):
+        try:
+            while True:
+                try:
+                    line = await self.proc.stdout.readline()
+                except ValueError:
+                    # Message above MAX_MESSAGE_SIZE, the stream cannot be resynchronized
+                    print(f"[agent_session] Oversized message from {self.cmd[0]}, stopping session")
+                    break
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"[agent_session] Ignoring non JSON output: {line[:200]!r}")
+                    continue
+                if isinstance(message, dict):
+                    self._dispatch(message)
+        finally:
+            self._closed = True
+            for queue in self._calls.values():
+                queue.put_nowait(("error", {"message": "Agent process exited"}))
+
+    async def _read_stderr(self):
+        while True:
+            line = await self.proc.stderr.readline()
+            if not line:
+                break
+            print(f"[agent_session] {line.decode('utf-8', errors='replace').rstrip()}")
+
+    async def close(self):
+        """Stop the process group and the reader tasks."""
+        self._closed = True
+        if self.proc is not None and self.proc.returncode is None:
+            try:
+                self.proc.stdin.close()
+                os.killpg(self.proc.pid, signal.SIGTERM)
+                await asyncio.wait_for(self.proc.wait(), STOP_TIMEOUT)
+            except (ProcessLookupError, PermissionError):
+                pass
+            except asyncio.TimeoutError:
+                pass
+        if self.proc is not None:
+            # Also the processes it started, whether or not it is still running
+            try:
+                os.killpg(self.proc.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+            if self.proc.returncode is None:
+                await self.proc.wait()
+
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+
+class AgentSessionPool:
+    """Keeps at most one warm AgentSession per profile key."""
+
+    def __init__(self):
+        self._sessions: Dict[str, AgentSession] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._monitor_task: Optional[asyncio.Task] = None
+
+    def get(self, key: str) -> Optional[AgentSession]:
+        session = self._sessions.get(key)
+        if session is not None and session.alive:
+            return session
+        return None
+
+    async def acquire(self, key: str, cmd: List[str], cwd: str, env: Dict[str, str]) -> AgentSession:
+        """Return the running session for key, (re)starting it if needed."""
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            session = self._sessions.get(key)
+
+            if session is not None and session.alive and session.env is not env and session.active_calls == 0:
+                # Vault, secrets or settings changed since the process was started
+                print(f"[agent_session] Environment changed, restarting {key}")
+                await session.close()
+                session = None
+
+            if session is None or not session.alive:
+                if session is not None:
+                    print(f"[agent_session] {key} exited, restarting")
+                    await session.close()
+                session = AgentSession(cmd, cwd, env)
+                self._sessions[key] = session
+                try:
+                    await session.start()
+                except BaseException:
+                    self._sessions.pop(key, None)
+                    raise
+
+            session.last_used = time.monotonic()
+            if self._monitor_task is None or self._monitor_task.done():
+                self._monitor_task = asyncio.create_task(self._monitor())
+            return session
+
+    async def _monitor(self):
+        """Shut down idle sessions and drop ones that crashed or stopped answering."""
+        while self._sessions:
+            await asyncio.sleep(HEALTH_CHECK_INTERVAL)
+            for key, session in list(self._sessions.items()):
+                if session.active_calls:
+                    continue
+                if not session.alive:
+                    print(f"[agent_session] {key} exited, it will be restarted on next use")
+                elif time.monotonic() - session.last_used > settings.AGENT_SESSION_IDLE_TIMEOUT:
+                    print(f"[agent_session] {key} idle, shutting down")
+                elif not await session.ping():
+                    print(f"[agent_session] {key} failed health check, stopping")
+                else:
+                    continue
+                if self._sessions.get(key) is session:
+                    del self._sessions[key]
+                await session.close()
+
+    async def shutdown(self):
+        if self._monitor_task is not None:
+            self._monitor_task.cancel()
+            self._monitor_task = None
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        for session in sessions:
+            await session.close()
+
+
+# Singleton instance
+agent_session_pool = AgentSessionPool()
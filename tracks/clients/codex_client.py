@@ -1,16 +1,72 @@
-from typing import Optional, Generator, Tuple, Dict, Any
+from typing import Optional, Generator, AsyncGenerator, Iterator, Tuple, List, Dict, Any
 
 import subprocess
 import os
 import json
 import re
+import time
+import shlex
 
 from tracks.vault import vault
 from tracks.secret import secret
 from tracks.config import settings
+from tracks.clients.pty_process import AsyncPtyProcess
+from tracks.clients.output_buffer import LineSplitter, TranscriptBuffer
+from tracks.clients.profile_cache import ChildEnv, write_if_changed
+from tracks.clients.agent_session import AgentSession, AgentSessionError, agent_session_pool
 
 OUTPUT_TAG_STDOUT = 0
 OUTPUT_TAG_STDERR = 1
+# Stdout line holding one JSON event (`codex exec --json` or an agent session)
+OUTPUT_TAG_EVENT = 2
+
+OUTPUT_MODE_JSON = 'json'
+
+NO_EVENTS: Tuple[Tuple[str, str], ...] = ()
+
+# Text protocol section headers (trimmed stderr line) -> (section tag, events to emit)
+SECTION_HEADERS: Dict[str, Tuple[str, Tuple[Tuple[str, str], ...]]] = {
+    'user': ('user', (('title', 'User'),)),
+    'thinking': ('thinking', (('title', 'Thinking'),)),
+    'exec': ('exec', (('title', 'Run'),)),
+    'kori': ('agent', (('title', 'Agent'),)),
+    'codex': ('agent', (('title', 'Agent'),)),
+    'file update:': ('file_update', (('title', 'File Update'),)),
+    'tokens used': ('tokens_used', NO_EVENTS),
+    'non zero exit code': ('error', (('title', 'Error'),)),
+}
+
+META_DELIMITER_PATTERN = re.compile(r'^[-]{3,}$')
+EXEC_DONE_PATTERN = re.compile(r'^(.*) succeeded in ([0-9.,]+ms)(:)?(\s)*$')
+
+
+def _meta_content(state: Dict[str, Any], line: str, trimmed_line: str) -> Tuple[Tuple[str, str], ...]:
+    colon_index = line.find(':')
+    if colon_index != -1:
+        key = line[:colon_index].strip().replace(' ', '_')
+        state['meta_dict'][key] = line[colon_index + 1:].strip()
+    return NO_EVENTS
+
+
+def _exec_content(state: Dict[str, Any], line: str, trimmed_line: str) -> Tuple[Tuple[str, str], ...]:
+    # Match exec completion pattern, the substring test skips the backtracking regex for output lines
+    if ' succeeded in ' in line:
+        exec_match = EXEC_DONE_PATTERN.match(line)
+        if exec_match:
+            return (('exec', exec_match.group(1) + '\n'), ('exec_time', exec_match.group(2)))
+    return (('exec_output', line),)
+
+
+def _tokens_used_content(state: Dict[str, Any], line: str, trimmed_line: str) -> Tuple[Tuple[str, str], ...]:
+    return (('tokens_used', trimmed_line.replace(',', '')),)
+
+
+# Sections whose content lines need more than a (section tag, line) event
+CONTENT_HANDLERS = {
+    'meta': _meta_content,
+    'exec': _exec_content,
+    'tokens_used': _tokens_used_content,
+}
 
 
 class CodexClient:
@@ -38,6 +94,9 @@ class CodexClient:
 
         self.profile_id = profile_id
         
+        # Child environment, built on first spawn
+        self._child_env = ChildEnv(self._compose_env)
+        
         # Setup config file
         self._setup_config()
     
@@ -68,47 +127,27 @@ class CodexClient:
             
             # Write to config.toml
             config_path = os.path.join(codex_dir, 'config.toml')
-            with open(config_path, 'w') as f:
-                f.write(config_content)
-            
-            print(f'[cli] Config written to: {config_path}')
+            if write_if_changed(config_path, config_content):
+                print(f'[cli] Config written to: {config_path}')
             
         except FileNotFoundError:
             print(f'[cli] Warning: config.base.toml not found at {config_base_path}')
         except Exception as e:
             print(f'[cli] Warning: Failed to setup config: {e}')
     
-    def exec_prompt(
+    def _build_command(
         self,
         prompt: str,
         session_id: Optional[str] = None,
         skip_git_repo_check: bool = False,
         allow_edit: bool = False,
-        cwd: Optional[str] = None,
-        model: Optional[str] = None
-    ) -> Generator[Tuple[int, str], None, None]:
-        """
-        Execute a prompt using codex CLI with PTY for unbuffered streaming
-        
-        Args:
-            prompt: The prompt to execute
-            session_id: Session ID for resuming
-            skip_git_repo_check: Skip git repo check
-            allow_edit: Allow dangerous edits
-            cwd: Working directory
-            model: Model to use
-            
-        Yields:
-            Tuple[int, str]: (tag, line) tuples where tag is OUTPUT_TAG_STDOUT or OUTPUT_TAG_STDERR
-        """
-        import pty
-        import select
-        
+        json_events: bool = False
+    ) -> List[str]:
+        """Build the codex exec command line"""
         cmd = [self.binary_path, 'exec']
         
-        # Use instance cwd as default if not provided
-        if cwd is None:
-            cwd = self.cwd
+        if json_events:
+            cmd.append('--json')
         
         if skip_git_repo_check:
             cmd.append('--skip-git-repo-check')
@@ -123,8 +162,14 @@ class CodexClient:
         
         print(f'[cli] Spawning: {" ".join(cmd)}')
         print(f'[cli] Binary path: {self.binary_path}')
-        
-        # Prepare environment with unbuffered output
+        return cmd
+    
+    def _build_env(self) -> Dict[str, str]:
+        """Return the cached child environment, rebuilt when settings, vault or secrets change"""
+        return self._child_env.get()
+    
+    def _compose_env(self) -> Dict[str, str]:
+        """Prepare the child environment with unbuffered output, vault and secrets"""
         env = os.environ.copy()
         env['PYTHONUNBUFFERED'] = '1'
         env['TERM'] = 'dumb'  # Simple terminal to avoid escape sequences
@@ -137,38 +182,46 @@ class CodexClient:
             env[key] = value
 
         # Add secret variables to environment
-        secret_dict = secret.to_dict()
-        if secret_dict.get("GOOGLE_OAUTH_TOKEN"):
-            env["GOOGLE_OAUTH_TOKEN"] = secret_dict["GOOGLE_OAUTH_TOKEN"]
-        if secret_dict.get("GOOGLE_OAUTH_REFRESH_TOKEN"):
-            env["GOOGLE_OAUTH_REFRESH_TOKEN"] = secret_dict["GOOGLE_OAUTH_REFRESH_TOKEN"]
-            
-        # Add Instagram Auth Secrets to environment
-        if secret_dict.get("INSTAGRAM_CLIENT_ID"):
-            env["INSTAGRAM_CLIENT_ID"] = secret_dict["INSTAGRAM_CLIENT_ID"]
-        if secret_dict.get("INSTAGRAM_CLIENT_SECRET"):
-            env["INSTAGRAM_CLIENT_SECRET"] = secret_dict["INSTAGRAM_CLIENT_SECRET"]
-            
-        # Add Twitter Auth Secrets to environment
-        if secret_dict.get("TWITTER_CLIENT_ID"):
-            env["TWITTER_CLIENT_ID"] = secret_dict["TWITTER_CLIENT_ID"]
-        if secret_dict.get("TWITTER_CLIENT_SECRET"):
-            env["TWITTER_CLIENT_SECRET"] = secret_dict["TWITTER_CLIENT_SECRET"]
-            
-        # Add SmartThings Auth Secrets to environment
-        if secret_dict.get("SMARTTHINGS_CLIENT_ID"):
-            env["SMARTTHINGS_CLIENT_ID"] = secret_dict["SMARTTHINGS_CLIENT_ID"]
-        if secret_dict.get("SMARTTHINGS_CLIENT_SECRET"):
-            env["SMARTTHINGS_CLIENT_SECRET"] = secret_dict["SMARTTHINGS_CLIENT_SECRET"]
-
-        # Add YouTube Auth Secrets to environment
-        if secret_dict.get("YOUTUBE_CLIENT_ID"):
-            env["YOUTUBE_CLIENT_ID"] = secret_dict["YOUTUBE_CLIENT_ID"]
-        if secret_dict.get("YOUTUBE_CLIENT_SECRET"):
-            env["YOUTUBE_CLIENT_SECRET"] = secret_dict["YOUTUBE_CLIENT_SECRET"]
-            
-        for key, value in secret_dict.items():
+        for key, value in secret.to_dict().items():
             env[key] = value
+        
+        return env
+    
+    def exec_prompt(
+        self,
+        prompt: str,
+        session_id: Optional[str] = None,
+        skip_git_repo_check: bool = False,
+        allow_edit: bool = False,
+        cwd: Optional[str] = None,
+        model: Optional[str] = None
+    ) -> Generator[Tuple[int, str], None, None]:
+        """
+        Execute a prompt using codex CLI with PTY for unbuffered streaming
+        
+        Args:
+            prompt: The prompt to execute
+            session_id: Session ID for resuming
+            skip_git_repo_check: Skip git repo check
+            allow_edit: Allow dangerous edits
+            cwd: Working directory
+            model: Model to use
+            
+        Yields:
+            Tuple[int, str]: (tag, line) tuples where tag is OUTPUT_TAG_STDOUT, OUTPUT_TAG_STDERR
+            or OUTPUT_TAG_EVENT
+        """
+        import pty
+        import select
+        
+        # Use instance cwd as default if not provided
+        if cwd is None:
+            cwd = self.cwd
+        
+        json_events = settings.CODEX_OUTPUT_MODE == OUTPUT_MODE_JSON
+        cmd = self._build_command(prompt, session_id, skip_git_repo_check, allow_edit, json_events)
+        env = self._build_env()
+        stdout_tag = OUTPUT_TAG_EVENT if json_events else OUTPUT_TAG_STDOUT
 
         # Create PTY for stdout (forces line buffering in child process)
         master_fd, slave_fd = pty.openpty()
@@ -187,6 +240,10 @@ class CodexClient:
         # Close slave in parent
         os.close(slave_fd)
         
+        # Keep a bounded transcript for debug printing on failure
+        full_stdout = TranscriptBuffer()
+        full_stderr = TranscriptBuffer()
+        
         try:
             import fcntl
             
@@ -197,12 +254,8 @@ class CodexClient:
             flags_err = fcntl.fcntl(proc.stderr, fcntl.F_GETFL)
             fcntl.fcntl(proc.stderr, fcntl.F_SETFL, flags_err | os.O_NONBLOCK)
             
-            stdout_buffer = b''
-            stderr_buffer = b''
-            
-            # Accumulate full logs for debug printing on failure
-            full_stdout = b''
-            full_stderr = b''
+            stdout_lines = LineSplitter()
+            stderr_lines = LineSplitter()
             
             while True:
                 # Check if process has finished
@@ -210,18 +263,22 @@ class CodexClient:
                     # Read any remaining data
                     try:
                         while True:
-                            remaining_out = os.read(master_fd, 4096)
+                            remaining_out = os.read(master_fd, 65536)
                             if not remaining_out:
                                 break
-                            stdout_buffer += remaining_out
-                            full_stdout += remaining_out
+                            full_stdout.write(remaining_out)
+                            for line in stdout_lines.feed(remaining_out):
+                                yield (stdout_tag, line)
                     except (OSError, IOError):
                         pass
                     try:
-                        remaining_err = proc.stderr.read()
-                        if remaining_err:
-                            stderr_buffer += remaining_err
-                            full_stderr += remaining_err
+                        while True:
+                            remaining_err = proc.stderr.read(65536)
+                            if not remaining_err:
+                                break
+                            full_stderr.write(remaining_err)
+                            for line in stderr_lines.feed(remaining_err):
+                                yield (OUTPUT_TAG_STDERR, line)
                     except:
                         pass
                     break
@@ -235,71 +292,176 @@ class CodexClient:
                 for stream in readable:
                     try:
                         if stream == master_fd:
-                            data = os.read(master_fd, 4096)
+                            data = os.read(master_fd, 65536)
                         else:
-                            data = stream.read(4096)
+                            data = stream.read(65536)
                         
                         if not data:
                             continue
                             
                         if stream == master_fd:
-                            stdout_buffer += data
-                            full_stdout += data
+                            full_stdout.write(data)
+                            # Process complete lines from stdout
+                            for line in stdout_lines.feed(data):
+                                yield (stdout_tag, line)
                         else:
-                            stderr_buffer += data
-                            full_stderr += data
+                            full_stderr.write(data)
+                            # Process complete lines from stderr
+                            for line in stderr_lines.feed(data):
+                                yield (OUTPUT_TAG_STDERR, line)
                     except (OSError, IOError):
                         pass
-                
-                # Process complete lines from stdout
-                while b'\n' in stdout_buffer:
-                    line, stdout_buffer = stdout_buffer.split(b'\n', 1)
-                    yield (OUTPUT_TAG_STDOUT, line.decode('utf-8', errors='replace') + '\n')
-                
-                # Process complete lines from stderr
-                while b'\n' in stderr_buffer:
-                    line, stderr_buffer = stderr_buffer.split(b'\n', 1)
-                    yield (OUTPUT_TAG_STDERR, line.decode('utf-8', errors='replace') + '\n')
             
             # Yield any remaining buffered data
-            if stdout_buffer:
-                for line in stdout_buffer.decode('utf-8', errors='replace').splitlines(keepends=True):
-                    if line:
-                        yield (OUTPUT_TAG_STDOUT, line)
+            for line in stdout_lines.flush():
+                yield (stdout_tag, line)
             
-            if stderr_buffer:
-                for line in stderr_buffer.decode('utf-8', errors='replace').splitlines(keepends=True):
-                    if line:
-                        yield (OUTPUT_TAG_STDERR, line)
+            for line in stderr_lines.flush():
+                yield (OUTPUT_TAG_STDERR, line)
             
             # Check for non-zero return code and print debug info
-            return_code = proc.poll()
-            if return_code is not None and return_code != 0:
-                print("\n" + "="*50)
-                print(f"Codex exec ended with error (exit code: {return_code})")
-                print("="*50)
-                print("FULL STDOUT:")
-                print(full_stdout.decode('utf-8', errors='replace'))
-                print("-" * 30)
-                print("FULL STDERR:")
-                print(full_stderr.decode('utf-8', errors='replace'))
-                print("="*50 + "\n")
-                yield (OUTPUT_TAG_STDERR, "non zero exit code\n")
-                yield (OUTPUT_TAG_STDERR, f"Codex exec ended with error (exit code: {return_code})\n")
-                yield (OUTPUT_TAG_STDERR, "FULL STDOUT:\n")
-                yield (OUTPUT_TAG_STDERR, full_stdout.decode('utf-8', errors='replace'))
-                yield (OUTPUT_TAG_STDERR, "FULL STDERR:\n")
-                yield (OUTPUT_TAG_STDERR, full_stderr.decode('utf-8', errors='replace'))
+            yield from self._failure_output(proc.poll(), full_stdout, full_stderr)
             
         finally:
             # Ensure process is cleaned up
             os.close(master_fd)
             if proc.poll() is None:
                 proc.kill()
+            full_stdout.close()
+            full_stderr.close()
+    
+    def _failure_output(
+        self,
+        return_code: Optional[int],
+        full_stdout: TranscriptBuffer,
+        full_stderr: TranscriptBuffer
+    ) -> Iterator[Tuple[int, str]]:
+        """Print debug info and yield error lines for a non-zero exit code"""
+        if return_code is None or return_code == 0:
+            return
+        print("\n" + "="*50)
+        print(f"Codex exec ended with error (exit code: {return_code})")
+        print("="*50)
+        print("FULL STDOUT:")
+        print(full_stdout.text())
+        print("-" * 30)
+        print("FULL STDERR:")
+        print(full_stderr.text())
+        print("="*50 + "\n")
+        yield (OUTPUT_TAG_STDERR, "non zero exit code\n")
+        yield (OUTPUT_TAG_STDERR, f"Codex exec ended with error (exit code: {return_code})\n")
+        yield (OUTPUT_TAG_STDERR, "FULL STDOUT:\n")
+        yield (OUTPUT_TAG_STDERR, full_stdout.text())
+        yield (OUTPUT_TAG_STDERR, "FULL STDERR:\n")
+        yield (OUTPUT_TAG_STDERR, full_stderr.text())
+    
+    async def aexec_prompt(
+        self,
+        prompt: str,
+        session_id: Optional[str] = None,
+        skip_git_repo_check: bool = False,
+        allow_edit: bool = False,
+        cwd: Optional[str] = None,
+        model: Optional[str] = None
+    ) -> AsyncGenerator[Tuple[int, str], None]:
+        """
+        Async version of exec_prompt that never blocks the event loop.
+        
+        Output is read through the running loop. Closing or cancelling the
+        generator kills the codex process group. With ENABLE_AGENT_SESSIONS
+        the prompt runs on the profile's warm `codex mcp-server` instead,
+        unless it resumes a conversation that process does not know.
+        
+        Yields:
+            Tuple[int, str]: (tag, line) tuples where tag is OUTPUT_TAG_STDOUT, OUTPUT_TAG_STDERR
+            or OUTPUT_TAG_EVENT
+        """
+        if cwd is None:
+            cwd = self.cwd
+        
+        if settings.ENABLE_AGENT_SESSIONS:
+            session = await self._acquire_agent_session(cwd, session_id)
+            if session is not None:
+                async for tag, line in self._aexec_agent_session(session, prompt, session_id, allow_edit, cwd):
+                    yield (tag, line)
+                return
+        
+        json_events = settings.CODEX_OUTPUT_MODE == OUTPUT_MODE_JSON
+        cmd = self._build_command(prompt, session_id, skip_git_repo_check, allow_edit, json_events)
+        process = AsyncPtyProcess(cmd, cwd=cwd, env=self._build_env())
+        await process.start()
+        
+        try:
+            async for tag, line in process.lines():
+                if json_events and tag == OUTPUT_TAG_STDOUT:
+                    tag = OUTPUT_TAG_EVENT
+                yield (tag, line)
+            
+            for tag, line in self._failure_output(process.returncode, process.full_stdout, process.full_stderr):
+                yield (tag, line)
+        finally:
+            await process.close()
+            process.release()
+    
+    async def _acquire_agent_session(self, cwd: str, session_id: Optional[str]) -> Optional[AgentSession]:
+        """Return the warm agent session for this profile, or None to spawn codex exec"""
+        key = f'codex:{self.profile_id}:{cwd}'
+        if session_id:
+            # A conversation can only be continued by the process that started it
+            session = agent_session_pool.get(key)
+            if session is None or session_id not in session.conversations:
+                return None
+        try:
+            return await agent_session_pool.acquire(key, [self.binary_path, 'mcp-server'], cwd, self._build_env())
+        except AgentSessionError as e:
+            print(f'[cli] Agent session unavailable, falling back to codex exec: {e}')
+            return None
+    
+    async def _aexec_agent_session(
+        self,
+        session: AgentSession,
+        prompt: str,
+        session_id: Optional[str],
+        allow_edit: bool,
+        cwd: str
+    ) -> AsyncGenerator[Tuple[int, str], None]:
+        """Run one prompt through the codex/codex-reply tools of a warm mcp-server"""
+        if session_id:
+            tool = 'codex-reply'
+            arguments = {'conversationId': session_id, 'prompt': prompt}
+            # Replies do not announce the session again
+            yield (OUTPUT_TAG_EVENT, json.dumps({'type': 'session_configured', 'session_id': session_id}) + '\n')
+        else:
+            tool = 'codex'
+            arguments = {'prompt': prompt, 'cwd': cwd, 'approval-policy': 'never'}
+            if allow_edit:
+                arguments['sandbox'] = 'danger-full-access'
+        print(f'[cli] Agent session call: {tool} (pid {session.proc.pid})')
+        
+        try:
+            async for kind, payload in session.call_tool(tool, arguments):
+                if kind == 'event':
+                    if payload.get('type') == 'session_configured' and payload.get('session_id'):
+                        session.conversations.add(payload['session_id'])
+                    yield (OUTPUT_TAG_EVENT, json.dumps(payload) + '\n')
+                    continue
+                
+                structured = payload.get('structuredContent') or {}
+                conversation_id = structured.get('threadId') or structured.get('conversationId')
+                if conversation_id:
+                    session.conversations.add(conversation_id)
+                    yield (OUTPUT_TAG_EVENT, json.dumps({'type': 'session_configured', 'session_id': conversation_id}) + '\n')
+                if payload.get('isError'):
+                    text = ''.join(item.get('text', '') for item in payload.get('content', []))
+                    yield (OUTPUT_TAG_STDERR, 'non zero exit code\n')
+                    yield (OUTPUT_TAG_STDERR, text + '\n')
+        except AgentSessionError as e:
+            yield (OUTPUT_TAG_STDERR, 'non zero exit code\n')
+            yield (OUTPUT_TAG_STDERR, f'Codex agent session failed: {e}\n')
     
     def serialize_output(
         self,
-        output: Generator[Tuple[int, str], None, None]
+        output: Iterator[Tuple[int, str]]
     ) -> Generator[Tuple[str, str], None, None]:
         """
         Serialize raw output into structured events
@@ -310,82 +472,259 @@ class CodexClient:
         Yields:
             Tuple[str, str]: (event_type, data) tuples
         """
-        output_tag = None
-        meta_done = False
-        meta_dict = {}
+        state = self._new_serialize_state()
         
+        serialize_line = self._serialize_line
         for tag, line in output:
-            trimmed_line = line.strip()
-            
-            # Handle stdout tags
-            if tag == OUTPUT_TAG_STDOUT:
-                if output_tag != 'stdout':
-                    output_tag = 'stdout'
-                    yield ('title', 'Stdout')
-                yield ('stdout', line)
-                continue
+            yield from serialize_line(state, tag, line)
+        
+        yield ('done', '')
+    
+    async def aserialize_output(
+        self,
+        output: AsyncGenerator[Tuple[int, str], None]
+    ) -> AsyncGenerator[Tuple[str, str], None]:
+        """
+        Async version of serialize_output for use with aexec_prompt
+        
+        Args:
+            output: Raw output from aexec_prompt
             
-            # Handle stderr tags
-            if trimmed_line == 'user':
-                output_tag = 'user'
-                yield ('title', 'User')
-                continue
-            elif trimmed_line == 'thinking':
-                output_tag = 'thinking'
-                yield ('title', 'Thinking')
-                continue
-            elif trimmed_line == 'exec':
-                output_tag = 'exec'
+        Yields:
+            Tuple[str, str]: (event_type, data) tuples
+        """
+        state = self._new_serialize_state()
+        
+        try:
+            async for tag, line in output:
+                for event in self._serialize_line(state, tag, line):
+                    yield event
+        finally:
+            await output.aclose()
+        
+        yield ('done', '')
+    
+    def _new_serialize_state(self) -> Dict[str, Any]:
+        return {
+            'output_tag': None,
+            'meta_done': False,
+            'meta_dict': {},
+            'exec_started': {},
+            'tokens_used': None
+        }
+    
+    def _serialize_line(self, state: Dict[str, Any], tag: int, line: str) -> Tuple[Tuple[str, str], ...]:
+        """Turn one raw output line into zero or more structured events"""
+        if tag == OUTPUT_TAG_EVENT:
+            return tuple(self._serialize_json_line(state, line))
+        
+        # Handle stdout tags
+        if tag == OUTPUT_TAG_STDOUT:
+            if state['output_tag'] != 'stdout':
+                state['output_tag'] = 'stdout'
+                return (('title', 'Stdout'), ('stdout', line))
+            return (('stdout', line),)
+        
+        trimmed_line = line.strip()
+        
+        # Handle stderr section headers
+        header = SECTION_HEADERS.get(trimmed_line)
+        if header is not None:
+            state['output_tag'] = header[0]
+            return header[1]
+        
+        # Handle metadata delimiters
+        if not state['meta_done'] and trimmed_line[:3] == '---' and META_DELIMITER_PATTERN.match(trimmed_line):
+            if state['output_tag'] != 'meta':
+                state['output_tag'] = 'meta'
+                return NO_EVENTS
+            state['output_tag'] = None
+            state['meta_done'] = True
+            return (('meta', json.dumps(state['meta_dict'])),)
+        
+        # Process content based on current tag
+        output_tag = state['output_tag']
+        handler = CONTENT_HANDLERS.get(output_tag)
+        if handler is not None:
+            return handler(state, line, trimmed_line)
+        if output_tag is not None:
+            return ((output_tag, line),)
+        return NO_EVENTS
+    
+    def _serialize_json_line(self, state: Dict[str, Any], line: str) -> Iterator[Tuple[str, str]]:
+        """
+        Map one JSON event to the (tag, data) protocol
+        
+        `codex exec --json` event types:
+        - thread.started: Session starts (includes thread_id, used as session_id)
+        - item.started / item.updated / item.completed: reasoning, agent_message,
+          command_execution, file_change, mcp_tool_call, web_search, todo_list, error
+        - turn.completed: Token usage for the turn
+        - turn.failed / error: Fatal and stream-level errors
+        
+        Agent session (`codex mcp-server`) events are handled by _serialize_session_event.
+        """
+        trimmed_line = line.strip()
+        if not trimmed_line:
+            return
+        
+        try:
+            event = json.loads(trimmed_line)
+        except json.JSONDecodeError:
+            # Non-JSON output from stdout, treat as raw output
+            yield ('stdout', line)
+            return
+        
+        event_type = event.get('type', '')
+        
+        if event_type == 'thread.started':
+            if not state['meta_done']:
+                state['meta_done'] = True
+                state['meta_dict']['session_id'] = event.get('thread_id', '')
+                yield ('meta', json.dumps(state['meta_dict']))
+        
+        elif event_type in ('item.started', 'item.completed'):
+            yield from self._serialize_json_item(state, event_type, event.get('item', {}))
+        
+        elif event_type == 'turn.completed':
+            usage = event.get('usage', {})
+            total_tokens = usage.get('input_tokens', 0) + usage.get('output_tokens', 0)
+            if total_tokens:
+                yield ('tokens_used', str(total_tokens))
+        
+        elif event_type == 'turn.failed':
+            yield ('title', 'Error')
+            yield ('error', event.get('error', {}).get('message', '') + '\n')
+        
+        elif event_type == 'error':
+            yield ('title', 'Error')
+            yield ('error', event.get('message', '') + '\n')
+        
+        else:
+            yield from self._serialize_session_event(state, event_type, event)
+    
+    def _serialize_session_event(self, state: Dict[str, Any], event_type: str, event: Dict[str, Any]) -> Iterator[Tuple[str, str]]:
+        """
+        Map one `codex mcp-server` event message to (tag, data) events
+        
+        Streaming deltas are skipped, the complete agent_message and
+        agent_reasoning events carry the same text.
+        """
+        if event_type == 'session_configured':
+            if not state['meta_done']:
+                state['meta_done'] = True
+                state['meta_dict']['session_id'] = event.get('session_id', '')
+                if event.get('model'):
+                    state['meta_dict']['model'] = event['model']
+                yield ('meta', json.dumps(state['meta_dict']))
+        
+        elif event_type == 'agent_reasoning':
+            yield ('title', 'Thinking')
+            yield ('thinking', event.get('text', '') + '\n')
+        
+        elif event_type == 'agent_message':
+            yield ('title', 'Agent')
+            yield ('agent', event.get('message', '') + '\n')
+        
+        elif event_type == 'exec_command_begin':
+            command = event.get('command', '')
+            if isinstance(command, list):
+                command = shlex.join(command)
+            yield ('title', 'Run')
+            yield ('exec', command + '\n')
+        
+        elif event_type == 'exec_command_end':
+            duration = event.get('duration')
+            if isinstance(duration, dict):
+                yield ('exec_time', f"{duration.get('secs', 0) * 1000 + duration.get('nanos', 0) // 1000000}ms")
+            elif duration is not None:
+                yield ('exec_time', str(duration))
+            output = event.get('aggregated_output') or event.get('stdout', '') + event.get('stderr', '')
+            for output_line in output.splitlines(keepends=True):
+                yield ('exec_output', output_line)
+            exit_code = event.get('exit_code')
+            if exit_code:
+                yield ('exec_output', f'exit code {exit_code}\n')
+        
+        elif event_type == 'patch_apply_begin':
+            yield ('title', 'File Update')
+            for path, change in (event.get('changes') or {}).items():
+                kind = next(iter(change), '') if isinstance(change, dict) else ''
+                yield ('file_update', f'{kind} {path}\n')
+        
+        elif event_type == 'mcp_tool_call_begin':
+            invocation = event.get('invocation', {})
+            yield ('title', 'Run')
+            yield ('exec', f"{invocation.get('server', '')}.{invocation.get('tool', '')}\n")
+        
+        elif event_type == 'web_search_end':
+            yield ('title', 'Run')
+            yield ('exec', f"web_search: {event.get('query', '')}\n")
+        
+        elif event_type == 'token_count':
+            usage = (event.get('info') or {}).get('total_token_usage') or {}
+            if usage.get('total_tokens'):
+                state['tokens_used'] = usage['total_tokens']
+        
+        elif event_type == 'stream_error':
+            yield ('title', 'Error')
+            yield ('error', event.get('message', '') + '\n')
+        
+        elif event_type == 'task_complete':
+            if state['tokens_used']:
+                yield ('tokens_used', str(state['tokens_used']))
+    
+    def _serialize_json_item(self, state: Dict[str, Any], event_type: str, item: Dict[str, Any]) -> Iterator[Tuple[str, str]]:
+        """Map a started/completed thread item to (tag, data) events"""
+        item_type = item.get('type', '')
+        item_id = item.get('id', '')
+        
+        if item_type == 'command_execution':
+            if event_type == 'item.started':
+                state['exec_started'][item_id] = time.monotonic()
                 yield ('title', 'Run')
-                continue
-            elif trimmed_line in ('kori', 'codex'):
-                output_tag = 'agent'
-                yield ('title', 'Agent')
-                continue
-            elif trimmed_line == 'file update:':
-                output_tag = 'file_update'
-                yield ('title', 'File Update')
-                continue
-            elif trimmed_line == 'tokens used':
-                output_tag = 'tokens_used'
-                continue
-            elif trimmed_line == 'non zero exit code':
-                output_tag = 'error'
-                yield ('title', 'Error')
-                continue
-                
-            
-            # Handle metadata delimiters
-            if not meta_done and re.match(r'^[-]{3,}$', trimmed_line):
-                if output_tag != 'meta':
-                    output_tag = 'meta'
-                else:
-                    output_tag = None
-                    meta_done = True
-                    yield ('meta', json.dumps(meta_dict))
-                continue
+                yield ('exec', item.get('command', '') + '\n')
+                return
             
-            # Process content based on current tag
-            if output_tag == 'meta':
-                colon_index = line.find(':')
-                if colon_index != -1:
-                    key = line[:colon_index].strip().replace(' ', '_')
-                    value = line[colon_index + 1:].strip()
-                    meta_dict[key] = value
-            elif output_tag == 'exec':
-                # Match exec completion pattern
-                exec_match = re.match(
-                    r'^(.*) succeeded in ([0-9.,]+ms)(:)?(\s)*$',
-                    line
-                )
-                if exec_match:
-                    yield ('exec', exec_match.group(1) + '\n')
-                    yield ('exec_time', exec_match.group(2))
-                else:
-                    yield ('exec_output', line)
-            elif output_tag == 'tokens_used':
-                yield ('tokens_used', trimmed_line.replace(',', ''))
-            elif output_tag is not None:
-                yield (output_tag, line)
+            started_at = state['exec_started'].pop(item_id, None)
+            if started_at is None:
+                yield ('title', 'Run')
+                yield ('exec', item.get('command', '') + '\n')
+            else:
+                yield ('exec_time', f'{(time.monotonic() - started_at) * 1000:.0f}ms')
+            for output_line in item.get('aggregated_output', '').splitlines(keepends=True):
+                yield ('exec_output', output_line)
+            exit_code = item.get('exit_code')
+            if exit_code:
+                yield ('exec_output', f'exit code {exit_code}\n')
+            return
         
-        yield ('done', '')
+        # Every other item type is only reported once it is complete
+        if event_type != 'item.completed':
+            return
+        
+        if item_type == 'reasoning':
+            yield ('title', 'Thinking')
+            yield ('thinking', item.get('text', '') + '\n')
+        elif item_type == 'agent_message':
+            yield ('title', 'Agent')
+            yield ('agent', item.get('text', '') + '\n')
+        elif item_type == 'file_change':
+            yield ('title', 'File Update')
+            for change in item.get('changes', []):
+                yield ('file_update', f"{change.get('kind', '')} {change.get('path', '')}\n")
+        elif item_type == 'mcp_tool_call':
+            yield ('title', 'Run')
+            yield ('exec', f"{item.get('server', '')}.{item.get('tool', '')}\n")
+            yield ('exec_output', f"{item.get('status', '')}\n")
+        elif item_type == 'web_search':
+            yield ('title', 'Run')
+            yield ('exec', f"web_search: {item.get('query', '')}\n")
+        elif item_type == 'todo_list':
+            yield ('title', 'Thinking')
+            for todo in item.get('items', []):
+                mark = 'x' if todo.get('completed') else ' '
+                yield ('thinking', f"[{mark}] {todo.get('text', '')}\n")
+        elif item_type == 'error':
+            yield ('title', 'Error')
+            yield ('error', item.get('message', '') + '\n')
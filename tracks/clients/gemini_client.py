@@ -1,18 +1,116 @@
-from typing import Optional, Generator, Tuple, Dict, Any, List
+from typing import Optional, Generator, AsyncGenerator, Iterator, Tuple, Dict, Any, List, NamedTuple, Union, Set
 
 import subprocess
 import os
 import json
 import uuid
-import shutil
 from pathlib import Path
 
 from tracks.config import settings
 from tracks.vault import vault
 from tracks.secret import secret
+from tracks.clients.pty_process import AsyncPtyProcess
+from tracks.clients.output_buffer import LineSplitter, TranscriptBuffer
+from tracks.clients.profile_cache import ChildEnv, write_if_changed
+from tracks.clients.gemini_session import SessionCompactor, SessionWriter
 
 OUTPUT_TAG_STDOUT = 0
 OUTPUT_TAG_STDERR = 1
+# Parsed stream-json event, the item is a GeminiEvent instead of a line
+OUTPUT_TAG_EVENT = 2
+
+
+class GeminiEvent(NamedTuple):
+    """One stream-json event, parsed once by the reader"""
+    type: str
+    data: Dict[str, Any]
+    line: str
+
+
+def parse_event(line: str) -> Optional[GeminiEvent]:
+    """Parse a stdout line into a GeminiEvent, or None if it is not a JSON object"""
+    trimmed_line = line.strip()
+    if not trimmed_line.startswith('{'):
+        return None
+    try:
+        data = json.loads(trimmed_line)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    return GeminiEvent(data.get('type', 'unknown'), data, trimmed_line)
+
+
+# Entries of the real home the Gemini CLI needs in a run HOME besides .gemini:
+# npm registry config for the MCP servers it starts, gcloud ADC for Vertex AI auth
+GEMINI_HOME_LINKS = ('.npmrc', os.path.join('.config', 'gcloud'))
+
+# Run HOMEs prepared by this process
+_prepared_homes: Set[str] = set()
+
+
+def gemini_run_home(profile_id: str) -> str:
+    """HOME directory used for Gemini runs of a profile"""
+    return os.path.join(settings.STORAGE_PATH, 'gemini_run_homes', profile_id)
+
+
+def _link(target: str, link: str):
+    """Point link at target, replacing a link that points elsewhere"""
+    if os.path.islink(link):
+        if os.readlink(link) == target:
+            return
+        os.remove(link)
+    elif os.path.lexists(link):
+        return
+    os.makedirs(os.path.dirname(link), exist_ok=True)
+    os.symlink(target, link)
+
+
+def prepare_gemini_home(profile_id: str) -> str:
+    """
+    Create the per-profile HOME whose .gemini links to the profile's config dir
+    
+    The Gemini CLI always reads ~/.gemini, so every profile gets its own HOME
+    under STORAGE_PATH instead of re-pointing the real ~/.gemini before each
+    run. Only GEMINI_HOME_LINKS are linked in from the real home, the agent
+    doesn't see the rest of its dotfiles and credentials. Nothing outside
+    STORAGE_PATH is modified, so runs on different profiles can execute in
+    parallel. A HOME is prepared once per process.
+    
+    Returns:
+        str: The HOME directory to pass to the child
+    """
+    home_dir = gemini_run_home(profile_id)
+    if home_dir in _prepared_homes:
+        return home_dir
+    
+    config_dir = os.path.join(settings.STORAGE_PATH, 'gemini_homes', profile_id)
+    os.makedirs(config_dir, exist_ok=True)
+    os.makedirs(home_dir, exist_ok=True)
+    try:
+        _link(config_dir, os.path.join(home_dir, '.gemini'))
+    except OSError as e:
+        print(f'[gemini] Warning: Failed to link gemini config dir: {e}')
+        return home_dir
+    
+    real_home = os.path.expanduser('~')
+    if os.path.isdir(real_home) and os.path.realpath(real_home) != os.path.realpath(home_dir):
+        wanted = {os.path.join(home_dir, name): os.path.join(real_home, name) for name in GEMINI_HOME_LINKS}
+        # Drop links into the real home that earlier versions made for every entry
+        homes = {real_home, os.path.realpath(real_home)}
+        for name in os.listdir(home_dir):
+            link = os.path.join(home_dir, name)
+            if os.path.islink(link) and link not in wanted and os.path.dirname(os.readlink(link)) in homes:
+                os.remove(link)
+        for link, target in wanted.items():
+            if os.path.exists(target):
+                try:
+                    _link(target, link)
+                except OSError as e:
+                    print(f'[gemini] Warning: Failed to link {target}: {e}')
+    
+    _prepared_homes.add(home_dir)
+    return home_dir
 
 
 class GeminiClient:
@@ -40,6 +138,9 @@ class GeminiClient:
 
         self.profile_id = profile_id
         
+        # Child environment, built on first spawn
+        self._child_env = ChildEnv(self._compose_env)
+        
         # Setup config file (for compatibility, may be customized later)
         self._setup_config()
     
@@ -74,10 +175,8 @@ class GeminiClient:
             
             # Write to settings.json
             settings_path = os.path.join(gemini_dir, 'settings.json')
-            with open(settings_path, 'w') as f:
-                f.write(settings_content)
-            
-            print(f'[gemini] Settings written to: {settings_path}')
+            if write_if_changed(settings_path, settings_content):
+                print(f'[gemini] Settings written to: {settings_path}')
             
         except FileNotFoundError:
             # Settings template not found, skip
@@ -120,50 +219,23 @@ class GeminiClient:
             f.write(json.dumps(event) + '\n')
     
     def _read_session_history(self, session_id: str) -> str:
-        """Read the session history as a string"""
+        """Read the token-budgeted session history to replay on stdin"""
         session_path = self._get_session_path(session_id)
         if session_path.exists():
-            return session_path.read_text()
+            return SessionCompactor(session_path).replay()
         return ''
     
-    def exec_prompt(
-        self,
-        prompt: str,
-        session_id: Optional[str] = None,
-        skip_git_repo_check: bool = False,
-        allow_edit: bool = False,
-        cwd: Optional[str] = None,
-        model: Optional[str] = None
-    ) -> Generator[Tuple[int, str], None, None]:
+    def _prepare_run(self, prompt: str, session_id: Optional[str]) -> Tuple[str, str]:
         """
-        Execute a prompt using gemini CLI with PTY for unbuffered streaming
+        Record the user prompt in the session and link the profile's config dir
         
-        Args:
-            prompt: The prompt to execute
-            session_id: Session ID for resuming. If provided, history is loaded from
-                       cache/gemini/sessions/{session_id}.jsonl
-            skip_git_repo_check: Skip git repo check (not used in Gemini)
-            allow_edit: Allow dangerous edits (uses --yolo flag)
-            cwd: Working directory
-            model: Model to use (e.g., 'gemini-2.5-pro', 'gemini-2.5-flash')
-            
-        Yields:
-            Tuple[int, str]: (tag, line) tuples where tag is OUTPUT_TAG_STDOUT or OUTPUT_TAG_STDERR
+        Returns:
+            Tuple[str, str]: (session_id, session history to feed on stdin)
         """
-        import pty
-        import select
-        
-        # Use instance cwd as default if not provided
-        if cwd is None:
-            cwd = self.cwd
-        
         # Create new session if not provided
         if session_id is None:
             session_id = self.create_session()
         
-        # Store current session_id in instance for serialize_output to access
-        self.current_session_id = session_id
-        
         # Append user message to session
         user_message_event = {
             'type': 'message',
@@ -175,27 +247,14 @@ class GeminiClient:
         
         # Read session history for stdin
         session_history = self._read_session_history(session_id)
-        
-        # Yield synthetic init event with our session_id
-        init_event = json.dumps({'type': 'init', 'session_id': session_id})
-        yield (OUTPUT_TAG_STDOUT, init_event + '\n')
 
-        # Symlink config dir for Gemini - GEMINI_CONFIG_DIR IS NOT RESPECTED
-        symlink_failed = False
-        actual_gemini_home_path = os.path.join(settings.STORAGE_PATH, "gemini_homes", self.profile_id)
-        os.makedirs(actual_gemini_home_path, exist_ok=True)
-        gemini_config_path = str(Path.home() / ".gemini")
-        if os.path.exists(gemini_config_path):
-            shutil.rmtree(gemini_config_path)
-        try:
-            os.symlink(actual_gemini_home_path, gemini_config_path)
-        except Exception as e:
-            print(f'[gemini] Warning: Failed to symlink gemini config dir: {e}')
-            symlink_failed = True
-            shutil.copytree(actual_gemini_home_path, gemini_config_path)
-            # TODO: Copy back after Gemini exits
+        # Give this profile its own HOME, the child gets it through _build_env
+        prepare_gemini_home(self.profile_id)
         
-        # Build command - use stdin for history
+        return session_id, session_history
+    
+    def _build_command(self, prompt: str, session_id: str, allow_edit: bool = False, model: Optional[str] = None) -> List[str]:
+        """Build the gemini command line - history is fed via stdin"""
         cmd = [self.binary_path, '--prompt', prompt, '--output-format', 'stream-json']
         
         # Gemini doesn't have skip_git_repo_check equivalent
@@ -210,45 +269,22 @@ class GeminiClient:
         print(f'[gemini] Spawning: {" ".join(cmd)}')
         print(f'[gemini] Session ID: {session_id}')
         print(f'[gemini] Binary path: {self.binary_path}')
-        
-        # Prepare environment with unbuffered output
+        return cmd
+    
+    def _build_env(self) -> Dict[str, str]:
+        """Return the cached child environment, rebuilt when settings, vault or secrets change"""
+        return self._child_env.get()
+    
+    def _compose_env(self) -> Dict[str, str]:
+        """Prepare the child environment with unbuffered output, vault and secrets"""
         env = os.environ.copy()
         env['PYTHONUNBUFFERED'] = '1'
         env['TERM'] = 'dumb'  # Simple terminal to avoid escape sequences
-        # env['GEMINI_CONFIG_DIR'] = os.path.join(settings.STORAGE_PATH, "agent_configs", "gemini")
+        # GEMINI_CONFIG_DIR is not respected, ~/.gemini is found through HOME
+        env['HOME'] = gemini_run_home(self.profile_id)
         env['AGENT_HOME_PATH'] = settings.AGENT_HOME_PATH
         env['API_KEY'] = settings.API_KEY
 
-        # Add Google Auth Secrets to environment
-        if secret.get("GOOGLE_OAUTH_TOKEN"):
-            env["GOOGLE_OAUTH_TOKEN"] = secret.get("GOOGLE_OAUTH_TOKEN")
-        if secret.get("GOOGLE_OAUTH_REFRESH_TOKEN"):
-            env["GOOGLE_OAUTH_REFRESH_TOKEN"] = secret.get("GOOGLE_OAUTH_REFRESH_TOKEN")
-
-        # Add Instagram Auth Secrets to environment
-        if secret.get("INSTAGRAM_CLIENT_ID"):
-            env["INSTAGRAM_CLIENT_ID"] = secret.get("INSTAGRAM_CLIENT_ID")
-        if secret.get("INSTAGRAM_CLIENT_SECRET"):
-            env["INSTAGRAM_CLIENT_SECRET"] = secret.get("INSTAGRAM_CLIENT_SECRET")
-
-        # Add Twitter Auth Secrets to environment
-        if secret.get("TWITTER_CLIENT_ID"):
-            env["TWITTER_CLIENT_ID"] = secret.get("TWITTER_CLIENT_ID")
-        if secret.get("TWITTER_CLIENT_SECRET"):
-            env["TWITTER_CLIENT_SECRET"] = secret.get("TWITTER_CLIENT_SECRET")
-
-        # Add SmartThings Auth Secrets to environment
-        if secret.get("SMARTTHINGS_CLIENT_ID"):
-            env["SMARTTHINGS_CLIENT_ID"] = secret.get("SMARTTHINGS_CLIENT_ID")
-        if secret.get("SMARTTHINGS_CLIENT_SECRET"):
-            env["SMARTTHINGS_CLIENT_SECRET"] = secret.get("SMARTTHINGS_CLIENT_SECRET")
-
-        # Add YouTube Auth Secrets to environment
-        if secret.get("YOUTUBE_CLIENT_ID"):
-            env["YOUTUBE_CLIENT_ID"] = secret.get("YOUTUBE_CLIENT_ID")
-        if secret.get("YOUTUBE_CLIENT_SECRET"):
-            env["YOUTUBE_CLIENT_SECRET"] = secret.get("YOUTUBE_CLIENT_SECRET")
-
         # Add vault variables to environment
         for key, value in vault.to_dict().items():
             env[key] = value
@@ -256,6 +292,61 @@ class GeminiClient:
         # Add secret variables to environment
         for key, value in secret.to_dict().items():
             env[key] = value
+        
+        return env
+    
+    def _route_stdout_line(self, writer: SessionWriter, line: str) -> Tuple[int, Union[str, GeminiEvent]]:
+        """Parse a stdout line once, record it in the session and tag it for the serializer"""
+        event = parse_event(line)
+        if event is None:
+            return (OUTPUT_TAG_STDOUT, line)
+        writer.write_line(event.line)
+        return (OUTPUT_TAG_EVENT, event)
+    
+    def _init_event(self, session_id: str) -> Tuple[int, GeminiEvent]:
+        """Synthetic init event carrying our session_id (not recorded in the session)"""
+        data = {'type': 'init', 'session_id': session_id}
+        return (OUTPUT_TAG_EVENT, GeminiEvent('init', data, json.dumps(data)))
+    
+    def exec_prompt(
+        self,
+        prompt: str,
+        session_id: Optional[str] = None,
+        skip_git_repo_check: bool = False,
+        allow_edit: bool = False,
+        cwd: Optional[str] = None,
+        model: Optional[str] = None
+    ) -> Generator[Tuple[int, str], None, None]:
+        """
+        Execute a prompt using gemini CLI with PTY for unbuffered streaming
+        
+        Args:
+            prompt: The prompt to execute
+            session_id: Session ID for resuming. If provided, history is loaded from
+                       cache/gemini/sessions/{session_id}.jsonl
+            skip_git_repo_check: Skip git repo check (not used in Gemini)
+            allow_edit: Allow dangerous edits (uses --yolo flag)
+            cwd: Working directory
+            model: Model to use (e.g., 'gemini-2.5-pro', 'gemini-2.5-flash')
+            
+        Yields:
+            Tuple[int, Union[str, GeminiEvent]]: (tag, item) tuples, a GeminiEvent for OUTPUT_TAG_EVENT
+            and a raw line for OUTPUT_TAG_STDOUT or OUTPUT_TAG_STDERR
+        """
+        import pty
+        import select
+        
+        # Use instance cwd as default if not provided
+        if cwd is None:
+            cwd = self.cwd
+        
+        session_id, session_history = self._prepare_run(prompt, session_id)
+        
+        # Yield synthetic init event with our session_id
+        yield self._init_event(session_id)
+        
+        cmd = self._build_command(prompt, session_id, allow_edit, model)
+        env = self._build_env()
 
         # Create PTY for stdout (forces line buffering in child process)
         master_fd, slave_fd = pty.openpty()
@@ -285,6 +376,13 @@ class GeminiClient:
         except:
             pass
         
+        # Keep a bounded transcript for debug printing on failure
+        full_stdout = TranscriptBuffer()
+        full_stderr = TranscriptBuffer()
+        
+        # One buffered handle for all events of this run
+        writer = SessionWriter(self._get_session_path(session_id))
+        
         try:
             import fcntl
             
@@ -295,12 +393,8 @@ class GeminiClient:
             flags_err = fcntl.fcntl(proc.stderr, fcntl.F_GETFL)
             fcntl.fcntl(proc.stderr, fcntl.F_SETFL, flags_err | os.O_NONBLOCK)
             
-            stdout_buffer = b''
-            stderr_buffer = b''
-            
-            # Accumulate full logs for debug printing on failure
-            full_stdout = b''
-            full_stderr = b''
+            stdout_lines = LineSplitter()
+            stderr_lines = LineSplitter()
             
             while True:
                 # Check if process has finished
@@ -308,18 +402,22 @@ class GeminiClient:
                     # Read any remaining data
                     try:
                         while True:
-                            remaining_out = os.read(master_fd, 4096)
+                            remaining_out = os.read(master_fd, 65536)
                             if not remaining_out:
                                 break
-                            stdout_buffer += remaining_out
-                            full_stdout += remaining_out
+                            full_stdout.write(remaining_out)
+                            for line in stdout_lines.feed(remaining_out):
+                                yield self._route_stdout_line(writer, line)
                     except (OSError, IOError):
                         pass
                     try:
-                        remaining_err = proc.stderr.read()
-                        if remaining_err:
-                            stderr_buffer += remaining_err
-                            full_stderr += remaining_err
+                        while True:
+                            remaining_err = proc.stderr.read(65536)
+                            if not remaining_err:
+                                break
+                            full_stderr.write(remaining_err)
+                            for line in stderr_lines.feed(remaining_err):
+                                yield (OUTPUT_TAG_STDERR, line)
                     except:
                         pass
                     break
@@ -333,78 +431,116 @@ class GeminiClient:
                 for stream in readable:
                     try:
                         if stream == master_fd:
-                            data = os.read(master_fd, 4096)
+                            data = os.read(master_fd, 65536)
                         else:
-                            data = stream.read(4096)
+                            data = stream.read(65536)
                         
                         if not data:
                             continue
                             
                         if stream == master_fd:
-                            stdout_buffer += data
-                            full_stdout += data
+                            full_stdout.write(data)
+                            # Process complete lines from stdout
+                            for line in stdout_lines.feed(data):
+                                yield self._route_stdout_line(writer, line)
                         else:
-                            stderr_buffer += data
-                            full_stderr += data
+                            full_stderr.write(data)
+                            # Process complete lines from stderr
+                            for line in stderr_lines.feed(data):
+                                yield (OUTPUT_TAG_STDERR, line)
                     except (OSError, IOError):
                         pass
-                
-                # Process complete lines from stdout
-                while b'\n' in stdout_buffer:
-                    line, stdout_buffer = stdout_buffer.split(b'\n', 1)
-                    decoded_line = line.decode('utf-8', errors='replace') + '\n'
-                    
-                    # Append to session file if it's valid JSON
-                    try:
-                        event = json.loads(decoded_line.strip())
-                        self._append_to_session(session_id, event)
-                    except json.JSONDecodeError:
-                        pass
-                    
-                    yield (OUTPUT_TAG_STDOUT, decoded_line)
-                
-                # Process complete lines from stderr
-                while b'\n' in stderr_buffer:
-                    line, stderr_buffer = stderr_buffer.split(b'\n', 1)
-                    yield (OUTPUT_TAG_STDERR, line.decode('utf-8', errors='replace') + '\n')
             
             # Yield any remaining buffered data
-            if stdout_buffer:
-                for line in stdout_buffer.decode('utf-8', errors='replace').splitlines(keepends=True):
-                    if line:
-                        # Append to session file if it's valid JSON
-                        try:
-                            event = json.loads(line.strip())
-                            self._append_to_session(session_id, event)
-                        except json.JSONDecodeError:
-                            pass
-                        yield (OUTPUT_TAG_STDOUT, line)
+            for line in stdout_lines.flush():
+                yield self._route_stdout_line(writer, line)
             
-            if stderr_buffer:
-                for line in stderr_buffer.decode('utf-8', errors='replace').splitlines(keepends=True):
-                    if line:
-                        yield (OUTPUT_TAG_STDERR, line)
+            for line in stderr_lines.flush():
+                yield (OUTPUT_TAG_STDERR, line)
             
             # Check for non-zero return code and print debug info
-            return_code = proc.poll()
-            if return_code is not None and return_code != 0:
-                print("\n" + "="*50)
-                print(f"Gemini exec ended with error (exit code: {return_code})")
-                print("="*50)
-                print("FULL STDOUT:")
-                print(full_stdout.decode('utf-8', errors='replace'))
-                print("-" * 30)
-                print("FULL STDERR:")
-                print(full_stderr.decode('utf-8', errors='replace'))
-                print("="*50 + "\n")
-                yield (OUTPUT_TAG_STDERR, f"Gemini exec ended with error (exit code: {return_code})\n")
-                yield (OUTPUT_TAG_STDERR, f"FULL STDOUT:\n{full_stdout.decode('utf-8', errors='replace')}\n")
+            yield from self._failure_output(proc.poll(), full_stdout, full_stderr)
 
         finally:
             # Ensure process is cleaned up
             os.close(master_fd)
             if proc.poll() is None:
                 proc.kill()
+            writer.close()
+            full_stdout.close()
+            full_stderr.close()
+    
+    def _failure_output(
+        self,
+        return_code: Optional[int],
+        full_stdout: TranscriptBuffer,
+        full_stderr: TranscriptBuffer
+    ) -> Iterator[Tuple[int, str]]:
+        """Print debug info and yield error lines for a non-zero exit code"""
+        if return_code is None or return_code == 0:
+            return
+        print("\n" + "="*50)
+        print(f"Gemini exec ended with error (exit code: {return_code})")
+        print("="*50)
+        print("FULL STDOUT:")
+        print(full_stdout.text())
+        print("-" * 30)
+        print("FULL STDERR:")
+        print(full_stderr.text())
+        print("="*50 + "\n")
+        yield (OUTPUT_TAG_STDERR, f"Gemini exec ended with error (exit code: {return_code})\n")
+        yield (OUTPUT_TAG_STDERR, f"FULL STDOUT:\n{full_stdout.text()}\n")
+    
+    async def aexec_prompt(
+        self,
+        prompt: str,
+        session_id: Optional[str] = None,
+        skip_git_repo_check: bool = False,
+        allow_edit: bool = False,
+        cwd: Optional[str] = None,
+        model: Optional[str] = None
+    ) -> AsyncGenerator[Tuple[int, str], None]:
+        """
+        Async version of exec_prompt that never blocks the event loop.
+        
+        Output is read through the running loop. Closing or cancelling the
+        generator kills the gemini process group.
+        
+        Yields:
+            Tuple[int, Union[str, GeminiEvent]]: (tag, item) tuples, a GeminiEvent for OUTPUT_TAG_EVENT
+            and a raw line for OUTPUT_TAG_STDOUT or OUTPUT_TAG_STDERR
+        """
+        if cwd is None:
+            cwd = self.cwd
+        
+        session_id, session_history = self._prepare_run(prompt, session_id)
+        
+        # Yield synthetic init event with our session_id
+        yield self._init_event(session_id)
+        
+        cmd = self._build_command(prompt, session_id, allow_edit, model)
+        process = AsyncPtyProcess(
+            cmd,
+            cwd=cwd,
+            env=self._build_env(),
+            stdin_data=session_history.encode('utf-8')
+        )
+        await process.start()
+        writer = SessionWriter(self._get_session_path(session_id))
+        
+        try:
+            async for tag, line in process.lines():
+                if tag == OUTPUT_TAG_STDOUT:
+                    yield self._route_stdout_line(writer, line)
+                else:
+                    yield (tag, line)
+            
+            for tag, line in self._failure_output(process.returncode, process.full_stdout, process.full_stderr):
+                yield (tag, line)
+        finally:
+            writer.close()
+            await process.close()
+            process.release()
     
     def _get_timestamp(self) -> str:
         """Get current timestamp in ISO format"""
@@ -413,7 +549,7 @@ class GeminiClient:
     
     def serialize_output(
         self,
-        output: Generator[Tuple[int, str], None, None]
+        output: Iterator[Tuple[int, str]]
     ) -> Generator[Tuple[str, str], None, None]:
         """
         Serialize raw output into structured events
@@ -432,95 +568,134 @@ class GeminiClient:
         Yields:
             Tuple[str, str]: (event_type, data) tuples compatible with CodexClient
         """
-        meta_dict = {}
-        meta_emitted = False
+        state = {'meta_dict': {}, 'meta_emitted': False}
         
         for tag, line in output:
-            trimmed_line = line.strip()
-            
-            # Skip empty lines
-            if not trimmed_line:
-                continue
+            yield from self._serialize_line(state, tag, line)
+        
+        yield ('done', '')
+    
+    async def aserialize_output(
+        self,
+        output: AsyncGenerator[Tuple[int, str], None]
+    ) -> AsyncGenerator[Tuple[str, str], None]:
+        """
+        Async version of serialize_output for use with aexec_prompt
+        
+        Args:
+            output: Raw output from aexec_prompt
             
-            # Handle stderr (non-JSON output)
-            if tag == OUTPUT_TAG_STDERR:
-                yield ('stderr', line)
-                continue
+        Yields:
+            Tuple[str, str]: (event_type, data) tuples compatible with CodexClient
+        """
+        state = {'meta_dict': {}, 'meta_emitted': False}
+        
+        try:
+            async for tag, line in output:
+                for event in self._serialize_line(state, tag, line):
+                    yield event
+        finally:
+            await output.aclose()
+        
+        yield ('done', '')
+    
+    def _serialize_line(self, state: Dict[str, Any], tag: int, line: Union[str, GeminiEvent]) -> Iterator[Tuple[str, str]]:
+        """Turn one raw output item into zero or more structured events"""
+        # Events parsed by the reader
+        if tag == OUTPUT_TAG_EVENT:
+            yield from self._serialize_event(state, line.type, line.data, line.line)
+            return
+        
+        trimmed_line = line.strip()
+        
+        # Skip empty lines
+        if not trimmed_line:
+            return
+        
+        # Handle stderr (non-JSON output)
+        if tag == OUTPUT_TAG_STDERR:
+            yield ('stderr', line)
+            return
+        
+        # Handle stdout - JSON events here only come from callers feeding raw lines
+        event = parse_event(line)
+        if event is not None:
+            yield from self._serialize_event(state, event.type, event.data, event.line)
+            return
+        try:
+            json.loads(trimmed_line)
+        except json.JSONDecodeError:
+            # Non-JSON output from stdout, treat as raw output
+            yield ('stdout', line)
+            return
+        # JSON that isn't an event object (array, number, string), passed through like unknown events
+        yield ('raw', trimmed_line + '\n')
+    
+    def _serialize_event(self, state: Dict[str, Any], event_type: str, event: Dict[str, Any], event_line: str) -> Iterator[Tuple[str, str]]:
+        """Map one stream-json event to (tag, data) events"""
+        if event_type == 'init':
+            # Only emit meta once (from our synthetic init event)
+            # Gemini CLI also emits init event, but we keep our session_id
+            if not state['meta_emitted']:
+                state['meta_dict']['session_id'] = event.get('session_id', '')
+                state['meta_dict']['model'] = event.get('model', '')
+                yield ('meta', json.dumps(state['meta_dict']))
+                state['meta_emitted'] = True
+            else:
+                # From Gemini CLI's init, only update model info if present
+                gemini_model = event.get('model', '')
+                if gemini_model:
+                    state['meta_dict']['model'] = gemini_model
+        
+        elif event_type == 'message':
+            role = event.get('role', '')
+            content = event.get('content', '')
             
-            # Handle stdout - should be JSONL from stream-json format
-            try:
-                event = json.loads(trimmed_line)
-                event_type = event.get('type', 'unknown')
-                
-                if event_type == 'init':
-                    # Only emit meta once (from our synthetic init event)
-                    # Gemini CLI also emits init event, but we keep our session_id
-                    if not meta_emitted:
-                        meta_dict['session_id'] = event.get('session_id', '')
-                        meta_dict['model'] = event.get('model', '')
-                        yield ('meta', json.dumps(meta_dict))
-                        meta_emitted = True
-                    else:
-                        # From Gemini CLI's init, only update model info if present
-                        gemini_model = event.get('model', '')
-                        if gemini_model:
-                            meta_dict['model'] = gemini_model
-                
-                elif event_type == 'message':
-                    role = event.get('role', '')
-                    content = event.get('content', '')
-                    
-                    if role == 'user':
-                        yield ('title', 'User')
-                        yield ('user', content + '\n')
-                    elif role == 'assistant':
-                        # Check if this is a delta (streaming) or complete message
-                        is_delta = event.get('delta', False)
-                        if is_delta:
-                            yield ('stdout', content)
-                        else:
-                            yield ('title', 'Stdout')
-                            yield ('stdout', content + '\n')
-                
-                elif event_type == 'tool_use':
-                    tool_name = event.get('tool_name', 'unknown')
-                    tool_id = event.get('tool_id', '')
-                    parameters = event.get('parameters', {})
-                    
-                    yield ('title', 'Run')
-                    yield ('exec', f'{tool_name}: {json.dumps(parameters)}\n')
-                
-                elif event_type == 'tool_result':
-                    tool_id = event.get('tool_id', '')
-                    status = event.get('status', '')
-                    output_text = event.get('output', '')
-                    
-                    if status == 'success':
-                        yield ('exec_output', output_text + '\n')
-                    else:
-                        yield ('exec_error', output_text + '\n')
-                
-                elif event_type == 'error':
-                    error_msg = event.get('message', str(event))
-                    yield ('error', error_msg + '\n')
-                
-                elif event_type == 'result':
-                    # Final result with stats
-                    stats = event.get('stats', {})
-                    
-                    # Extract token usage if available
-                    total_tokens = stats.get('total_tokens', 0)
-                    if total_tokens:
-                        yield ('tokens_used', str(total_tokens))
-                    
-                    # Status is not yielded to avoid printing "success" in output
-                
+            if role == 'user':
+                yield ('title', 'User')
+                yield ('user', content + '\n')
+            elif role == 'assistant':
+                # Check if this is a delta (streaming) or complete message
+                is_delta = event.get('delta', False)
+                if is_delta:
+                    yield ('stdout', content)
                 else:
-                    # Unknown event type, pass through as raw
-                    yield ('raw', json.dumps(event) + '\n')
-                    
-            except json.JSONDecodeError:
-                # Non-JSON output from stdout, treat as raw output
-                yield ('stdout', line)
+                    yield ('title', 'Stdout')
+                    yield ('stdout', content + '\n')
         
-        yield ('done', '')
+        elif event_type == 'tool_use':
+            tool_name = event.get('tool_name', 'unknown')
+            tool_id = event.get('tool_id', '')
+            parameters = event.get('parameters', {})
+            
+            yield ('title', 'Run')
+            yield ('exec', f'{tool_name}: {json.dumps(parameters)}\n')
+        
+        elif event_type == 'tool_result':
+            tool_id = event.get('tool_id', '')
+            status = event.get('status', '')
+            output_text = event.get('output', '')
+            
+            if status == 'success':
+                yield ('exec_output', output_text + '\n')
+            else:
+                yield ('exec_error', output_text + '\n')
+        
+        elif event_type == 'error':
+            error_msg = event.get('message', str(event))
+            yield ('error', error_msg + '\n')
+        
+        elif event_type == 'result':
+            # Final result with stats
+            stats = event.get('stats', {})
+            
+            # Extract token usage if available
+            total_tokens = stats.get('total_tokens', 0)
+            if total_tokens:
+                yield ('tokens_used', str(total_tokens))
+            
+            # Status is not yielded to avoid printing "success" in output
+        
+        else:
+            # Unknown event type, pass through as raw
+            yield ('raw', event_line + '\n')
@@ -0,0 +1,251 @@
+"""
+Compact, token-budgeted replay of Gemini session logs.
+
+The raw `gemini_sessions/<id>.jsonl` keeps every stream-json event of every
+turn. SessionCompactor folds new raw events into `<id>.compact.jsonl`:
+assistant deltas are merged into one message, duplicate prompt echoes and
+init/result bookkeeping are dropped. `<id>.compact.json` records how far the
+raw log has been folded and where each turn starts, so every update only reads
+what was appended since the previous turn.
+
+replay() then builds the stdin payload from the newest turns backwards:
+the last GEMINI_REPLAY_VERBATIM_TURNS turns are sent as they are, older turns
+with their tool results collapsed, and turns that no longer fit in
+GEMINI_REPLAY_TOKEN_BUDGET are dropped.
+"""
+
+from typing import Optional, List, Dict, Any
+
+import os
+import json
+import time
+import tempfile
+from pathlib import Path
+
+from tracks.config import settings
+
+# Rough chars-per-token ratio used for budgeting
+CHARS_PER_TOKEN = 4
+
+# Events that carry no conversation content
+SKIPPED_EVENT_TYPES = ('init', 'result')
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def collapse_event(event: Dict[str, Any]) -> Dict[str, Any]:
+    """Shorten a bulky tool result, other events are returned unchanged"""
+    if event.get('type') != 'tool_result':
+        return event
+    output = event.get('output') or ''
+    keep = settings.GEMINI_TOOL_RESULT_COLLAPSE_CHARS
+    if len(output) <= keep:
+        return event
+    collapsed = dict(event)
+    collapsed['output'] = output[:keep] + f'\n[... {len(output) - keep} more characters omitted ...]'
+    return collapsed
+
+
+class SessionCompactor:
+    """Incrementally maintained compact form of one Gemini session log"""
+
+    def __init__(self, session_path: Path):
+        self.raw_path = Path(session_path)
+        session_id = self.raw_path.name[:-len('.jsonl')]
+        self.compact_path = self.raw_path.with_name(f'{session_id}.compact.jsonl')
+        self.state_path = self.raw_path.with_name(f'{session_id}.compact.json')
+
+    def _new_state(self) -> Dict[str, Any]:
+        return {
+            'raw_offset': 0,
+            'compact_size': 0,
+            # Per turn: sidecar byte offset, tokens as stored, tokens with tool results collapsed
+            'turns': [],
+            'last_user_content': None
+        }
+
+    def _load_state(self) -> Dict[str, Any]:
+        try:
+            with open(self.state_path, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return self._new_state()
+
+        # The sidecar must match the state exactly, otherwise rebuild from scratch
+        try:
+            raw_size = os.path.getsize(self.raw_path)
+            compact_size = os.path.getsize(self.compact_path)
+        except OSError:
+            return self._new_state()
+        if compact_size != state.get('compact_size') or raw_size < state.get('raw_offset', 0):
+            return self._new_state()
+        return state
+
+    def _save_state(self, state: Dict[str, Any]):
+        fd, temp_path = tempfile.mkstemp(prefix='.compact.', suffix='.tmp', dir=str(self.raw_path.parent))
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(state, f)
+            os.replace(temp_path, self.state_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def update(self) -> Dict[str, Any]:
+        """Fold raw events appended since the last update into the sidecar"""
+        state = self._load_state()
+        if not self.raw_path.exists():
+            return state
+
+        with open(self.raw_path, 'rb') as f:
+            f.seek(state['raw_offset'])
+            data = f.read()
+
+        # Only fold complete lines, a run may still be appending
+        end = data.rfind(b'\n') + 1
+        if end == 0:
+            return state
+
+        events: List[Dict[str, Any]] = []
+        pending_text: List[str] = []
+
+        def flush_assistant():
+            if pending_text:
+                events.append({'type': 'message', 'role': 'assistant', 'content': ''.join(pending_text)})
+                pending_text.clear()
+
+        for raw_line in data[:end].splitlines():
+            try:
+                event = json.loads(raw_line)
+            except ValueError:
+                continue
+            if not isinstance(event, dict):
+                continue
+            event_type = event.get('type')
+            if event_type in SKIPPED_EVENT_TYPES:
+                continue
+            if event_type == 'message' and event.get('role') == 'assistant':
+                pending_text.append(event.get('content') or '')
+                # A reply ends the turn, the same prompt next is a new turn, not an echo
+                state['last_user_content'] = None
+                continue
+            if event_type == 'message' and event.get('role') == 'user':
+                # The CLI echoes the prompt we already recorded
+                if event.get('content') == state['last_user_content']:
+                    continue
+                state['last_user_content'] = event.get('content')
+            else:
+                state['last_user_content'] = None
+            flush_assistant()
+            events.append(event)
+        flush_assistant()
+
+        with open(self.compact_path, 'r+b' if self.compact_path.exists() else 'wb') as f:
+            f.seek(state['compact_size'])
+            f.truncate()
+            offset = state['compact_size']
+            turns = state['turns']
+            for event in events:
+                line = json.dumps(event) + '\n'
+                encoded = line.encode('utf-8')
+                starts_turn = event.get('type') == 'message' and event.get('role') == 'user'
+                if starts_turn or not turns:
+                    turns.append([offset, 0, 0])
+                tokens = estimate_tokens(line)
+                collapsed = collapse_event(event)
+                turns[-1][1] += tokens
+                turns[-1][2] += tokens if collapsed is event else estimate_tokens(json.dumps(collapsed) + '\n')
+                f.write(encoded)
+                offset += len(encoded)
+
+        state['compact_size'] = offset
+        state['raw_offset'] += end
+        self._save_state(state)
+        return state
+
+    def replay(self, token_budget: Optional[int] = None, verbatim_turns: Optional[int] = None) -> str:
+        """Return the bounded JSONL history to feed the CLI on stdin"""
+        state = self.update()
+        turns = state['turns']
+        if not turns:
+            return ''
+        if token_budget is None:
+            token_budget = settings.GEMINI_REPLAY_TOKEN_BUDGET
+        if verbatim_turns is None:
+            verbatim_turns = settings.GEMINI_REPLAY_VERBATIM_TURNS
+
+        count = len(turns)
+        first_verbatim = max(count - verbatim_turns, 0)
+        used = 0
+        first = count
+        for index in range(count - 1, -1, -1):
+            verbatim = index >= first_verbatim
+            cost = turns[index][1] if verbatim else turns[index][2]
+            if not verbatim and used + cost > token_budget:
+                break
+            used += cost
+            first = index
+
+        start = turns[first][0] if first < count else state['compact_size']
+        with open(self.compact_path, 'rb') as f:
+            f.seek(start)
+            data = f.read(state['compact_size'] - start)
+
+        lines = []
+        if first > 0:
+            lines.append(json.dumps({
+                'type': 'message',
+                'role': 'system',
+                'content': f'[{first} earlier turns of this conversation were omitted to fit the context budget]'
+            }) + '\n')
+
+        # Older turns get their tool results collapsed
+        collapse_until = turns[first_verbatim][0] if first_verbatim < count else state['compact_size']
+        offset = start
+        for raw_line in data.splitlines(keepends=True):
+            if offset < collapse_until:
+                event = json.loads(raw_line)
+                collapsed = collapse_event(event)
+                lines.append(raw_line.decode('utf-8') if collapsed is event else json.dumps(collapsed) + '\n')
+            else:
+                lines.append(raw_line.decode('utf-8'))
+            offset += len(raw_line)
+        return ''.join(lines)
+
+
+class SessionWriter:
+    """
+    Buffered append handle for the events of one run.
+    
+    The session file is opened once per run. Writes are flushed at most every
+    GEMINI_SESSION_FLUSH_INTERVAL seconds (0 flushes every event) and on close;
+    GEMINI_SESSION_FSYNC additionally fsyncs on every flush.
+    """
+
+    def __init__(self, session_path: Path):
+        self._file = open(session_path, 'a', encoding='utf-8')
+        self._flush_interval = settings.GEMINI_SESSION_FLUSH_INTERVAL
+        self._fsync = settings.GEMINI_SESSION_FSYNC
+        self._last_flush = time.monotonic()
+
+    def write_line(self, line: str):
+        self._file.write(line + '\n')
+        if self._flush_interval <= 0 or time.monotonic() - self._last_flush >= self._flush_interval:
+            self.flush()
+
+    def flush(self):
+        self._file.flush()
+        if self._fsync:
+            os.fsync(self._file.fileno())
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        if self._file.closed:
+            return
+        try:
+            self.flush()
+        finally:
+            self._file.close()
@@ -0,0 +1,116 @@
+"""
+Output buffering helpers shared by the CLI readers.
+
+LineSplitter turns raw chunks into decoded lines without re-copying the
+unconsumed buffer on every line, and TranscriptBuffer keeps a bounded copy
+of everything a child printed for the failure report.
+"""
+
+from typing import List
+
+import tempfile
+
+# Keep at most this much of each stream for the failure transcript
+TRANSCRIPT_CAPACITY = 8 * 1024 * 1024
+
+# Transcript bytes held in memory before spilling to a temp file
+TRANSCRIPT_SPOOL_SIZE = 256 * 1024
+
+
+class LineSplitter:
+    """Incremental newline splitter with amortized O(n) cost per byte."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        # Position up to which the buffer is known to contain no newline
+        self._scanned = 0
+
+    def feed(self, data: bytes) -> List[str]:
+        """
+        Add a chunk and return every line it completes.
+
+        Returns:
+            List[str]: Decoded lines, each terminated with '\\n'
+        """
+        buffer = self._buffer
+        buffer += data
+
+        lines = []
+        start = 0
+        index = buffer.find(b'\n', self._scanned)
+        if index < 0:
+            self._scanned = len(buffer)
+            return lines
+
+        with memoryview(buffer) as view:
+            while index >= 0:
+                lines.append(str(view[start:index], 'utf-8', 'replace') + '\n')
+                start = index + 1
+                index = buffer.find(b'\n', start)
+
+        # Only the trailing partial line is moved
+        del buffer[:start]
+        self._scanned = len(buffer)
+        return lines
+
+    def flush(self) -> List[str]:
+        """Return whatever is left in the buffer once the stream has ended."""
+        if not self._buffer:
+            return []
+        remaining = self._buffer.decode('utf-8', errors='replace')
+        self._buffer = bytearray()
+        self._scanned = 0
+        return [line for line in remaining.splitlines(keepends=True) if line]
+
+
+class TranscriptBuffer:
+    """
+    Fixed-size ring buffer of the most recent output of a stream.
+
+    Data is stored in a SpooledTemporaryFile, so only the first
+    TRANSCRIPT_SPOOL_SIZE bytes live in memory and the rest spills to disk.
+    Once `capacity` bytes have been written the oldest bytes are overwritten.
+    """
+
+    def __init__(self, capacity: int = TRANSCRIPT_CAPACITY, spool_size: int = TRANSCRIPT_SPOOL_SIZE):
+        self.capacity = capacity
+        self.total_bytes = 0
+        self._file = tempfile.SpooledTemporaryFile(max_size=spool_size)
+        self._pos = 0
+        self._wrapped = False
+
+    def write(self, data: bytes):
+        self.total_bytes += len(data)
+        view = memoryview(data)
+        if len(view) > self.capacity:
+            # Only the newest `capacity` bytes can survive anyway
+            view = view[-self.capacity:]
+        while view:
+            count = min(len(view), self.capacity - self._pos)
+            self._file.seek(self._pos)
+            self._file.write(view[:count])
+            self._pos = (self._pos + count) % self.capacity
+            if self._pos == 0:
+                self._wrapped = True
+            view = view[count:]
+
+    def getvalue(self) -> bytes:
+        """Return the retained bytes in write order."""
+        if not self._wrapped:
+            self._file.seek(0)
+            return self._file.read(self._pos)
+        self._file.seek(self._pos)
+        older = self._file.read(self.capacity - self._pos)
+        self._file.seek(0)
+        return older + self._file.read(self._pos)
+
+    def text(self) -> str:
+        """Decode the retained bytes, noting how much was dropped."""
+        content = self.getvalue().decode('utf-8', errors='replace')
+        dropped = self.total_bytes - self.capacity
+        if self._wrapped and dropped > 0:
+            return f'[... {dropped} earlier bytes truncated ...]\n' + content
+        return content
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,87 @@
+"""
+Per-profile caches shared by the CLI clients.
+
+write_if_changed() materializes generated config files only when their
+content changes, and ChildEnv keeps the child process environment built
+once per client, rebuilding it only after settings, vault.json or the
+secrets change.
+"""
+
+from typing import Callable, Dict, Optional, Tuple
+
+import hashlib
+import threading
+
+from tracks.config import settings, _stat_signature
+from tracks.vault import vault
+from tracks.secret import secret
+
+# path -> (content digest, stat signature) of files written by write_if_changed
+_written: Dict[str, Tuple[str, Optional[Tuple[int, int, int]]]] = {}
+_written_lock = threading.Lock()
+
+
+def write_if_changed(path: str, content: str) -> bool:
+    """
+    Write content to path unless the file already holds exactly that content.
+
+    Returns:
+        bool: True if the file was (re)written
+    """
+    digest = hashlib.sha256(content.encode('utf-8')).hexdigest()
+    signature = _stat_signature(path)
+
+    with _written_lock:
+        if signature is not None and _written.get(path) == (digest, signature):
+            return False
+
+        if signature is not None:
+            # Not written by this process (or touched since), compare with what is on disk
+            with open(path, 'rb') as f:
+                if hashlib.sha256(f.read()).hexdigest() == digest:
+                    _written[path] = (digest, signature)
+                    return False
+
+        with open(path, 'w') as f:
+            f.write(content)
+        _written[path] = (digest, _stat_signature(path))
+        return True
+
+
+class ChildEnv:
+    """
+    Child process environment, built once and reused across runs.
+
+    The builder is called again only when the settings snapshot, the vault
+    file signature or the secrets object changes. The returned dict is
+    shared between runs and must not be mutated by callers.
+    """
+
+    def __init__(self, builder: Callable[[], Dict[str, str]]):
+        self._builder = builder
+        self._env: Optional[Dict[str, str]] = None
+        self._inputs = None
+        self._lock = threading.Lock()
+
+    def _current_inputs(self):
+        return (settings.current(), vault.signature(), secret.to_dict())
+
+    def _is_current(self, inputs) -> bool:
+        if self._inputs is None:
+            return False
+        old_settings, old_vault, old_secrets = self._inputs
+        new_settings, new_vault, new_secrets = inputs
+        return old_settings is new_settings and old_vault == new_vault and old_secrets is new_secrets
+
+    def get(self) -> Dict[str, str]:
+        inputs = self._current_inputs()
+        with self._lock:
+            if self._env is None or not self._is_current(inputs):
+                self._env = self._builder()
+                self._inputs = inputs
+            return self._env
+
+    def invalidate(self):
+        with self._lock:
+            self._env = None
+            self._inputs = None
@@ -0,0 +1,240 @@
+"""
+Asyncio process runner shared by the CLI clients.
+
+Runs a child with stdout attached to a PTY (forces line buffering in Node
+based CLIs) and stderr on a pipe. The PTY master is registered with the
+event loop via add_reader, so reading never blocks other coroutines.
+"""
+
+from typing import Optional, AsyncGenerator, Tuple, List, Dict
+
+import asyncio
+import os
+import pty
+import fcntl
+import signal
+
+from tracks.clients.output_buffer import LineSplitter, TranscriptBuffer
+
+OUTPUT_TAG_STDOUT = 0
+OUTPUT_TAG_STDERR = 1
+
+# Stop reading from the child while this many chunks are waiting to be consumed
+MAX_PENDING_CHUNKS = 32
+
+# How long to wait for stderr EOF after the child exits (grandchildren may hold it open)
+STDERR_DRAIN_TIMEOUT = 1.0
+
+
+class AsyncPtyProcess:
+    """Child process whose output is read through the running event loop."""
+
+    def __init__(self, cmd: List[str], cwd: str, env: Dict[str, str], stdin_data: Optional[bytes] = None):
+        self.cmd = cmd
+        self.cwd = cwd
+        self.env = env
+        self.stdin_data = stdin_data
+
+        self.proc: Optional[asyncio.subprocess.Process] = None
+        self.returncode: Optional[int] = None
+
+        # Keep a bounded transcript for debug printing on failure
+        self.full_stdout = TranscriptBuffer()
+        self.full_stderr = TranscriptBuffer()
+
+        self._master_fd: Optional[int] = None
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+        self._stdout_closed = False
+        self._stdout_paused = False
+        self._has_room = asyncio.Event()
+        self._has_room.set()
+
+    async def start(self):
+        """Spawn the child and start feeding its output into the queue."""
+        loop = asyncio.get_running_loop()
+        master_fd, slave_fd = pty.openpty()
+        try:
+            self.proc = await asyncio.create_subprocess_exec(
+                *self.cmd,
+                stdout=slave_fd,
+                stderr=asyncio.subprocess.PIPE,
+                stdin=asyncio.subprocess.PIPE if self.stdin_data is not None else asyncio.subprocess.DEVNULL,
+                cwd=self.cwd,
+                env=self.env,
+                start_new_session=True
+            )
+        except BaseException:
+            os.close(master_fd)
+            raise
+        finally:
+            # Close slave in parent
+            os.close(slave_fd)
+
+        self._master_fd = master_fd
+        flags = fcntl.fcntl(master_fd, fcntl.F_GETFL)
+        fcntl.fcntl(master_fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        loop.add_reader(master_fd, self._on_master_readable)
+
+        self._tasks.append(asyncio.create_task(self._read_stderr()))
+        self._tasks.append(asyncio.create_task(self._watch_exit()))
+        if self.stdin_data is not None:
+            self._tasks.append(asyncio.create_task(self._write_stdin()))
+
+    def _on_master_readable(self):
+        """Event loop callback: read whatever the PTY has for us."""
+        try:
+            data = os.read(self._master_fd, 65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            # EIO once every slave end is closed
+            data = b''
+        if data:
+            self._queue.put_nowait((OUTPUT_TAG_STDOUT, data))
+            if self._queue.qsize() >= MAX_PENDING_CHUNKS:
+                # Let the PTY fill up so the child blocks instead of our memory growing
+                asyncio.get_running_loop().remove_reader(self._master_fd)
+                self._stdout_paused = True
+        else:
+            self._close_stdout()
+
+    def _close_stdout(self):
+        if self._stdout_closed:
+            return
+        self._stdout_closed = True
+        if self._master_fd is not None and not self._stdout_paused:
+            asyncio.get_running_loop().remove_reader(self._master_fd)
+        self._queue.put_nowait((OUTPUT_TAG_STDOUT, None))
+
+    def _drain_master(self):
+        """Read remaining PTY output after the child has exited."""
+        while not self._stdout_closed:
+            try:
+                data = os.read(self._master_fd, 65536)
+            except OSError:
+                data = b''
+            if not data:
+                self._close_stdout()
+                break
+            self._queue.put_nowait((OUTPUT_TAG_STDOUT, data))
+
+    async def _read_stderr(self):
+        try:
+            while True:
+                await self._has_room.wait()
+                data = await self.proc.stderr.read(65536)
+                if not data:
+                    break
+                self._queue.put_nowait((OUTPUT_TAG_STDERR, data))
+                if self._queue.qsize() >= MAX_PENDING_CHUNKS:
+                    self._has_room.clear()
+        finally:
+            self._queue.put_nowait((OUTPUT_TAG_STDERR, None))
+
+    def _resume_reading(self):
+        """Re-enable reads that were paused because the queue was full."""
+        self._has_room.set()
+        if self._stdout_paused and not self._stdout_closed:
+            self._stdout_paused = False
+            asyncio.get_running_loop().add_reader(self._master_fd, self._on_master_readable)
+
+    async def _write_stdin(self):
+        try:
+            self.proc.stdin.write(self.stdin_data)
+            await self.proc.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            try:
+                self.proc.stdin.close()
+            except Exception:
+                pass
+
+    async def _watch_exit(self):
+        self.returncode = await self.proc.wait()
+        self._drain_master()
+
+    async def lines(self) -> AsyncGenerator[Tuple[int, str], None]:
+        """
+        Yield decoded output lines until both streams are closed.
+
+        Yields:
+            Tuple[int, str]: (tag, line) tuples where tag is OUTPUT_TAG_STDOUT or OUTPUT_TAG_STDERR
+        """
+        splitters = {OUTPUT_TAG_STDOUT: LineSplitter(), OUTPUT_TAG_STDERR: LineSplitter()}
+        open_streams = {OUTPUT_TAG_STDOUT, OUTPUT_TAG_STDERR}
+
+        try:
+            while open_streams:
+                if self.returncode is not None and open_streams == {OUTPUT_TAG_STDERR}:
+                    try:
+                        tag, data = await asyncio.wait_for(self._queue.get(), STDERR_DRAIN_TIMEOUT)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    tag, data = await self._queue.get()
+
+                if self._queue.qsize() < MAX_PENDING_CHUNKS:
+                    self._resume_reading()
+
+                if data is None:
+                    open_streams.discard(tag)
+                    continue
+
+                if tag == OUTPUT_TAG_STDOUT:
+                    self.full_stdout.write(data)
+                else:
+                    self.full_stderr.write(data)
+
+                # Process complete lines
+                for line in splitters[tag].feed(data):
+                    yield (tag, line)
+
+            # Yield any remaining buffered data
+            for tag in (OUTPUT_TAG_STDOUT, OUTPUT_TAG_STDERR):
+                for line in splitters[tag].flush():
+                    yield (tag, line)
+
+            if self.returncode is None:
+                self.returncode = await self.proc.wait()
+        finally:
+            await self.close()
+
+    async def close(self):
+        """
+        Kill the process group and release resources.
+
+        The group is killed even when the agent itself has exited, so the
+        processes it started (tools, dev servers) don't outlive the turn.
+        The transcripts stay readable until release() is called.
+        """
+        if self.proc is not None:
+            try:
+                os.killpg(self.proc.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+            if self.proc.returncode is None:
+                try:
+                    self.returncode = await self.proc.wait()
+                except asyncio.CancelledError:
+                    pass
+
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+        if self._master_fd is not None:
+            if not self._stdout_closed:
+                self._stdout_closed = True
+                try:
+                    asyncio.get_running_loop().remove_reader(self._master_fd)
+                except RuntimeError:
+                    pass
+            os.close(self._master_fd)
+            self._master_fd = None
+
+    def release(self):
+        """Discard the failure transcripts."""
+        self.full_stdout.close()
+        self.full_stderr.close()
@@ -1,8 +1,10 @@
 import os
 import json
+import asyncio
 import secrets
 import string
-from typing import Dict, Any
+import threading
+from typing import Dict, Any, Callable, Optional, Tuple
 
 from pydantic_settings import BaseSettings
 
@@ -39,6 +41,64 @@ class Settings(BaseSettings):
     # Standard agent integration settings
     AGENT_USE_ORDER: str = "codex,gemini"
     
+    # Codex output parsing: "text" scrapes the human-readable stream,
+    # "json" runs `codex exec --json` and maps its typed events
+    CODEX_OUTPUT_MODE: str = "text"
+    
+    # Keep one warm `codex mcp-server` per profile for in-process runs. Codex only:
+    # Gemini turns replay the compacted session file into a fresh `gemini -p`
+    # (see GEMINI_REPLAY_*), while its stdio mode (--experimental-acp) keeps the
+    # conversation inside the process, which a restart or profile switch would lose
+    ENABLE_AGENT_SESSIONS: bool = False
+    AGENT_SESSION_IDLE_TIMEOUT: int = 600
+    
+    # Gemini session replay: recent turns are sent verbatim, older ones with
+    # tool results collapsed while they fit in the token budget
+    GEMINI_REPLAY_TOKEN_BUDGET: int = 32000
+    GEMINI_REPLAY_VERBATIM_TURNS: int = 4
+    GEMINI_TOOL_RESULT_COLLAPSE_CHARS: int = 400
+    
+    # Gemini session log writes: flush interval in seconds (0 = every event), fsync on flush
+    GEMINI_SESSION_FLUSH_INTERVAL: float = 1.0
+    GEMINI_SESSION_FSYNC: bool = False
+    
+    # History log writes: "message" flushes every batch, "interval" every
+    # HISTORY_FLUSH_INTERVAL_MS, "run_end" also fsyncs when a run's answer is written
+    HISTORY_FLUSH_MODE: str = "message"
+    HISTORY_FLUSH_INTERVAL_MS: int = 200
+    
+    # Also index the text of agent output (exec, thinking, ...) for history search;
+    # applies to new messages, run `admin.py reindex` to cover older ones
+    HISTORY_SEARCH_INCLUDE_OUTPUT: bool = False
+    
+    # serialized_output storage: "compact" (coalesced events, integer tags) or "plain";
+    # compact outputs over HISTORY_OUTPUT_COMPRESS_MIN_BYTES are compressed with
+    # "auto" (zstd if installed, else gzip), "zstd", "gzip" or "none"
+    HISTORY_OUTPUT_ENCODING: str = "compact"
+    HISTORY_OUTPUT_COMPRESSION: str = "auto"
+    HISTORY_OUTPUT_COMPRESS_MIN_BYTES: int = 4096
+    
+    # Roll months of history/heartbeat logs into monthly zip archives this many days
+    # after they end (0 = never), and delete logs not written to for this many days
+    # (0 = keep forever); checked every HISTORY_ARCHIVE_INTERVAL_HOURS
+    HISTORY_ARCHIVE_AFTER_DAYS: int = 0
+    HISTORY_RETENTION_DAYS: int = 0
+    HEARTBEAT_RETENTION_DAYS: int = 0
+    HISTORY_ARCHIVE_INTERVAL_HOURS: int = 24
+    
+    # How often followed history logs (/follow streams) are checked for new messages, in seconds
+    HISTORY_FOLLOW_POLL_INTERVAL: float = 0.5
+    
+    # Compress JSON responses of at least this many bytes with brotli or gzip (0 = never)
+    HTTP_COMPRESSION_MIN_BYTES: int = 1024
+    
+    # Chat runs: events kept per run for clients that (re)attach, and how long finished runs stay attachable
+    RUN_EVENT_LOG_SIZE: int = 10000
+    RUN_RETENTION_SECONDS: int = 600
+    
+    # Events queued for a client watching a run before it has to catch up from the run's log
+    RUN_SUBSCRIBER_QUEUE_SIZE: int = 1000
+    
     # Timezone settings
     UTC_OFFSET: int = 9
     
@@ -97,9 +157,82 @@ def _load_config(config_path: str) -> Dict[str, Any]:
     return {}
 
 
+def _stat_signature(path: str) -> Optional[Tuple[int, int, int]]:
+    """Return (inode, size, mtime_ns) for a file, or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
 class SettingsProxy:
-    """Proxy to reload settings from config.json on every access."""
+    """
+    Proxy that serves a cached Settings snapshot.
+
+    config.json is only re-read and re-validated when its inode, size or mtime
+    changes. Subscribers registered with subscribe() are called with
+    (old_settings, new_settings) whenever a reload produces a new snapshot.
+    """
+    def __init__(self, config_path: Optional[str] = None):
+        object.__setattr__(self, "_config_path", config_path or from_root("config.json"))
+        object.__setattr__(self, "_snapshot", None)
+        object.__setattr__(self, "_signature", None)
+        object.__setattr__(self, "_subscribers", [])
+        object.__setattr__(self, "_lock", threading.RLock())
+
     def __getattr__(self, name: str) -> Any:
-        return getattr(get_settings(), name)
+        return getattr(self.current(), name)
+
+    def current(self) -> Settings:
+        """Return the current Settings snapshot, reloading it if config.json changed."""
+        signature = _stat_signature(self._config_path)
+        snapshot = self._snapshot
+        if snapshot is not None and signature == self._signature:
+            return snapshot
+        return self.reload()
+
+    def reload(self) -> Settings:
+        """Force a reload of config.json and notify subscribers if settings changed."""
+        with self._lock:
+            old = self._snapshot
+            new = get_settings()
+            # get_settings() may rewrite config.json (API_KEY rotation), so stat afterwards
+            object.__setattr__(self, "_signature", _stat_signature(self._config_path))
+            object.__setattr__(self, "_snapshot", new)
+            subscribers = list(self._subscribers)
+
+        if old is not None and old != new:
+            for callback in subscribers:
+                try:
+                    callback(old, new)
+                except Exception as e:
+                    print(f"[config] Settings subscriber failed: {e}")
+        return new
+
+    def subscribe(self, callback: Callable[[Settings, Settings], None]) -> Callable[[], None]:
+        """
+        Register a callback invoked with (old_settings, new_settings) on change.
+
+        Returns:
+            A function that removes the subscription.
+        """
+        with self._lock:
+            self._subscribers.append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+        return unsubscribe
+
+    async def watch(self, interval: float = 1.0):
+        """Poll config.json so subscribers are notified even when nothing reads settings."""
+        while True:
+            try:
+                self.current()
+            except Exception as e:
+                print(f"[config] Failed to reload settings: {e}")
+            await asyncio.sleep(interval)
 
 settings = SettingsProxy()
@@ -2,169 +2,130 @@
 Chat API endpoints.
 """
 
-import os
-import asyncio
-import json
-from datetime import datetime
-from fastapi import APIRouter
-from fastapi.responses import StreamingResponse
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query
 from sse_starlette.sse import EventSourceResponse
 from fastapi import Request
 
-from ..models import ChatRequest
-from ..services import history_service
-from ..services.heartbeat_service import heartbeat_state
-from ..services.client_service import client_state
-from ..config import settings
+from ..models import ChatRequest, RunInfo, RunListResponse
+from ..services.run_manager import run_manager, RunConflictError
 
 
 router = APIRouter(prefix="/api", tags=["chat"])
 
 
-async def chat_stream_generator(req: Request, message: str, session_id: str | None):
+def _get_run(run_id: str):
+    run = run_manager.get(run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    return run
+
+
+@router.post("/chat")
+async def chat(request: ChatRequest):
     """
-    Generate SSE events from Codex CLI streaming output.
+    Chat endpoint with Server-Sent Events streaming.
+    
+    Starts a run for the message and attaches to it. The run goes on if the
+    connection drops, reattach with /runs/{run_id}/events.
     
     Args:
-        req: FastAPI Request object for connection state
-        message: User message
-        session_id: Optional session ID for conversation continuity
+        request: Chat request with message and optional session_id
         
-    Yields:
-        SSE events with chat data
+    Returns:
+        EventSourceResponse with a "run" event carrying the run_id, then
+        "output" and "session" events and a final "done", "cancelled" or "failed"
     """
+    try:
+        run = run_manager.start(request.message, request.session_id)
+    except RunConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return EventSourceResponse(run.attach())
+
+
+@router.post("/runs", response_model=RunInfo)
+async def start_run(request: ChatRequest):
+    """
+    Start a chat run in the background without attaching to it.
     
-    # Mark on_demand as active (user is interacting)
-    await heartbeat_state.start_on_demand()
-    
-    client = client_state.get_client(cwd=settings.AGENT_HOME_PATH)
-    
-    # Save user message to history
-    user_timestamp = datetime.now()
-    
-    # Execute prompt with Codex CLI
-    prompt_message = message
-
-    cli_output = client.exec_prompt(
-        prompt_message,
-        session_id=session_id,
-        skip_git_repo_check=True,
-        allow_edit=True
-    )
+    Args:
+        request: Chat request with message and optional session_id
+        
+    Returns:
+        RunInfo of the new run
+    """
+    try:
+        run = run_manager.start(request.message, request.session_id)
+    except RunConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return run.info()
+
+
+@router.get("/runs", response_model=RunListResponse)
+async def list_runs(session_id: Optional[str] = None, active: bool = False):
+    """
+    List the chat runs in progress and recently finished.
     
-    # Serialize output
-    serialized = client.serialize_output(cli_output)
+    Args:
+        session_id: Only the runs of this conversation
+        active: Only the runs in progress
+        
+    Returns:
+        RunListResponse, oldest run first
+    """
+    return {"runs": [run.info() for run in run_manager.list(session_id, active)]}
+
+
+@router.get("/runs/{run_id}", response_model=RunInfo)
+async def get_run(run_id: str):
+    """
+    Get the status of a chat run.
     
-    current_session_id = session_id
-    agent_content = []
-    serialized_output = []  # Store all serialized output
-    metadata = None
+    Args:
+        run_id: Run ID
+        
+    Returns:
+        RunInfo
+    """
+    return _get_run(run_id).info()
+
+
+@router.get("/runs/{run_id}/events")
+async def attach_run(request: Request, run_id: str, after: int = Query(0, ge=0)):
+    """
+    Stream the events of a chat run as server-sent events.
     
-    try:
-        for tag, line in serialized:
-            # Check if client disconnected (e.g., clicked Stop)
-            if await req.is_disconnected():
-                print("[chat] Client disconnected. Aborting generation.", flush=True)
-                break
-                
-            # Store all serialized output
-            serialized_output.append({"tag": tag, "data": line})
-            
-            # Check for usage limits
-            switched = client_state.check_and_update_state([{"tag": tag, "data": line}])
-            if switched:
-                yield {
-                    "event": "output",
-                    "data": json.dumps({"tag": "error", "data": "Usage limit exceeded. Please start a new chat to use another available agent.\n\n"})
-                }
-            
-            # Stream all output tags
-            yield {
-                "event": "output",
-                "data": json.dumps({"tag": tag, "data": line})
-            }
-            # Force immediate transmission by yielding control to event loop
-            await asyncio.sleep(0)
-            
-            if tag == "meta":
-                # Extract session_id from metadata
-                try:
-                    meta = json.loads(line)
-                    current_session_id = meta.get("session_id", current_session_id)
-                    metadata = meta
-                    
-                    # Save user message now that we have session_id
-                    if current_session_id:
-                        history_service.save_message(
-                            session_id=current_session_id,
-                            role="user",
-                            content=message,
-                            timestamp=user_timestamp
-                        )
-                    
-                    # Send session info to client
-                    yield {
-                        "event": "session",
-                        "data": json.dumps({"session_id": current_session_id})
-                    }
-                    await asyncio.sleep(0)
-                except json.JSONDecodeError:
-                    pass
-                
-            elif tag == "agent":
-                # Accumulate agent response for history content
-                agent_content.append(line)
-                
-            elif tag == "done":
-                # Save assistant message to history
-                assistant_content = "".join(agent_content)
-                if current_session_id:
-                    history_service.save_message(
-                        session_id=current_session_id,
-                        role="assistant",
-                        content=assistant_content or "Complete",  # Fallback if no agent content
-                        serialized_output=serialized_output,
-                        metadata=metadata
-                    )
-                
-                # Send completion event
-                yield {
-                    "event": "done",
-                    "data": json.dumps({
-                        "session_id": current_session_id,
-                        "full_content": assistant_content
-                    })
-                }
-                await asyncio.sleep(0)
-    finally:
-        # Save assistant message to history if aborted and we have a session
-        if await req.is_disconnected() and current_session_id:
-            assistant_content = "".join(agent_content)
-            if assistant_content:
-                history_service.save_message(
-                    session_id=current_session_id,
-                    role="assistant",
-                    content=assistant_content + "\n\n[Stopped by user]",
-                    serialized_output=serialized_output,
-                    metadata=metadata
-                )
+    Args:
+        run_id: Run ID
+        after: Sequence number to resume after, the id of the last event received;
+            the Last-Event-ID header of a reconnect takes precedence
         
-        # Mark on_demand as complete (starts cooldown timer)
-        await heartbeat_state.end_on_demand()
+    Returns:
+        EventSourceResponse of the run's events from there on, with a "reset"
+        event first if some of them are no longer kept
+    """
+    run = _get_run(run_id)
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id:
+        try:
+            after = int(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+    return EventSourceResponse(run.attach(after))
 
 
-@router.post("/chat")
-async def chat(request: ChatRequest, req: Request):
+@router.post("/runs/{run_id}/cancel", response_model=RunInfo)
+async def cancel_run(run_id: str):
     """
-    Chat endpoint with Server-Sent Events streaming.
+    Stop a chat run and its agent process.
+    
+    The output so far is saved to the conversation, marked as stopped.
     
     Args:
-        request: Chat request with message and optional session_id
-        req: FastAPI Request object
+        run_id: Run ID
         
     Returns:
-        StreamingResponse with SSE events
+        RunInfo once the agent process has exited
     """
-    return EventSourceResponse(
-        chat_stream_generator(req, request.message, request.session_id)
-    )
+    run = await run_manager.cancel(_get_run(run_id))
+    return run.info()
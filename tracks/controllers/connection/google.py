@@ -75,19 +75,21 @@ def google_callback(request: Request, state: str = None, code: str = None):
         
     credentials = flow.credentials
     
-    if credentials.token:
-        vault.set("GOOGLE_OAUTH_TOKEN", credentials.token)
-    if credentials.refresh_token:
-        vault.set("GOOGLE_OAUTH_REFRESH_TOKEN", credentials.refresh_token)
-    
-    # Make sure we clean up the one-time state
-    vault.delete("GOOGLE_OAUTH_STATE")
+    with vault.transaction():
+        if credentials.token:
+            vault.set("GOOGLE_OAUTH_TOKEN", credentials.token)
+        if credentials.refresh_token:
+            vault.set("GOOGLE_OAUTH_REFRESH_TOKEN", credentials.refresh_token)
+        
+        # Make sure we clean up the one-time state
+        vault.delete("GOOGLE_OAUTH_STATE")
         
     # Redirect user back to connections page on frontend
     return RedirectResponse(url=f"{settings.FRONTEND_BASE_URL.rstrip('/')}/connections")
 
 @router.delete("/remove")
 def remove_google_connection():
-    vault.delete("GOOGLE_OAUTH_TOKEN")
-    vault.delete("GOOGLE_OAUTH_REFRESH_TOKEN")
+    with vault.transaction():
+        vault.delete("GOOGLE_OAUTH_TOKEN")
+        vault.delete("GOOGLE_OAUTH_REFRESH_TOKEN")
     return {"status": "success"}
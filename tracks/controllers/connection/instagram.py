@@ -99,17 +99,19 @@ def instagram_callback(request: Request, state: str = None, code: str = None, er
                 long_lived_token = long_lived_result.get('access_token')
                 
                 # Save to vault
-                if long_lived_token:
-                    vault.set("INSTAGRAM_OAUTH_TOKEN", long_lived_token)
-                if user_id:
-                    vault.set("INSTAGRAM_USER_ID", str(user_id))
+                with vault.transaction():
+                    if long_lived_token:
+                        vault.set("INSTAGRAM_OAUTH_TOKEN", long_lived_token)
+                    if user_id:
+                        vault.set("INSTAGRAM_USER_ID", str(user_id))
         except urllib.error.HTTPError as e:
             error_body = e.read().decode('utf-8')
             print(f"Failed to upgrade to long-lived token: {error_body}")
             # Fallback to short-lived if upgrade fails
-            vault.set("INSTAGRAM_OAUTH_TOKEN", short_lived_token)
-            if user_id:
-                vault.set("INSTAGRAM_USER_ID", str(user_id))
+            with vault.transaction():
+                vault.set("INSTAGRAM_OAUTH_TOKEN", short_lived_token)
+                if user_id:
+                    vault.set("INSTAGRAM_USER_ID", str(user_id))
     
     # Make sure we clean up the one-time state
     vault.delete("INSTAGRAM_OAUTH_STATE")
@@ -119,6 +121,7 @@ def instagram_callback(request: Request, state: str = None, code: str = None, er
 
 @router.delete("/remove")
 def remove_instagram_connection():
-    vault.delete("INSTAGRAM_OAUTH_TOKEN")
-    vault.delete("INSTAGRAM_USER_ID")
+    with vault.transaction():
+        vault.delete("INSTAGRAM_OAUTH_TOKEN")
+        vault.delete("INSTAGRAM_USER_ID")
     return {"status": "success"}
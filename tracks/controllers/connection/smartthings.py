@@ -93,10 +93,11 @@ def smartthings_callback(request: Request, state: str = None, code: str = None,
             access_token = token_result.get('access_token')
             refresh_token = token_result.get('refresh_token')
             
-            if access_token:
-                vault.set("SMARTTHINGS_OAUTH_TOKEN", access_token)
-            if refresh_token:
-                vault.set("SMARTTHINGS_REFRESH_TOKEN", refresh_token)
+            with vault.transaction():
+                if access_token:
+                    vault.set("SMARTTHINGS_OAUTH_TOKEN", access_token)
+                if refresh_token:
+                    vault.set("SMARTTHINGS_REFRESH_TOKEN", refresh_token)
                 
     except urllib.error.HTTPError as e:
         error_body = e.read().decode('utf-8')
@@ -163,6 +164,7 @@ async def smartthings_webhook(request: Request):
 
 @router.delete("/remove")
 def remove_smartthings_connection():
-    vault.delete("SMARTTHINGS_OAUTH_TOKEN")
-    vault.delete("SMARTTHINGS_REFRESH_TOKEN")
+    with vault.transaction():
+        vault.delete("SMARTTHINGS_OAUTH_TOKEN")
+        vault.delete("SMARTTHINGS_REFRESH_TOKEN")
     return {"status": "success"}
@@ -52,8 +52,9 @@ def get_auth_url(request: Request):
     code_challenge = generate_pkce_challenge(code_verifier)
     
     # Save state and verifier to vault temporarily
-    vault.set("TWITTER_OAUTH_STATE", state)
-    vault.set("TWITTER_CODE_VERIFIER", code_verifier)
+    with vault.transaction():
+        vault.set("TWITTER_OAUTH_STATE", state)
+        vault.set("TWITTER_CODE_VERIFIER", code_verifier)
     
     # Construct the authorization URL
     params = {
@@ -115,10 +116,11 @@ def twitter_callback(request: Request, state: str = None, code: str = None, erro
             access_token = token_result.get('access_token')
             refresh_token = token_result.get('refresh_token')
             
-            if access_token:
-                vault.set("TWITTER_OAUTH_TOKEN", access_token)
-            if refresh_token:
-                vault.set("TWITTER_REFRESH_TOKEN", refresh_token)
+            with vault.transaction():
+                if access_token:
+                    vault.set("TWITTER_OAUTH_TOKEN", access_token)
+                if refresh_token:
+                    vault.set("TWITTER_REFRESH_TOKEN", refresh_token)
                 
     except urllib.error.HTTPError as e:
         error_body = e.read().decode('utf-8')
@@ -126,14 +128,16 @@ def twitter_callback(request: Request, state: str = None, code: str = None, erro
     
     finally:
         # Clean up the one-time state and verifier
-        vault.delete("TWITTER_OAUTH_STATE")
-        vault.delete("TWITTER_CODE_VERIFIER")
+        with vault.transaction():
+            vault.delete("TWITTER_OAUTH_STATE")
+            vault.delete("TWITTER_CODE_VERIFIER")
         
     # Redirect user back to connections page on frontend
     return RedirectResponse(url=f"{settings.FRONTEND_BASE_URL.rstrip('/')}/connections")
 
 @router.delete("/remove")
 def remove_twitter_connection():
-    vault.delete("TWITTER_OAUTH_TOKEN")
-    vault.delete("TWITTER_REFRESH_TOKEN")
+    with vault.transaction():
+        vault.delete("TWITTER_OAUTH_TOKEN")
+        vault.delete("TWITTER_REFRESH_TOKEN")
     return {"status": "success"}
@@ -78,19 +78,21 @@ def youtube_callback(request: Request, state: str = None, code: str = None):
         
     credentials = flow.credentials
     
-    if credentials.token:
-        vault.set("YOUTUBE_OAUTH_TOKEN", credentials.token)
-    if credentials.refresh_token:
-        vault.set("YOUTUBE_REFRESH_TOKEN", credentials.refresh_token)
-    
-    # Make sure we clean up the one-time state
-    vault.delete("YOUTUBE_OAUTH_STATE")
+    with vault.transaction():
+        if credentials.token:
+            vault.set("YOUTUBE_OAUTH_TOKEN", credentials.token)
+        if credentials.refresh_token:
+            vault.set("YOUTUBE_REFRESH_TOKEN", credentials.refresh_token)
+        
+        # Make sure we clean up the one-time state
+        vault.delete("YOUTUBE_OAUTH_STATE")
         
     # Redirect user back to connections page on frontend
     return RedirectResponse(url=f"{settings.FRONTEND_BASE_URL.rstrip('/')}/connections")
 
 @router.delete("/remove")
 def remove_youtube_connection():
-    vault.delete("YOUTUBE_OAUTH_TOKEN")
-    vault.delete("YOUTUBE_REFRESH_TOKEN")
+    with vault.transaction():
+        vault.delete("YOUTUBE_OAUTH_TOKEN")
+        vault.delete("YOUTUBE_REFRESH_TOKEN")
     return {"status": "success"}
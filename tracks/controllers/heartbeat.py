@@ -3,15 +3,27 @@ Heartbeat API endpoints.
 """
 
 import os
-from fastapi import APIRouter, Query
+import asyncio
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sse_starlette.sse import EventSourceResponse
 
 from ..services.heartbeat_service import heartbeat_state
 from ..services import heartbeat_history_service
+from ..models import HistoryListResponse, HistoryMessageRange, HistoryMessageOutput
+from ..http_cache import etag, cache_headers, not_modified
 
 
 router = APIRouter(prefix="/api/heartbeat", tags=["heartbeat"])
 
 
+async def _log_etag(session_id: str) -> Optional[str]:
+    """ETag of the responses built from a heartbeat session's log, None if it is not found."""
+    version = await asyncio.to_thread(heartbeat_history_service.log_version, session_id)
+    return etag(version) if version is not None else None
+
+
 @router.get("/status")
 async def get_status():
     """
@@ -23,34 +35,168 @@ async def get_status():
     return heartbeat_state.get_status()
 
 
-@router.get("/history")
+@router.get("/history", response_model=HistoryListResponse)
 async def list_heartbeat_sessions(
-    limit: int = Query(50, ge=1, le=100),
-    offset: int = Query(0, ge=0)
+    request: Request,
+    limit: int = Query(50, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
+    include_total: bool = False
 ):
     """
     List heartbeat sessions with pagination.
     
     Args:
-        limit: Maximum number of sessions to return (1-100)
-        offset: Number of sessions to skip
+        limit: Maximum number of sessions to return (1-1000)
+        offset: Number of sessions to skip (ignored with a cursor)
+        cursor: next_cursor of the previous page, for keyset pagination
+        include_total: Also count the sessions, total is null otherwise
         
     Returns:
-        HistoryListResponse with session metadata
+        HistoryListResponse with session metadata, streamed as it is read
     """
-    return heartbeat_history_service.list_conversations(limit, offset)
+    tag = etag(await asyncio.to_thread(heartbeat_history_service.list_version))
+    cached = not_modified(request, tag)
+    if cached is not None:
+        return cached
+    
+    try:
+        body = await asyncio.to_thread(
+            heartbeat_history_service.stream_conversations, limit, offset, cursor=cursor, include_total=include_total
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(body, media_type="application/json", headers=cache_headers(tag))
 
 
 @router.get("/history/{session_id}")
-async def get_heartbeat_session(session_id: str):
+async def get_heartbeat_session(
+    request: Request,
+    response: Response,
+    session_id: str,
+    full: bool = False,
+    tail: Optional[int] = Query(None, ge=0),
+    before: Optional[int] = Query(None, ge=0)
+):
     """
     Get a specific heartbeat session's messages.
     
     Args:
         session_id: UUID of the session
+        full: Include the serialized_output of every message
+        tail: Only the last `tail` messages (summaries only, /messages serves full ranges)
+        before: Only messages before this index, e.g. the first index of the previous tail
+        
+    Returns:
+        HistorySummaryResponse with lightweight messages, or HistoryDetailResponse with full messages
+    """
+    if full and (tail is not None or before is not None):
+        raise HTTPException(status_code=400, detail="tail and before don't apply to full=true, use /messages")
+    
+    tag = await _log_etag(session_id)
+    cached = not_modified(request, tag)
+    if cached is not None:
+        return cached
+    
+    if full:
+        # Stored messages are passed through as they are, not revalidated
+        body = await asyncio.to_thread(heartbeat_history_service.stream_conversation, session_id)
+        if body is None:
+            return None
+        return StreamingResponse(body, media_type="application/json", headers=cache_headers(tag))
+    response.headers.update(cache_headers(tag))
+    return await asyncio.to_thread(heartbeat_history_service.get_conversation_summary, session_id, tail, before)
+
+
+@router.get("/history/{session_id}/messages", response_model=HistoryMessageRange)
+async def get_heartbeat_messages(
+    request: Request,
+    response: Response,
+    session_id: str,
+    start: int = Query(0, ge=0),
+    end: Optional[int] = Query(None, ge=0)
+):
+    """
+    Get a range of messages of a heartbeat session in full.
+    
+    Args:
+        session_id: UUID of the session
+        start: Index of the first message
+        end: Index after the last message (default: the end of the session)
         
     Returns:
-        ConversationResponse with messages
+        HistoryMessageRange with the messages and the session's message count
     """
-    return heartbeat_history_service.get_conversation(session_id)
+    tag = await _log_etag(session_id)
+    cached = not_modified(request, tag)
+    if cached is not None:
+        return cached
+    
+    messages = await asyncio.to_thread(heartbeat_history_service.get_messages, session_id, start, end)
+    if messages is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    response.headers.update(cache_headers(tag))
+    return messages
+
 
+@router.get("/history/{session_id}/messages/{index}/output", response_model=HistoryMessageOutput)
+async def get_heartbeat_message_output(request: Request, response: Response, session_id: str, index: int):
+    """
+    Get the serialized_output of one heartbeat message.
+    
+    Args:
+        session_id: UUID of the session
+        index: Position of the message in the session
+        
+    Returns:
+        HistoryMessageOutput
+    """
+    tag = await _log_etag(session_id)
+    cached = not_modified(request, tag)
+    if cached is not None:
+        return cached
+    
+    output = await asyncio.to_thread(heartbeat_history_service.get_message_output, session_id, index)
+    if output is None:
+        raise HTTPException(status_code=404, detail="Message not found")
+    response.headers.update(cache_headers(tag))
+    return output
+
+
+@router.get("/history/{session_id}/follow")
+async def follow_heartbeat_session(
+    request: Request,
+    session_id: str,
+    offset: Optional[int] = Query(None, ge=0),
+    start: Optional[int] = Query(None, ge=0)
+):
+    """
+    Stream the messages appended to a heartbeat session as server-sent events.
+    
+    Args:
+        session_id: UUID of the session
+        offset: Byte offset to resume from, the id of the last event received;
+            the Last-Event-ID header of a reconnect takes precedence
+        start: Index of the first message to send, without an offset
+            (default: only messages appended from now on)
+        
+    Returns:
+        EventSourceResponse of "message" events with a HistoryMessageSummary,
+        and a final "reset" event if the log is rewritten or removed
+    """
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id:
+        try:
+            offset = int(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+    
+    try:
+        events = await asyncio.to_thread(heartbeat_history_service.follow_conversation, session_id, offset, start)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if events is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    return EventSourceResponse(events)
@@ -3,49 +3,255 @@ History API endpoints.
 """
 
 import os
-from fastapi import APIRouter, HTTPException, Query
-from typing import Optional
+import asyncio
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sse_starlette.sse import EventSourceResponse
+from typing import List, Optional, Union
 
 from ..services import history_service
-from ..models import HistoryListResponse, HistoryDetailResponse
+from ..models import (
+    HistoryListResponse,
+    HistoryDetailResponse,
+    HistorySummaryResponse,
+    HistoryMessageRange,
+    HistoryMessageOutput,
+    HistorySearchResponse
+)
 from ..config import settings
+from ..http_cache import etag, cache_headers, not_modified
 
 router = APIRouter(prefix="/api/history", tags=["history"])
 
 
+async def _log_etag(session_id: str) -> Optional[str]:
+    """ETag of the responses built from a conversation's log, None if it is not found."""
+    version = await asyncio.to_thread(history_service.log_version, session_id)
+    return etag(version) if version is not None else None
+
+
 @router.get("", response_model=HistoryListResponse)
 async def list_conversations(
-    limit: int = Query(30, ge=1, le=100),
-    offset: int = Query(0, ge=0)
+    request: Request,
+    limit: int = Query(30, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
+    source: Optional[List[str]] = Query(None),
+    include_total: bool = False
+):
+    """
+    List conversations with pagination, newest first.
+    
+    Args:
+        limit: Maximum number of conversations to return (1-1000)
+        offset: Number of conversations to skip (ignored with a cursor)
+        cursor: next_cursor of the previous page, for keyset pagination
+        source: Repeatable filter, any of "chat" (or "web"), "telegram", "heartbeat";
+            defaults to every non-Telegram conversation
+        include_total: Also count the conversations, total is null otherwise
+        
+    Returns:
+        HistoryListResponse with conversation metadata, streamed as it is read
+    """
+    tag = etag(await asyncio.to_thread(history_service.list_version))
+    cached = not_modified(request, tag)
+    if cached is not None:
+        return cached
+    
+    try:
+        body = await asyncio.to_thread(
+            history_service.stream_conversations,
+            limit,
+            offset,
+            cursor=cursor,
+            sources=history_service.parse_sources(source),
+            include_total=include_total
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(body, media_type="application/json", headers=cache_headers(tag))
+
+
+@router.get("/search", response_model=HistorySearchResponse)
+async def search_history(
+    q: str = Query(..., min_length=1),
+    source: Optional[List[str]] = Query(None),
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    include_output: bool = False,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None
 ):
     """
-    List conversations with pagination.
+    Full-text search over chat, Telegram and heartbeat history.
     
     Args:
-        limit: Maximum number of conversations to return (1-100)
-        offset: Number of conversations to skip
+        q: Words to find (prefix matches, all required), "quoted text" for phrases
+        source: Repeatable filter, any of "chat", "telegram", "heartbeat" (default all)
+        date_from: Earliest message timestamp, ISO date or datetime (inclusive)
+        date_to: Latest message timestamp, ISO date or datetime (inclusive)
+        include_output: Also match agent output, if HISTORY_SEARCH_INCLUDE_OUTPUT is enabled
+        limit: Maximum number of results (1-100)
+        cursor: next_cursor of the previous page
         
     Returns:
-        HistoryListResponse with conversation metadata
+        HistorySearchResponse with the best matches first, ranked among the
+        newest matches until older_matches marks the move to older ones
     """
-    # Exclude Telegram conversations from the main history list
-    return history_service.list_conversations(limit, offset, exclude_prefix="telegram-")
+    try:
+        # SQLite work off the event loop
+        return await asyncio.to_thread(
+            history_service.search_messages,
+            q,
+            sources=source,
+            limit=limit,
+            cursor=cursor,
+            date_from=date_from,
+            date_to=date_to,
+            include_output=include_output
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
-@router.get("/{session_id}", response_model=HistoryDetailResponse)
-async def get_conversation(session_id: str):
+@router.get("/{session_id}", response_model=Union[HistorySummaryResponse, HistoryDetailResponse])
+async def get_conversation(
+    request: Request,
+    response: Response,
+    session_id: str,
+    full: bool = False,
+    tail: Optional[int] = Query(None, ge=0),
+    before: Optional[int] = Query(None, ge=0)
+):
     """
-    Get full conversation by session ID.
+    Get a conversation by session ID.
     
     Args:
         session_id: Codex session ID
+        full: Include the serialized_output of every message
+        tail: Only the last `tail` messages (summaries only, /messages serves full ranges)
+        before: Only messages before this index, e.g. the first index of the previous tail
         
     Returns:
-        HistoryDetailResponse with all messages
+        HistorySummaryResponse with lightweight messages, or HistoryDetailResponse with full messages
     """
-    conversation = history_service.get_conversation(session_id)
+    if full and (tail is not None or before is not None):
+        raise HTTPException(status_code=400, detail="tail and before don't apply to full=true, use /messages")
+    
+    tag = await _log_etag(session_id)
+    cached = not_modified(request, tag)
+    if cached is not None:
+        return cached
+    
+    if full:
+        # Stored messages are passed through as they are, not revalidated
+        body = await asyncio.to_thread(history_service.stream_conversation, session_id)
+        if body is None:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        return StreamingResponse(body, media_type="application/json", headers=cache_headers(tag))
+    
+    conversation = await asyncio.to_thread(history_service.get_conversation_summary, session_id, tail, before)
     
     if conversation is None:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
+    response.headers.update(cache_headers(tag))
     return conversation
+
+
+@router.get("/{session_id}/messages", response_model=HistoryMessageRange)
+async def get_messages(
+    request: Request,
+    response: Response,
+    session_id: str,
+    start: int = Query(0, ge=0),
+    end: Optional[int] = Query(None, ge=0)
+):
+    """
+    Get a range of messages of a conversation in full.
+    
+    Args:
+        session_id: Codex session ID
+        start: Index of the first message
+        end: Index after the last message (default: the end of the conversation)
+        
+    Returns:
+        HistoryMessageRange with the messages and the conversation's message count
+    """
+    tag = await _log_etag(session_id)
+    cached = not_modified(request, tag)
+    if cached is not None:
+        return cached
+    
+    messages = await asyncio.to_thread(history_service.get_messages, session_id, start, end)
+    
+    if messages is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    
+    response.headers.update(cache_headers(tag))
+    return messages
+
+
+@router.get("/{session_id}/messages/{index}/output", response_model=HistoryMessageOutput)
+async def get_message_output(request: Request, response: Response, session_id: str, index: int):
+    """
+    Get the serialized_output of one message.
+    
+    Args:
+        session_id: Codex session ID
+        index: Position of the message in the conversation
+        
+    Returns:
+        HistoryMessageOutput
+    """
+    tag = await _log_etag(session_id)
+    cached = not_modified(request, tag)
+    if cached is not None:
+        return cached
+    
+    output = await asyncio.to_thread(history_service.get_message_output, session_id, index)
+    
+    if output is None:
+        raise HTTPException(status_code=404, detail="Message not found")
+    
+    response.headers.update(cache_headers(tag))
+    return output
+
+
+@router.get("/{session_id}/follow")
+async def follow_conversation(
+    request: Request,
+    session_id: str,
+    offset: Optional[int] = Query(None, ge=0),
+    start: Optional[int] = Query(None, ge=0)
+):
+    """
+    Stream the messages appended to a conversation as server-sent events.
+    
+    Args:
+        session_id: Codex session ID
+        offset: Byte offset to resume from, the id of the last event received;
+            the Last-Event-ID header of a reconnect takes precedence
+        start: Index of the first message to send, without an offset
+            (default: only messages appended from now on)
+        
+    Returns:
+        EventSourceResponse of "message" events with a HistoryMessageSummary,
+        and a final "reset" event if the log is rewritten or removed
+    """
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id:
+        try:
+            offset = int(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+    
+    try:
+        events = await asyncio.to_thread(history_service.follow_conversation, session_id, offset, start)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if events is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    
+    return EventSourceResponse(events)
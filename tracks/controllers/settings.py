@@ -4,6 +4,7 @@ from typing import Dict, Any, List
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from ..config import settings
+from ..vault import vault
 from ..services.client_service import client_state
 
 router = APIRouter(prefix="/api/settings", tags=["settings"])
@@ -13,13 +14,35 @@ router = APIRouter(prefix="/api/settings", tags=["settings"])
 # Actually based on tracks/config.py, it's in the project root.
 # tracks/controllers/settings.py -> project_root/config.json is ../../config.json
 CONFIG_PATH = os.path.normpath(os.path.join(os.path.abspath(__file__), "../../../config.json"))
-VAULT_PATH = settings.VAULT_PATH
 
 class ConfigUpdate(BaseModel):
     HEARTBEAT_COOLDOWN_SECONDS: int = None
     ON_DEMAND_COOLDOWN_SECONDS: int = None
     ENABLE_TELEGRAM: bool = None
     AGENT_USE_ORDER: str = None
+    CODEX_OUTPUT_MODE: str = None
+    ENABLE_AGENT_SESSIONS: bool = None
+    AGENT_SESSION_IDLE_TIMEOUT: int = None
+    GEMINI_REPLAY_TOKEN_BUDGET: int = None
+    GEMINI_REPLAY_VERBATIM_TURNS: int = None
+    GEMINI_TOOL_RESULT_COLLAPSE_CHARS: int = None
+    GEMINI_SESSION_FLUSH_INTERVAL: float = None
+    GEMINI_SESSION_FSYNC: bool = None
+    HISTORY_FLUSH_MODE: str = None
+    HISTORY_FLUSH_INTERVAL_MS: int = None
+    HISTORY_SEARCH_INCLUDE_OUTPUT: bool = None
+    HISTORY_OUTPUT_ENCODING: str = None
+    HISTORY_OUTPUT_COMPRESSION: str = None
+    HISTORY_OUTPUT_COMPRESS_MIN_BYTES: int = None
+    HISTORY_ARCHIVE_AFTER_DAYS: int = None
+    HISTORY_RETENTION_DAYS: int = None
+    HEARTBEAT_RETENTION_DAYS: int = None
+    HISTORY_ARCHIVE_INTERVAL_HOURS: int = None
+    HISTORY_FOLLOW_POLL_INTERVAL: float = None
+    HTTP_COMPRESSION_MIN_BYTES: int = None
+    RUN_EVENT_LOG_SIZE: int = None
+    RUN_RETENTION_SECONDS: int = None
+    RUN_SUBSCRIBER_QUEUE_SIZE: int = None
     UTC_OFFSET: int = None
 
 class VaultItem(BaseModel):
@@ -66,6 +89,7 @@ async def update_config(update: ConfigUpdate):
     update_data = update.model_dump(exclude_none=True)
     config.update(update_data)
     write_json_file(CONFIG_PATH, config)
+    settings.reload()
     return {"status": "success", "config": config}
 
 @router.get("/active-client")
@@ -87,39 +111,35 @@ async def set_active_client(update: ActiveClientUpdate):
 
 @router.get("/vault")
 async def get_vault():
-    vault = read_json_file(VAULT_PATH)
-    return [{"key": k, "value": v} for k, v in vault.items()]
+    return [{"key": k, "value": v} for k, v in vault.to_dict().items()]
 
 @router.post("/vault")
 async def create_vault_item(item: VaultItem):
-    vault = read_json_file(VAULT_PATH)
-    if item.key in vault:
-        raise HTTPException(status_code=400, detail="Key already exists")
-    vault[item.key] = item.value
-    write_json_file(VAULT_PATH, vault)
+    with vault.transaction() as data:
+        if item.key in data:
+            raise HTTPException(status_code=400, detail="Key already exists")
+        data[item.key] = item.value
     return {"status": "success"}
 
 @router.put("/vault/{key}")
 async def update_vault_item(key: str, item: VaultItem):
-    vault = read_json_file(VAULT_PATH)
-    if key not in vault:
-        raise HTTPException(status_code=404, detail="Key not found")
-    
-    # If key is being renamed
-    if key != item.key:
-        if item.key in vault:
-            raise HTTPException(status_code=400, detail="New key already exists")
-        del vault[key]
-    
-    vault[item.key] = item.value
-    write_json_file(VAULT_PATH, vault)
+    with vault.transaction() as data:
+        if key not in data:
+            raise HTTPException(status_code=404, detail="Key not found")
+        
+        # If key is being renamed
+        if key != item.key:
+            if item.key in data:
+                raise HTTPException(status_code=400, detail="New key already exists")
+            del data[key]
+        
+        data[item.key] = item.value
     return {"status": "success"}
 
 @router.delete("/vault/{key}")
 async def delete_vault_item(key: str):
-    vault = read_json_file(VAULT_PATH)
-    if key not in vault:
-        raise HTTPException(status_code=404, detail="Key not found")
-    del vault[key]
-    write_json_file(VAULT_PATH, vault)
+    with vault.transaction() as data:
+        if key not in data:
+            raise HTTPException(status_code=404, detail="Key not found")
+        del data[key]
     return {"status": "success"}
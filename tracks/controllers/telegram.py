@@ -2,39 +2,47 @@
 Telegram API endpoints.
 """
 
-from fastapi import APIRouter
+import asyncio
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from ..services import history_service
+from ..services.history_index import SOURCE_TELEGRAM
 from ..models import HistoryListResponse
+from ..http_cache import etag, cache_headers, not_modified
 router = APIRouter(prefix="/api/telegram", tags=["telegram"])
 
 @router.get("/history", response_model=HistoryListResponse)
 async def list_telegram_history(
-    limit: int = 30,
-    offset: int = 0
+    request: Request,
+    limit: int = Query(30, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
+    include_total: bool = False
 ):
     """
-    List Telegram conversation history.
-    """
-    
-    # We use the existing history service but filter for telegram sessions
-    # The history service implementation lists all .user.jsonl files
-    # We should probably filter in memory for now as history service doesn't support prefix filtering
-    
-    full_history = history_service.list_conversations(limit=1000, offset=0)
+    List Telegram conversation history, newest first.
     
-    # Filter for sessions starting with "telegram-"
-    telegram_conversations = [
-        conv for conv in full_history.conversations 
-        if conv.session_id.startswith("telegram-")
-    ]
-    
-    # Apply pagination manually
-    total = len(telegram_conversations)
-    paginated = telegram_conversations[offset:offset + limit]
-    has_more = (offset + limit) < total
+    Args:
+        limit: Maximum number of conversations to return (1-1000)
+        offset: Number of conversations to skip (ignored with a cursor)
+        cursor: next_cursor of the previous page, for keyset pagination
+        include_total: Also count the conversations, total is null otherwise
+    """
+    tag = etag(await asyncio.to_thread(history_service.list_version))
+    cached = not_modified(request, tag)
+    if cached is not None:
+        return cached
     
-    return HistoryListResponse(
-        conversations=paginated,
-        total=total,
-        has_more=has_more
-    )
+    try:
+        body = await asyncio.to_thread(
+            history_service.stream_conversations,
+            limit,
+            offset,
+            cursor=cursor,
+            sources=(SOURCE_TELEGRAM,),
+            include_total=include_total
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(body, media_type="application/json", headers=cache_headers(tag))
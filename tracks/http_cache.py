@@ -0,0 +1,184 @@
+"""
+HTTP validators and compression for the history APIs.
+
+History listings and conversations are only ever changed by the server
+itself, so an endpoint can tell whether a client's copy is current without
+building the response: listings from history_index.version, conversations
+from the size and modification time of their log. etag() turns those into a
+strong ETag and not_modified() answers a matching If-None-Match with a 304
+before anything is read. Responses are sent with `Cache-Control: no-cache`,
+so browsers keep them and revalidate on every request.
+
+CompressionMiddleware compresses JSON responses of at least
+HTTP_COMPRESSION_MIN_BYTES with brotli (if the brotli package is installed)
+or gzip, whichever the client accepts. Streamed responses are compressed
+chunk by chunk. The encoding is appended to a strong ETag ("tag-gzip"), a
+compressed body being a different representation; not_modified() matches
+either form.
+"""
+
+import os
+import zlib
+import hashlib
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from .config import settings
+
+# Tags from a previous run of the server never match, in case responses changed shape
+_INSTANCE = os.urandom(4).hex()
+
+ENCODINGS = ("br", "gzip")
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+
+
+def etag(*parts) -> str:
+    """Strong ETag of the given values."""
+    digest = hashlib.sha1(repr((_INSTANCE, settings.UTC_OFFSET) + parts).encode('utf-8')).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def cache_headers(tag: Optional[str]) -> dict:
+    """Headers of a response validated by `tag`, None for a response that can't be."""
+    if tag is None:
+        return {}
+    return {"ETag": tag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+
+
+def not_modified(request: Request, tag: Optional[str]) -> Optional[Response]:
+    """A 304 response if the request's If-None-Match matches `tag`, otherwise None."""
+    header = request.headers.get("if-none-match")
+    if tag is None or not header:
+        return None
+    for candidate in header.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        base = candidate
+        for encoding in ENCODINGS:
+            if candidate.endswith(f'-{encoding}"'):
+                base = candidate[:-len(encoding) - 2] + '"'
+        if candidate == '*' or base == tag:
+            # Echo the representation the client holds
+            return Response(status_code=304, headers=cache_headers(candidate if candidate != '*' else tag))
+    return None
+
+
+def _accepted_encoding(headers: Headers) -> Optional[str]:
+    """Best encoding the client accepts, or None."""
+    accepted = {}
+    for item in headers.get("accept-encoding", "").split(','):
+        name, _, params = item.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in ENCODINGS:
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get('*', 0.0)) > 0:
+            return encoding
+    return None
+
+
+class _Compressor:
+    """Incremental brotli or gzip compression"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._gzip = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if self.encoding == "br":
+            out = self._brotli.process(data)
+            return out + (self._brotli.finish() if final else self._brotli.flush())
+        out = self._gzip.compress(data)
+        return out + self._gzip.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class CompressionMiddleware:
+    """Compress JSON responses for clients that accept it."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or settings.HTTP_COMPRESSION_MIN_BYTES <= 0:
+            await self.app(scope, receive, send)
+            return
+        encoding = _accepted_encoding(Headers(scope=scope))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+
+        async def send_compressed(message: Message):
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                headers = MutableHeaders(raw=start["headers"])
+                eligible = (
+                    start["status"] == 200
+                    and headers.get("content-type", "").startswith("application/json")
+                    and "content-encoding" not in headers
+                    and (more_body or len(body) >= settings.HTTP_COMPRESSION_MIN_BYTES)
+                )
+                if not eligible:
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+
+                compressor = _Compressor(encoding)
+                headers["Content-Encoding"] = encoding
+                if "accept-encoding" not in headers.get("vary", "").lower():
+                    headers.add_vary_header("Accept-Encoding")
+                tag = headers.get("etag")
+                if tag and tag.startswith('"'):
+                    headers["ETag"] = f'{tag[:-1]}-{encoding}"'
+                if "content-length" in headers:
+                    del headers["content-length"]
+                if not more_body:
+                    body = compressor.compress(body, True)
+                    headers["Content-Length"] = str(len(body))
+                    await send(start)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                await send(start)
+
+            await send({
+                "type": "http.response.body",
+                "body": compressor.compress(body, not more_body),
+                "more_body": more_body
+            })
+
+        await self.app(scope, receive, send_compressed)
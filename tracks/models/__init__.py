@@ -2,12 +2,18 @@
 Pydantic models for Tracks application.
 """
 
-from .chat import ChatRequest, ChatResponse, SessionInfo
+from .chat import ChatRequest, ChatResponse, SessionInfo, RunInfo, RunListResponse
 from .history import (
     HistoryMessage,
     HistoryMetadata,
     HistoryListResponse,
-    HistoryDetailResponse
+    HistoryDetailResponse,
+    HistoryMessageSummary,
+    HistorySummaryResponse,
+    HistoryMessageRange,
+    HistoryMessageOutput,
+    HistorySearchResult,
+    HistorySearchResponse
 )
 
 
@@ -15,8 +21,16 @@ __all__ = [
     "ChatRequest",
     "ChatResponse",
     "SessionInfo",
+    "RunInfo",
+    "RunListResponse",
     "HistoryMessage",
     "HistoryMetadata",
     "HistoryListResponse",
     "HistoryDetailResponse",
+    "HistoryMessageSummary",
+    "HistorySummaryResponse",
+    "HistoryMessageRange",
+    "HistoryMessageOutput",
+    "HistorySearchResult",
+    "HistorySearchResponse",
 ]
@@ -3,6 +3,7 @@ Chat-related Pydantic models.
 """
 
 from pydantic import BaseModel
+from typing import List, Optional
 
 
 class ChatRequest(BaseModel):
@@ -23,3 +24,21 @@ class SessionInfo(BaseModel):
     """Session metadata."""
     
     session_id: str
+
+
+class RunInfo(BaseModel):
+    """Status of a chat run."""
+    
+    run_id: str
+    session_id: Optional[str] = None  # Known once the agent announced it
+    status: str  # "running", "done", "cancelled" or "failed"
+    created_at: str  # ISO 8601 format
+    finished_at: Optional[str] = None
+    last_event_id: int  # Sequence number of the run's latest event
+    viewers: int = 0  # Clients attached to the run
+
+
+class RunListResponse(BaseModel):
+    """Chat runs in progress and recently finished."""
+    
+    runs: List[RunInfo]
@@ -35,8 +35,20 @@ class HistoryListResponse(BaseModel):
     """Paginated list of conversations."""
     
     conversations: List[HistoryMetadata]
-    total: int
+    total: Optional[int] = None  # Only counted with include_total
     has_more: bool
+    next_cursor: Optional[str] = None  # Pass as cursor to get the next page
+
+
+class HistoryMessageSummary(BaseModel):
+    """Message in conversation history without its serialized_output."""
+    
+    index: int  # Position of the message in its conversation
+    role: str
+    content: str
+    timestamp: str  # ISO 8601 format
+    size: int  # Bytes of the stored message, serialized_output included
+    has_output: bool  # Whether serialized_output is available from the output endpoint
 
 
 class HistoryDetailResponse(BaseModel):
@@ -45,3 +57,48 @@ class HistoryDetailResponse(BaseModel):
     session_id: str
     messages: List[HistoryMessage]
     created_at: str  # ISO 8601 format
+
+
+class HistorySummaryResponse(BaseModel):
+    """Conversation with lightweight messages."""
+    
+    session_id: str
+    messages: List[HistoryMessageSummary]
+    created_at: str  # ISO 8601 format
+
+
+class HistoryMessageRange(BaseModel):
+    """Consecutive messages of a conversation in full."""
+    
+    session_id: str
+    start: int  # Index of the first message
+    total: int  # Number of messages in the conversation
+    messages: List[HistoryMessage]
+
+
+class HistoryMessageOutput(BaseModel):
+    """serialized_output of one message."""
+    
+    session_id: str
+    message_index: int
+    serialized_output: Optional[List[dict]] = None
+
+
+class HistorySearchResult(BaseModel):
+    """One message matching a history search."""
+    
+    session_id: str
+    source: str  # "chat", "telegram" or "heartbeat"
+    message_index: int  # Position of the message in its conversation
+    role: str
+    timestamp: str  # ISO 8601 format
+    snippet: str  # Matching excerpt, matches wrapped in **
+    score: float  # bm25 rank, lower is better
+
+
+class HistorySearchResponse(BaseModel):
+    """Page of history search results, best matches first."""
+    
+    results: List[HistorySearchResult]
+    next_cursor: Optional[str] = None  # Pass as cursor to get the next page
+    older_matches: bool = False  # The next page starts ranking older matches
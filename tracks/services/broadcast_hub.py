@@ -0,0 +1,101 @@
+"""
+Fan-out of one producer's items to any number of subscribers.
+
+publish() never waits: every subscriber has its own queue of at most
+`maxsize` items. While a subscriber is behind, a new item may be merged
+into the last one it hasn't taken yet (the hub's `coalesce` function), and
+a subscriber whose queue is still full is dropped, its get() returns None
+with `dropped` set. A slow subscriber costs the producer nothing; it is up
+to the subscriber to catch up some other way (see Run.attach()).
+"""
+
+import asyncio
+from collections import deque
+from typing import Any, Callable, Optional, Set
+
+
+class Subscription:
+    """One subscriber's queue of a BroadcastHub."""
+
+    def __init__(self, hub: "BroadcastHub"):
+        self._hub = hub
+        self._queue = deque()
+        self._waiter: Optional[asyncio.Future] = None
+        self.dropped = False
+        self.closed = False
+
+    def _wake(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def _offer(self, item: Any):
+        coalesce = self._hub.coalesce
+        if self._queue and coalesce is not None:
+            merged = coalesce(self._queue[-1], item)
+            if merged is not None:
+                self._queue[-1] = merged
+                return
+        if len(self._queue) >= self._hub.maxsize:
+            self.dropped = True
+            self._queue.clear()
+            self.close()
+            return
+        self._queue.append(item)
+        self._wake()
+
+    async def get(self) -> Any:
+        """The next item, or None once the hub is closed and drained or the subscriber dropped."""
+        while not self._queue:
+            if self.closed:
+                return None
+            self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        return self._queue.popleft()
+
+    def close(self):
+        """Stop receiving items, those queued can still be taken."""
+        self.closed = True
+        self._hub._subscribers.discard(self)
+        self._wake()
+
+
+class BroadcastHub:
+    """Publish items to every subscriber without waiting for any of them."""
+
+    def __init__(self, maxsize: int, coalesce: Optional[Callable[[Any, Any], Any]] = None):
+        """
+        Args:
+            maxsize: Items queued per subscriber before it is dropped
+            coalesce: Merge an item into the previous one queued for a
+                subscriber, returns the merged item or None if they don't merge
+        """
+        self.maxsize = max(maxsize, 1)
+        self.coalesce = coalesce
+        self.closed = False
+        self._subscribers: Set[Subscription] = set()
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self) -> Subscription:
+        """Receive the items published from now on."""
+        subscription = Subscription(self)
+        if self.closed:
+            subscription.closed = True
+        else:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def publish(self, item: Any):
+        for subscription in list(self._subscribers):
+            subscription._offer(item)
+
+    def close(self):
+        """End every subscription once it has taken the items queued."""
+        self.closed = True
+        for subscription in list(self._subscribers):
+            subscription.close()
@@ -3,10 +3,11 @@ Service for managing the active LLM client (Codex or Gemini).
 Handles automatic switching when usage limits are hit.
 """
 
-from typing import Optional, Union, Any, Dict, List
+from typing import Optional, Union, Any, Dict, List, Tuple
 import json
 import os
 import sys
+import threading
 
 from tracks.clients.codex_client import CodexClient
 from tracks.clients.gemini_client import GeminiClient
@@ -33,6 +34,9 @@ class ClientState:
             
         self._initialized = True
         self._client_type = settings.AGENT_USE_ORDER.split(",")[0]
+        # (client type, profile id, cwd) -> client; clients keep no per-run state worth resetting
+        self._clients: Dict[Tuple[str, str, str], Union[CodexClient, GeminiClient]] = {}
+        self._clients_lock = threading.Lock()
         print(f"[client_service] Initialized with client: {self._client_type}")
         
     @property
@@ -56,11 +60,21 @@ class ClientState:
         which_client = self._client_type.split(":", 1)[0]
         
         if which_client == "gemini":
-            return GeminiClient(cwd=cwd, profile_id=profile_id)
+            client_class = GeminiClient
         elif which_client == "codex":
-            return CodexClient(cwd=cwd, profile_id=profile_id)
+            client_class = CodexClient
         else:
             raise ValueError(f"Invalid client type: {self._client_type}")
+        
+        # Resolve the default here so a changed AGENT_HOME_PATH gets its own client
+        cwd = cwd or settings.AGENT_HOME_PATH
+        key = (which_client, profile_id, cwd)
+        with self._clients_lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = client_class(cwd=cwd, profile_id=profile_id)
+                self._clients[key] = client
+        return client
 
     def get_next_client_type(self):
         """Get the next client type in the order."""
@@ -79,29 +93,34 @@ class ClientState:
         Args:
             serialized_output: List of output events [{'tag': '...', 'data': '...'}]
         """
-        next_client_type = self.get_next_client_type()
+        for event in serialized_output:
+            if self.check_event(event.get("tag"), event.get("data", "")):
+                return True
+        return False
 
+    def check_event(self, tag: str, data: str) -> bool:
+        """
+        Check a single streamed output event for usage limit errors.
+        
+        Same check as check_and_update_state, without wrapping every event in a list.
+        """
         # Check if we are using codex
         if self._client_type == "codex":
-            for event in serialized_output:
-                if event.get("tag") == "user":
-                    data = event.get("data", "")
-                    # Check for usage limit error pattern
-                    if "ERROR: You've hit your usage limit" in data: 
-                        print(f"[client_service] Detected Codex usage limit exhaustion. Switching to {next_client_type.capitalize()}.")
-                        self.set_client_type(next_client_type)
-                        return True
+            # Text mode reports it in the "user" section, JSON mode as an error event
+            if tag in ("user", "error") and "ERROR: You've hit your usage limit" in data:
+                next_client_type = self.get_next_client_type()
+                print(f"[client_service] Detected Codex usage limit exhaustion. Switching to {next_client_type.capitalize()}.")
+                self.set_client_type(next_client_type)
+                return True
                         
         # Check if we are using gemini
         elif self._client_type == "gemini":
-            for event in serialized_output:
-                # Check stderr or error tags for capacity message
-                if event.get("tag") in ("stderr", "error"):
-                    data = event.get("data", "")
-                    if "exhausted" in data and "capacity" in data:
-                        print(f"[client_service] Detected Gemini usage limit exhaustion. Switching to {next_client_type.capitalize()}.")
-                        self.set_client_type(next_client_type)
-                        return True
+            # Check stderr or error tags for capacity message
+            if tag in ("stderr", "error") and "exhausted" in data and "capacity" in data:
+                next_client_type = self.get_next_client_type()
+                print(f"[client_service] Detected Gemini usage limit exhaustion. Switching to {next_client_type.capitalize()}.")
+                self.set_client_type(next_client_type)
+                return True
         return False
 
 
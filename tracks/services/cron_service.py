@@ -7,8 +7,10 @@ from datetime import datetime, timezone, timedelta
 from tracks.config import settings
 import logging
 
-def get_timezone():
-    return timezone(timedelta(hours=settings.UTC_OFFSET))
+def get_timezone(utc_offset=None):
+    if utc_offset is None:
+        utc_offset = settings.UTC_OFFSET
+    return timezone(timedelta(hours=utc_offset))
 
 logger = logging.getLogger(__name__)
 
@@ -17,6 +19,12 @@ class CronService:
         self._task = None
         self._running = False
         self.crontab_file = os.path.join(settings.AGENT_HOME_PATH, "crontabs.txt")
+        self.utc_offset = settings.UTC_OFFSET
+        settings.subscribe(self._on_settings_changed)
+
+    def _on_settings_changed(self, old_settings, new_settings):
+        self.crontab_file = os.path.join(new_settings.AGENT_HOME_PATH, "crontabs.txt")
+        self.utc_offset = new_settings.UTC_OFFSET
 
     def start(self):
         if not self._running:
@@ -31,7 +39,7 @@ class CronService:
 
     async def _run_loop(self):
         while self._running:
-            tz = get_timezone()
+            tz = get_timezone(self.utc_offset)
             now_dt = datetime.now(tz)
             # Wait until the start of the next minute
             # seconds_to_next_minute = 60 - now_dt.second
@@ -81,7 +81,7 @@ def run_cronjob(prompt_text: str):
             switched = False
             for tag, line in serialized:
                 serialized_output.append({"tag": tag, "data": line})
-                if client_state.check_and_update_state([{"tag": tag, "data": line}]):
+                if client_state.check_event(tag, line):
                     switched = True
                     break
                 
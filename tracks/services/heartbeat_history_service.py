@@ -4,17 +4,24 @@ Stores logs in heartbeat/ folder instead of history/ folder.
 """
 
 import os
-import json
-from datetime import datetime, timedelta
-from typing import List, Optional
+import asyncio
+import sqlite3
+from datetime import datetime
+from typing import List, Tuple, Optional, Iterator, AsyncIterator
 
 from ..models.history import (
-    HistoryMessage,
-    HistoryMetadata,
     HistoryListResponse,
-    HistoryDetailResponse
+    HistoryDetailResponse,
+    HistorySummaryResponse,
+    HistoryMessageRange,
+    HistoryMessageOutput
 )
 from ..config import settings
+from .history_writer import history_writer
+from .history_codec import dump_message
+from .history_index import history_index, parse_log_filename, SOURCE_HEARTBEAT
+from . import history_service, history_archive
+from .history_service import local_timestamp
 
 
 def get_heartbeat_file_path(session_id: str, timestamp: datetime) -> str:
@@ -45,6 +52,54 @@ def get_heartbeat_file_path(session_id: str, timestamp: datetime) -> str:
     return os.path.join(heartbeat_dir, filename)
 
 
+def resolve_log_file(session_id: str, timestamp: datetime) -> Tuple[str, str]:
+    """
+    Find the existing heartbeat file of a session, or pick a new one.
+    
+    Returns:
+        (absolute path, conversation creation timestamp)
+    """
+    resolved = history_index.resolve(SOURCE_HEARTBEAT, session_id)
+    if resolved is not None:
+        # Archived sessions are copied back into the tree to be appended to
+        return history_archive.thaw(SOURCE_HEARTBEAT, session_id, *resolved)
+    
+    file_path = get_heartbeat_file_path(session_id, timestamp)
+    # Ensure directory exists
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    return file_path, parse_log_filename(os.path.basename(file_path))[0]
+
+
+def index_message(
+    session_id: str,
+    file_path: str,
+    created_at: str,
+    role: str,
+    content: str,
+    timestamp: str,
+    serialized_output: Optional[List[dict]] = None
+) -> bool:
+    """Record a message appended to file_path in the history index, returning whether it was."""
+    try:
+        # Heartbeat previews show the first message whatever its role
+        history_index.record_message(
+            SOURCE_HEARTBEAT,
+            session_id,
+            file_path,
+            created_at,
+            role,
+            content,
+            timestamp,
+            serialized_output=serialized_output,
+            preview=content
+        )
+    except sqlite3.Error as e:
+        # The JSONL file is the source of truth, `admin.py reindex` repairs the index
+        print(f"[heartbeat_history] Failed to index message of {session_id}: {e}")
+        return False
+    return True
+
+
 def save_message(
     session_id: str,
     role: str,
@@ -56,6 +111,8 @@ def save_message(
     """
     Save a message to heartbeat JSONL file.
     
+    Blocks on file I/O, async callers should use asave_message().
+    
     Args:
         session_id: Codex session ID
         role: "user" or "assistant"
@@ -71,194 +128,124 @@ def save_message(
         timestamp = datetime.now()
     
     # Find existing file for this session or create new one
-    heartbeat_dir = os.path.join(settings.AGENT_HOME_PATH, "heartbeat")
-    file_path = None
-    
-    # Search for existing file with this session_id
-    if os.path.exists(heartbeat_dir):
-        for root, dirs, files in os.walk(heartbeat_dir):
-            for filename in files:
-                if session_id in filename and filename.endswith('.heartbeat.jsonl'):
-                    file_path = os.path.join(root, filename)
-                    break
-            if file_path:
-                break
-    
-    # If no existing file, create new one with current timestamp
-    if not file_path:
-        file_path = get_heartbeat_file_path(session_id, timestamp)
-        # Ensure directory exists
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-    
-    # Create message object
-    message = HistoryMessage(
-        role=role,
-        content=content,
-        timestamp=timestamp.isoformat(),
-        serialized_output=serialized_output,
-        metadata=metadata
-    )
+    file_path, created_at = resolve_log_file(session_id, timestamp)
     
     # Append to JSONL file
+    message_timestamp = timestamp.isoformat()
     with open(file_path, 'a', encoding='utf-8') as f:
-        f.write(message.model_dump_json() + '\n')
+        f.write(dump_message(role, content, message_timestamp, serialized_output, metadata) + '\n')
     
+    index_message(session_id, file_path, created_at, role, content, message_timestamp, serialized_output)
     return file_path
 
 
+def asave_message(
+    session_id: str,
+    role: str,
+    content: str,
+    timestamp: Optional[datetime] = None,
+    serialized_output: Optional[List[dict]] = None,
+    metadata: Optional[dict] = None
+) -> "asyncio.Future[str]":
+    """
+    Queue a message for the background history writer.
+    
+    Same arguments as save_message(). Must be called from the event loop.
+    
+    Returns:
+        Commit future resolving to the JSONL path once the message is
+        written with the durability of HISTORY_FLUSH_MODE. Awaiting it is optional.
+    """
+    return history_writer.submit(
+        resolve_log_file,
+        index_message,
+        session_id,
+        role,
+        content,
+        timestamp or datetime.now(),
+        serialized_output,
+        metadata
+    )
+
+
+def list_version() -> str:
+    """Token that changes whenever a heartbeat listing may."""
+    return history_service.list_version()
+
+
 def list_conversations(
     limit: int = 30,
-    offset: int = 0
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    include_total: bool = False
 ) -> HistoryListResponse:
     """
     List heartbeat conversations with pagination.
     
     Args:
         limit: Maximum number of conversations to return
-        offset: Number of conversations to skip
+        offset: Number of conversations to skip (ignored with a cursor)
+        cursor: next_cursor of the previous page
+        include_total: Count the conversations
         
     Returns:
         HistoryListResponse with conversation metadata
     """
-    heartbeat_dir = os.path.join(settings.AGENT_HOME_PATH, "heartbeat")
-    
-    if not os.path.exists(heartbeat_dir):
-        return HistoryListResponse(conversations=[], total=0, has_more=False)
-    
-    # Find all JSONL files and group by session_id
-    conversations_dict = {}  # session_id -> HistoryMetadata
-    
-    for root, dirs, files in os.walk(heartbeat_dir):
-        for filename in files:
-            if filename.endswith('.heartbeat.jsonl'):
-                file_path = os.path.join(root, filename)
-                
-                try:
-                    # Parse filename: {timestamp}.{session_id}.heartbeat.jsonl
-                    parts = filename.rsplit('.', 3)
-                    if len(parts) >= 3:
-                        timestamp_str = parts[0]
-                        session_id = parts[1]
-                        
-                        # Skip if we already have this session
-                        if session_id in conversations_dict:
-                            continue
-                        
-                        # Read first message for preview
-                        first_message = ''
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            for line in f:
-                                line = line.strip()
-                                if line:
-                                    msg = json.loads(line)
-                                    first_message = msg.get('content', '')[:100]
-                                    break
-                        
-                        # Parse timestamp
-                        if 'T' in timestamp_str:
-                            date_part, time_part = timestamp_str.split('T')
-                            time_part = time_part.replace('-', ':')
-                            timestamp_iso = f"{date_part}T{time_part}"
-                        else:
-                            timestamp_iso = timestamp_str
-                        
-                        # Convert to target timezone
-                        try:
-                            dt = datetime.fromisoformat(timestamp_iso)
-                            dt_local = dt + timedelta(hours=settings.UTC_OFFSET)
-                            timestamp_iso = dt_local.isoformat()
-                        except ValueError:
-                            pass
-                        
-                        # Get relative path
-                        rel_path = os.path.relpath(file_path, settings.AGENT_HOME_PATH)
-                        
-                        conversations_dict[session_id] = HistoryMetadata(
-                            session_id=session_id,
-                            timestamp=timestamp_iso,
-                            first_message=first_message,
-                            file_path=rel_path
-                        )
-                except Exception as e:
-                    print(f"Error parsing heartbeat file {filename}: {e}")
-                    continue
-    
-    # Convert to list
-    conversations = list(conversations_dict.values())
-    
-    # Sort by timestamp descending
-    conversations.sort(key=lambda x: x.timestamp, reverse=True)
-    
-    # Apply pagination
-    total = len(conversations)
-    paginated = conversations[offset:offset + limit]
-    has_more = (offset + limit) < total
-    
-    return HistoryListResponse(
-        conversations=paginated,
-        total=total,
-        has_more=has_more
+    return history_service.list_conversations(
+        limit, offset, cursor=cursor, sources=(SOURCE_HEARTBEAT,), include_total=include_total
+    )
+
+
+def stream_conversations(
+    limit: int = 30,
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    include_total: bool = False
+) -> Iterator[str]:
+    """list_conversations() as JSON text streamed while the rows are read."""
+    return history_service.stream_conversations(
+        limit, offset, cursor=cursor, sources=(SOURCE_HEARTBEAT,), include_total=include_total
     )
 
 
+def log_version(session_id: str) -> Optional[Tuple[str, int, int]]:
+    """Version of a heartbeat session's log, see history_service.log_version()."""
+    return history_service.log_version(session_id, SOURCE_HEARTBEAT)
+
+
 def get_conversation(session_id: str) -> Optional[HistoryDetailResponse]:
-    """
-    Load full heartbeat conversation by session ID.
-    
-    Args:
-        session_id: Codex session ID
-        
-    Returns:
-        HistoryDetailResponse with all messages, or None if not found
-    """
-    heartbeat_dir = os.path.join(settings.AGENT_HOME_PATH, "heartbeat")
-    
-    if not os.path.exists(heartbeat_dir):
-        return None
-    
-    # Find file with matching session_id
-    for root, dirs, files in os.walk(heartbeat_dir):
-        for filename in files:
-            if session_id in filename and filename.endswith('.heartbeat.jsonl'):
-                file_path = os.path.join(root, filename)
-                
-                try:
-                    # Parse filename for timestamp
-                    parts = filename.rsplit('.', 3)
-                    timestamp_str = parts[0]
-                    
-                    # Parse timestamp
-                    if 'T' in timestamp_str:
-                        date_part, time_part = timestamp_str.split('T')
-                        time_part = time_part.replace('-', ':')
-                        timestamp_iso = f"{date_part}T{time_part}"
-                    else:
-                        timestamp_iso = timestamp_str
-                    
-                    # Convert to target timezone
-                    try:
-                        dt = datetime.fromisoformat(timestamp_iso)
-                        dt_local = dt + timedelta(hours=settings.UTC_OFFSET)
-                        timestamp_iso = dt_local.isoformat()
-                    except ValueError:
-                        pass
-                    
-                    # Read all messages
-                    messages = []
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        for line in f:
-                            line = line.strip()
-                            if line:
-                                msg_data = json.loads(line)
-                                messages.append(HistoryMessage(**msg_data))
-                    
-                    return HistoryDetailResponse(
-                        session_id=session_id,
-                        messages=messages,
-                        created_at=timestamp_iso
-                    )
-                except Exception as e:
-                    print(f"Error loading heartbeat conversation {session_id}: {e}")
-                    return None
-    
-    return None
+    """Load a full heartbeat conversation, see history_service.get_conversation()."""
+    return history_service.get_conversation(session_id, SOURCE_HEARTBEAT, local_timestamp)
+
+
+def stream_conversation(session_id: str) -> Optional[Iterator[bytes]]:
+    """get_conversation() as JSON streamed from the stored lines, without revalidating them."""
+    return history_service.stream_conversation(session_id, SOURCE_HEARTBEAT, local_timestamp)
+
+
+def get_conversation_summary(
+    session_id: str,
+    tail: Optional[int] = None,
+    before: Optional[int] = None
+) -> Optional[HistorySummaryResponse]:
+    """Load a heartbeat conversation without serialized_output, see history_service.get_conversation_summary()."""
+    return history_service.get_conversation_summary(session_id, tail, before, SOURCE_HEARTBEAT, local_timestamp)
+
+
+def get_messages(session_id: str, start: int = 0, end: Optional[int] = None) -> Optional[HistoryMessageRange]:
+    """Load messages start..end of a heartbeat conversation, see history_service.get_messages()."""
+    return history_service.get_messages(session_id, start, end, SOURCE_HEARTBEAT)
+
+
+def follow_conversation(
+    session_id: str,
+    offset: Optional[int] = None,
+    start: Optional[int] = None
+) -> Optional[AsyncIterator[dict]]:
+    """Follow a heartbeat session's log, see history_service.follow_conversation()."""
+    return history_service.follow_conversation(session_id, offset, start, SOURCE_HEARTBEAT)
+
+
+def get_message_output(session_id: str, index: int) -> Optional[HistoryMessageOutput]:
+    """Load the serialized_output of one heartbeat message, see history_service.get_message_output()."""
+    return history_service.get_message_output(session_id, index, SOURCE_HEARTBEAT)
@@ -92,7 +92,7 @@ async def run_heartbeat_task():
                         heartbeat_state.set_heartbeat_session_id(current_session_id)
                         
                         # Save user message
-                        heartbeat_history_service.save_message(
+                        heartbeat_history_service.asave_message(
                             session_id=current_session_id,
                             role="user",
                             content=HEARTBEAT_PROMPT,
@@ -101,7 +101,7 @@ async def run_heartbeat_task():
                         
                         # Save assistant message
                         assistant_content = "".join(agent_content)
-                        heartbeat_history_service.save_message(
+                        await heartbeat_history_service.asave_message(
                             session_id=current_session_id,
                             role="assistant",
                             content=assistant_content or "Complete",
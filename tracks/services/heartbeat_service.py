@@ -54,9 +54,19 @@ class HeartbeatState:
         # Callback for triggering heartbeat task
         self._trigger_callback: Optional[Callable[[], Awaitable[None]]] = None
         
+        # Cooldown configuration, kept in sync with config.json via subscription
+        self._heartbeat_cooldown_seconds: int = settings.HEARTBEAT_COOLDOWN_SECONDS
+        self._on_demand_cooldown_seconds: int = settings.ON_DEMAND_COOLDOWN_SECONDS
+        settings.subscribe(self._on_settings_changed)
+        
         # Lock for thread safety
         self._lock = asyncio.Lock()
     
+    def _on_settings_changed(self, old_settings, new_settings):
+        """Pick up cooldown changes pushed from the settings layer."""
+        self._heartbeat_cooldown_seconds = new_settings.HEARTBEAT_COOLDOWN_SECONDS
+        self._on_demand_cooldown_seconds = new_settings.ON_DEMAND_COOLDOWN_SECONDS
+    
     def set_trigger_callback(self, callback: Callable[[], Awaitable[None]]):
         """Set the callback function to trigger heartbeat task."""
         self._trigger_callback = callback
@@ -106,10 +116,10 @@ class HeartbeatState:
             # Schedule transition to False after cooldown
             loop = asyncio.get_event_loop()
             self._heartbeat_timer = loop.call_later(
-                settings.HEARTBEAT_COOLDOWN_SECONDS,
+                self._heartbeat_cooldown_seconds,
                 lambda: asyncio.create_task(self._heartbeat_cooldown_expired())
             )
-            print(f"[heartbeat] heartbeat cooldown started ({settings.HEARTBEAT_COOLDOWN_SECONDS}s)")
+            print(f"[heartbeat] heartbeat cooldown started ({self._heartbeat_cooldown_seconds}s)")
     
     async def _heartbeat_cooldown_expired(self):
         """Called when heartbeat cooldown expires."""
@@ -149,10 +159,10 @@ class HeartbeatState:
             # Schedule transition to False after cooldown
             loop = asyncio.get_event_loop()
             self._on_demand_timer = loop.call_later(
-                settings.ON_DEMAND_COOLDOWN_SECONDS,
+                self._on_demand_cooldown_seconds,
                 lambda: asyncio.create_task(self._on_demand_cooldown_expired())
             )
-            print(f"[heartbeat] on_demand cooldown started ({settings.ON_DEMAND_COOLDOWN_SECONDS}s)")
+            print(f"[heartbeat] on_demand cooldown started ({self._on_demand_cooldown_seconds}s)")
     
     async def _on_demand_cooldown_expired(self):
         """Called when on_demand cooldown expires."""
@@ -175,8 +185,8 @@ class HeartbeatState:
             "on_demand": self._on_demand,
             "heartbeat_session_id": self._heartbeat_session_id,
             "heartbeat_session_date": self._heartbeat_session_date,
-            "heartbeat_cooldown_seconds": settings.HEARTBEAT_COOLDOWN_SECONDS,
-            "on_demand_cooldown_seconds": settings.ON_DEMAND_COOLDOWN_SECONDS,
+            "heartbeat_cooldown_seconds": self._heartbeat_cooldown_seconds,
+            "on_demand_cooldown_seconds": self._on_demand_cooldown_seconds,
         }
 
 
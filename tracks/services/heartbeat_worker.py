@@ -61,7 +61,7 @@ def run_heartbeat(session_id: str = None, initial_client_type: str = "codex"):
             switched = False
             for tag, line in serialized:
                 serialized_output.append({"tag": tag, "data": line})
-                if client_state.check_and_update_state([{"tag": tag, "data": line}]):
+                if client_state.check_event(tag, line):
                     switched = True
                     break
                 
@@ -0,0 +1,387 @@
+"""
+Archival and retention of the history and heartbeat logs.
+
+Logs are filed by creation day under history/YYYY/MM/DD and
+heartbeat/YYYY/MM/DD, so both trees only grow. archive() rolls closed months
+into one zip per month, {dir}/archive/YYYY-MM.zip, holding the logs deflated
+under their YYYY/MM/DD/... names plus index.json, a member index with the
+session, creation time, size and modification time of every log. The history
+index is pointed at `archive/YYYY-MM.zip!{member}` and the day directories are
+removed, so walks and inode counts of the hot tree stay bounded by the
+archive window instead of the age of the deployment.
+
+Archived conversations stay readable through the history APIs: readers go
+through open_log(), which keeps a few archives open. A message appended to an
+archived conversation first copies its log back into the tree (thaw()), and a
+later pass archives it again, replacing the old member.
+
+A month is archived HISTORY_ARCHIVE_AFTER_DAYS after it ends, and only the
+logs not written to for that long. Logs are moved holding the history
+writer's lock, after it has released them (see HistoryWriter.release()), so
+a message is never appended to a file that is about to be removed. HISTORY_RETENTION_DAYS and HEARTBEAT_RETENTION_DAYS
+delete logs, in the tree or archived, last written to longer ago than that.
+run_maintenance() applies both; the server runs it every
+HISTORY_ARCHIVE_INTERVAL_HOURS and `admin.py archive-history` runs it on demand.
+"""
+
+import io
+import os
+import json
+import time
+import asyncio
+import zipfile
+import tempfile
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, List, Dict, Tuple, Iterator, BinaryIO
+
+from ..config import settings
+from .history_index import (
+    history_index,
+    history_source,
+    parse_log_filename,
+    HISTORY_DIR,
+    HISTORY_SUFFIX,
+    HEARTBEAT_DIR,
+    HEARTBEAT_SUFFIX,
+    ARCHIVE_DIR,
+    ARCHIVE_SEPARATOR,
+    SOURCE_HEARTBEAT
+)
+from .history_writer import history_writer
+
+# Member index stored in every archive
+ARCHIVE_INDEX = "index.json"
+
+# Archives kept open for reads
+OPEN_ARCHIVES = 8
+
+_archives_lock = threading.Lock()
+# (archive path, mtime) -> open archive, a rewritten archive gets a new entry
+_archives: "OrderedDict[Tuple[str, int], zipfile.ZipFile]" = OrderedDict()
+
+
+def split_archived(file_path: str) -> Optional[Tuple[str, str]]:
+    """(archive path, member name) of an archived log path, None for a log in the tree"""
+    if ARCHIVE_SEPARATOR not in file_path:
+        return None
+    archive_path, member = file_path.split(ARCHIVE_SEPARATOR, 1)
+    return archive_path, member
+
+
+def _open_archive(archive_path: str) -> zipfile.ZipFile:
+    key = (archive_path, os.stat(archive_path).st_mtime_ns)
+    with _archives_lock:
+        archive = _archives.get(key)
+        if archive is None:
+            archive = zipfile.ZipFile(archive_path)
+            _archives[key] = archive
+            # Dropped handles close once no reader holds them
+            while len(_archives) > OPEN_ARCHIVES:
+                _archives.popitem(last=False)
+        _archives.move_to_end(key)
+        return archive
+
+
+def _forget_archive(archive_path: str):
+    with _archives_lock:
+        for key in [key for key in _archives if key[0] == archive_path]:
+            del _archives[key]
+
+
+def read_member(file_path: str) -> bytes:
+    """Contents of an archived log."""
+    archive_path, member = split_archived(file_path)
+    try:
+        return _open_archive(archive_path).read(member)
+    except (zipfile.BadZipFile, KeyError) as e:
+        raise OSError(f"Can't read {member} from {archive_path}: {e}") from e
+
+
+def open_log(file_path: str) -> BinaryIO:
+    """Open a log for binary reading, whether it is in the tree or archived."""
+    if split_archived(file_path) is None:
+        return open(file_path, 'rb')
+    return io.BytesIO(read_member(file_path))
+
+
+def read_archive_index(archive_path: str) -> List[dict]:
+    """Member index of an archive: name, session_id, created_at, size and modified of every log"""
+    try:
+        return json.loads(_open_archive(archive_path).read(ARCHIVE_INDEX))["members"]
+    except (zipfile.BadZipFile, KeyError, ValueError) as e:
+        raise OSError(f"Can't read the member index of {archive_path}: {e}") from e
+
+
+def _archive_paths(directory: str) -> List[str]:
+    archive_dir = os.path.join(directory, ARCHIVE_DIR)
+    if not os.path.isdir(archive_dir):
+        return []
+    return sorted(
+        os.path.join(archive_dir, name) for name in os.listdir(archive_dir)
+        if name.endswith('.zip') and not name.startswith('.')
+    )
+
+
+def archived_logs(directory: str) -> Iterator[Tuple[str, str, str]]:
+    """(archived path, session_id, created_at) of every log archived under a history directory"""
+    for archive_path in _archive_paths(directory):
+        try:
+            members = read_archive_index(archive_path)
+        except OSError as e:
+            print(f"[history_archive] {e}")
+            continue
+        for entry in members:
+            yield f"{archive_path}{ARCHIVE_SEPARATOR}{entry['name']}", entry['session_id'], entry['created_at']
+
+
+def _source_of(directory: str, session_id: str) -> str:
+    return SOURCE_HEARTBEAT if os.path.basename(directory) == HEARTBEAT_DIR else history_source(session_id)
+
+
+def thaw(source: str, session_id: str, file_path: str, created_at: str) -> Tuple[str, str]:
+    """
+    Make sure a log can be appended to, copying an archived one back into the tree.
+
+    Returns:
+        (absolute path in the tree, created_at)
+    """
+    archived = split_archived(file_path)
+    if archived is None:
+        return file_path, created_at
+
+    archive_path, member = archived
+    hot_path = os.path.join(os.path.dirname(os.path.dirname(archive_path)), *member.split('/'))
+    if not os.path.exists(hot_path):
+        os.makedirs(os.path.dirname(hot_path), exist_ok=True)
+        data = read_member(file_path)
+        fd, tmp_path = tempfile.mkstemp(prefix='.thaw-', dir=os.path.dirname(hot_path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, hot_path)
+    history_index.move_log(source, session_id, file_path, hot_path)
+    print(f"[history_archive] Restored {session_id} from {os.path.basename(archive_path)}")
+    return hot_path, created_at
+
+
+def _rewrite_archive(archive_path: str, add: Dict[str, Tuple[str, dict]], drop: set) -> int:
+    """
+    Write archive_path with its current members minus `drop`, plus `add`
+    (member name -> (file to store, index entry)), replacing it atomically.
+
+    Returns:
+        Number of members left, the archive is deleted when none are
+    """
+    kept = []
+    if os.path.exists(archive_path):
+        kept = [entry for entry in read_archive_index(archive_path) if entry['name'] not in add and entry['name'] not in drop]
+    if not kept and not add:
+        os.unlink(archive_path)
+        _forget_archive(archive_path)
+        return 0
+
+    os.makedirs(os.path.dirname(archive_path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.archive-', suffix='.zip', dir=os.path.dirname(archive_path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            with zipfile.ZipFile(f, 'w', compression=zipfile.ZIP_DEFLATED) as out:
+                if kept:
+                    source = _open_archive(archive_path)
+                    for entry in kept:
+                        out.writestr(source.getinfo(entry['name']), source.read(entry['name']))
+                for name, (file_path, entry) in sorted(add.items()):
+                    out.write(file_path, name)
+                entries = kept + [entry for file_path, entry in add.values()]
+                out.writestr(ARCHIVE_INDEX, json.dumps({"members": entries}, ensure_ascii=False))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, archive_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    _forget_archive(archive_path)
+    return len(entries)
+
+
+def _month_dirs(directory: str) -> Iterator[Tuple[int, int, str]]:
+    """(year, month, path) of every YYYY/MM directory of a history tree"""
+    if not os.path.isdir(directory):
+        return
+    for year in sorted(os.listdir(directory)):
+        year_dir = os.path.join(directory, year)
+        if not (year.isdigit() and os.path.isdir(year_dir)):
+            continue
+        for month in sorted(os.listdir(year_dir)):
+            month_dir = os.path.join(year_dir, month)
+            if month.isdigit() and os.path.isdir(month_dir):
+                yield int(year), int(month), month_dir
+
+
+def _remove_empty_dirs(path: str, stop: str):
+    """Remove path and its parents up to stop while they are empty"""
+    for root, dirs, files in os.walk(path, topdown=False):
+        if not os.listdir(root):
+            os.rmdir(root)
+    path = os.path.dirname(path)
+    while path != stop and os.path.isdir(path) and not os.listdir(path):
+        os.rmdir(path)
+        path = os.path.dirname(path)
+
+
+def archive(after_days: int, dry_run: bool = False) -> Dict[str, Tuple[int, int]]:
+    """
+    Move logs of months that ended more than after_days ago, and not written
+    to since, into the monthly archives.
+
+    Returns:
+        Directory -> (logs archived, bytes archived)
+    """
+    cutoff = time.time() - after_days * 86400
+    cutoff_date = datetime.fromtimestamp(cutoff)
+    report: Dict[str, Tuple[int, int]] = {}
+    for name, suffix in ((HISTORY_DIR, HISTORY_SUFFIX), (HEARTBEAT_DIR, HEARTBEAT_SUFFIX)):
+        directory = os.path.join(settings.AGENT_HOME_PATH, name)
+        logs = size = 0
+        for year, month, month_dir in list(_month_dirs(directory)):
+            # Closed: the month after it started before the cutoff
+            if (year, month) >= (cutoff_date.year, cutoff_date.month):
+                continue
+
+            add: Dict[str, Tuple[str, dict]] = {}
+            for root, dirs, files in os.walk(month_dir):
+                for filename in files:
+                    parsed = parse_log_filename(filename)
+                    if not filename.endswith(suffix) or parsed is None:
+                        continue
+                    file_path = os.path.join(root, filename)
+                    stat = os.stat(file_path)
+                    if stat.st_mtime >= cutoff:
+                        continue
+                    member = os.path.relpath(file_path, directory).replace(os.sep, '/')
+                    add[member] = (file_path, {
+                        "name": member,
+                        "session_id": parsed[1],
+                        "created_at": parsed[0],
+                        "size": stat.st_size,
+                        "modified": stat.st_mtime
+                    })
+            if not add:
+                continue
+
+            logs += len(add)
+            size += sum(entry["size"] for file_path, entry in add.values())
+            if dry_run:
+                continue
+
+            archive_path = os.path.join(directory, ARCHIVE_DIR, f"{year:04d}-{month:02d}.zip")
+            _rewrite_archive(archive_path, add, set())
+            with history_writer.lock:
+                for member, (file_path, entry) in add.items():
+                    stat = os.stat(file_path)
+                    if (stat.st_size, stat.st_mtime) != (entry["size"], entry["modified"]):
+                        # Appended to meanwhile, stays in the tree until the next pass
+                        continue
+                    if not history_writer.release(file_path):
+                        # Messages still buffered for it
+                        continue
+                    history_index.move_log(
+                        _source_of(directory, entry["session_id"]), entry["session_id"],
+                        file_path, f"{archive_path}{ARCHIVE_SEPARATOR}{member}"
+                    )
+                    os.unlink(file_path)
+            _remove_empty_dirs(month_dir, directory)
+            print(f"[history_archive] Archived {len(add)} logs into {name}/{ARCHIVE_DIR}/{os.path.basename(archive_path)}")
+        report[name] = (logs, size)
+    return report
+
+
+def expire(directory_name: str, retention_days: int, dry_run: bool = False) -> Tuple[int, int]:
+    """
+    Delete the logs of a history directory, in the tree or archived, not
+    written to in retention_days.
+
+    Returns:
+        (logs deleted, bytes deleted)
+    """
+    cutoff = time.time() - retention_days * 86400
+    directory = os.path.join(settings.AGENT_HOME_PATH, directory_name)
+    suffix = HEARTBEAT_SUFFIX if directory_name == HEARTBEAT_DIR else HISTORY_SUFFIX
+    logs = size = 0
+
+    for year, month, month_dir in list(_month_dirs(directory)):
+        for root, dirs, files in os.walk(month_dir):
+            for filename in files:
+                parsed = parse_log_filename(filename)
+                if not filename.endswith(suffix) or parsed is None:
+                    continue
+                file_path = os.path.join(root, filename)
+                stat = os.stat(file_path)
+                if stat.st_mtime >= cutoff:
+                    continue
+                logs += 1
+                size += stat.st_size
+                if not dry_run:
+                    history_index.forget_log(_source_of(directory, parsed[1]), parsed[1], file_path)
+                    os.unlink(file_path)
+        if not dry_run:
+            _remove_empty_dirs(month_dir, directory)
+
+    for archive_path in _archive_paths(directory):
+        try:
+            expired = [entry for entry in read_archive_index(archive_path) if entry["modified"] < cutoff]
+        except OSError as e:
+            print(f"[history_archive] {e}")
+            continue
+        if not expired:
+            continue
+        logs += len(expired)
+        size += sum(entry["size"] for entry in expired)
+        if dry_run:
+            continue
+        _rewrite_archive(archive_path, {}, {entry["name"] for entry in expired})
+        for entry in expired:
+            history_index.forget_log(
+                _source_of(directory, entry["session_id"]), entry["session_id"],
+                f"{archive_path}{ARCHIVE_SEPARATOR}{entry['name']}"
+            )
+
+    if logs and not dry_run:
+        print(f"[history_archive] Deleted {logs} {directory_name} logs older than {retention_days} days")
+    return logs, size
+
+
+def run_maintenance(dry_run: bool = False) -> Dict[str, Dict[str, Tuple[int, int]]]:
+    """
+    Apply the retention policies, then archive closed months, per the settings.
+
+    Returns:
+        {"expired": directory -> (logs, bytes), "archived": directory -> (logs, bytes)}
+    """
+    report: Dict[str, Dict[str, Tuple[int, int]]] = {"expired": {}, "archived": {}}
+    for directory, retention_days in (
+        (HISTORY_DIR, settings.HISTORY_RETENTION_DAYS),
+        (HEARTBEAT_DIR, settings.HEARTBEAT_RETENTION_DAYS),
+    ):
+        if retention_days > 0:
+            report["expired"][directory] = expire(directory, retention_days, dry_run)
+    if settings.HISTORY_ARCHIVE_AFTER_DAYS > 0:
+        report["archived"] = archive(settings.HISTORY_ARCHIVE_AFTER_DAYS, dry_run)
+    return report
+
+
+async def run_periodically():
+    """Run maintenance every HISTORY_ARCHIVE_INTERVAL_HOURS while the server is up."""
+    while True:
+        enabled = (
+            settings.HISTORY_ARCHIVE_AFTER_DAYS > 0
+            or settings.HISTORY_RETENTION_DAYS > 0
+            or settings.HEARTBEAT_RETENTION_DAYS > 0
+        )
+        if enabled:
+            try:
+                await asyncio.to_thread(run_maintenance)
+            except Exception as e:
+                print(f"[history_archive] Maintenance failed: {e}")
+        await asyncio.sleep(max(settings.HISTORY_ARCHIVE_INTERVAL_HOURS, 1) * 3600)
@@ -0,0 +1,276 @@
+"""
+Storage encoding of the messages in the history and heartbeat logs.
+
+Clients stream agent output as (tag, data) events, often one per line of an
+exec, and serialized_output used to be stored as-is: thousands of
+{"tag": "exec_output", "data": "..."} objects per run. With
+HISTORY_OUTPUT_ENCODING = "compact" it is stored as
+
+    {"v": 1, "events": [[tag, data], ...]}
+
+where consecutive events of a streamed tag (COALESCED_TAGS) are joined into
+one, and known tags are written as their index in TAGS. If the events take
+more than HISTORY_OUTPUT_COMPRESS_MIN_BYTES, the events array is compressed
+as well:
+
+    {"v": 1, "codec": "zstd" | "gzip", "blob": "<base64>"}
+
+Joining is what the web UI already does when it renders a run, so the
+expanded output displays the same.
+
+Writers go through dump_message() and readers through load_message(), which
+accepts both forms as well as the plain lists of older logs and always
+returns serialized_output in the API shape, a list of {"tag", "data"} dicts.
+`admin.py compact-history` converts existing logs.
+"""
+
+import os
+import gzip
+import json
+import base64
+import shutil
+import tempfile
+from typing import Optional, List, Union, Dict, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from ..config import settings
+from ..models.history import HistoryMessage
+
+ENCODING_VERSION = 1
+
+# Integer codes of the tags clients emit. Codes are stored in the logs, only append
+TAGS = (
+    'meta', 'title', 'user', 'thinking', 'agent', 'exec', 'exec_time', 'exec_output', 'exec_error',
+    'file_update', 'tokens_used', 'error', 'stdout', 'stderr', 'raw', 'done', 'session'
+)
+TAG_CODES = {tag: code for code, tag in enumerate(TAGS)}
+
+# Tags whose events are pieces of one text stream and can be joined
+COALESCED_TAGS = ('thinking', 'agent', 'exec_output', 'exec_error', 'file_update', 'error', 'stdout', 'stderr', 'raw')
+
+ENCODINGS = ("compact", "plain")
+COMPRESSIONS = ("auto", "zstd", "gzip", "none")
+
+ZSTD_LEVEL = 3
+GZIP_LEVEL = 6
+
+
+def _compress(data: bytes, compression: str) -> Optional[tuple]:
+    """Return (codec, compressed bytes), or None if compression is off or unavailable."""
+    if compression == "auto":
+        compression = "zstd" if zstandard is not None else "gzip"
+    if compression == "zstd" and zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    if compression == "gzip":
+        return "gzip", gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    return None
+
+
+def _decompress(codec: str, blob: str) -> bytes:
+    data = base64.b64decode(blob)
+    if codec == "gzip":
+        return gzip.decompress(data)
+    if codec == "zstd":
+        if zstandard is None:
+            raise ValueError("serialized_output is zstd-compressed, install the zstandard package to read it")
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise ValueError(f"Unknown serialized_output codec: {codec}")
+
+
+def encode_output(
+    serialized_output: Optional[List[dict]],
+    encoding: Optional[str] = None,
+    compression: Optional[str] = None
+) -> Union[None, list, dict]:
+    """
+    Encode serialized_output for storage.
+
+    Args:
+        serialized_output: Output events in the API shape
+        encoding: "compact" or "plain", defaults to HISTORY_OUTPUT_ENCODING
+        compression: "auto", "zstd", "gzip" or "none", defaults to HISTORY_OUTPUT_COMPRESSION
+    """
+    encoding = encoding or settings.HISTORY_OUTPUT_ENCODING
+    if not serialized_output or encoding != "compact":
+        return serialized_output
+
+    events = []
+    previous_tag = None
+    for item in serialized_output:
+        tag, data = item.get('tag'), item.get('data')
+        if set(item) != {'tag', 'data'} or not isinstance(tag, str) or not isinstance(data, str):
+            # Not a plain event, kept as it is
+            events.append(item)
+            previous_tag = None
+            continue
+        if tag == previous_tag and tag in COALESCED_TAGS:
+            events[-1][1] += data
+            continue
+        events.append([TAG_CODES.get(tag, tag), data])
+        previous_tag = tag
+
+    encoded = {"v": ENCODING_VERSION, "events": events}
+    raw = json.dumps(events, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    if len(raw) >= settings.HISTORY_OUTPUT_COMPRESS_MIN_BYTES:
+        compressed = _compress(raw, compression or settings.HISTORY_OUTPUT_COMPRESSION)
+        # Base64 costs a third, only keep blobs that still come out smaller
+        if compressed is not None and len(compressed[1]) * 4 // 3 < len(raw):
+            codec, blob = compressed
+            encoded = {"v": ENCODING_VERSION, "codec": codec, "blob": base64.b64encode(blob).decode('ascii')}
+    return encoded
+
+
+def decode_output(stored: Union[None, list, dict]) -> Optional[List[dict]]:
+    """Expand stored serialized_output, in any encoding, to the API shape."""
+    if not isinstance(stored, dict):
+        return stored
+    if stored.get('v') != ENCODING_VERSION:
+        raise ValueError(f"Unknown serialized_output encoding: {stored.get('v')}")
+
+    events = stored.get('events')
+    if events is None:
+        events = json.loads(_decompress(stored.get('codec'), stored.get('blob', '')))
+
+    output = []
+    for event in events:
+        if isinstance(event, dict):
+            output.append(event)
+            continue
+        tag, data = event
+        if isinstance(tag, int):
+            tag = TAGS[tag]
+        output.append({"tag": tag, "data": data})
+    return output
+
+
+def dump_message(
+    role: str,
+    content: str,
+    timestamp: str,
+    serialized_output: Optional[List[dict]] = None,
+    metadata: Optional[dict] = None
+) -> str:
+    """Serialize a message as one log line (without the newline)."""
+    # Same key order and separators as HistoryMessage.model_dump_json(), history_reader relies on it
+    return json.dumps({
+        "role": role,
+        "content": content,
+        "timestamp": timestamp,
+        "serialized_output": encode_output(serialized_output),
+        "metadata": metadata
+    }, ensure_ascii=False, separators=(',', ':'))
+
+
+def load_message(data: dict) -> HistoryMessage:
+    """Build a HistoryMessage from a parsed log line, expanding its serialized_output."""
+    if isinstance(data.get('serialized_output'), dict):
+        data = {**data, 'serialized_output': decode_output(data['serialized_output'])}
+    return HistoryMessage(**data)
+
+
+def convert_log(
+    file_path: str,
+    encoding: str,
+    compression: str,
+    dry_run: bool = False
+) -> Tuple[int, int]:
+    """
+    Rewrite the serialized_output of every message of a log in the given encoding.
+
+    Lines that don't parse are kept as they are. The file is replaced
+    atomically, and left alone if it grows while being converted.
+
+    Returns:
+        (size before, size after) in bytes
+    """
+    for _ in range(3):
+        before = os.stat(file_path)
+        with open(file_path, 'rb') as f:
+            original = f.read()
+        lines = []
+        for line in original.decode('utf-8').splitlines(keepends=True):
+            try:
+                msg = json.loads(line) if line.strip() else None
+            except ValueError:
+                msg = None
+            if isinstance(msg, dict) and msg.get('serialized_output'):
+                output = encode_output(decode_output(msg['serialized_output']), encoding, compression)
+                line = json.dumps({**msg, 'serialized_output': output}, ensure_ascii=False, separators=(',', ':')) + '\n'
+            lines.append(line)
+        data = ''.join(lines).encode('utf-8')
+        if dry_run or data == original:
+            return len(original), len(data)
+
+        fd, tmp_path = tempfile.mkstemp(prefix='.compact-', dir=os.path.dirname(file_path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            shutil.copymode(file_path, tmp_path)
+            after = os.stat(file_path)
+            if (after.st_size, after.st_mtime_ns) != (before.st_size, before.st_mtime_ns):
+                # Appended to meanwhile, convert again
+                os.unlink(tmp_path)
+                continue
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return len(original), len(data)
+
+    print(f"[history_codec] {file_path} keeps changing, skipped")
+    size = os.path.getsize(file_path)
+    return size, size
+
+
+def convert_history(
+    encoding: Optional[str] = None,
+    compression: Optional[str] = None,
+    dry_run: bool = False
+) -> Dict[str, Tuple[int, int, int]]:
+    """
+    Convert every history and heartbeat log under AGENT_HOME_PATH (`admin.py compact-history`).
+
+    Run it while the server is stopped, the history writer keeps log files open.
+
+    Args:
+        encoding: "compact" or "plain", defaults to HISTORY_OUTPUT_ENCODING
+        compression: "auto", "zstd", "gzip" or "none", defaults to HISTORY_OUTPUT_COMPRESSION
+        dry_run: Only measure, leave the files alone
+
+    Returns:
+        Directory -> (files, bytes before, bytes after)
+    """
+    # history_index reads logs through this module
+    from .history_index import history_index, HISTORY_DIR, HISTORY_SUFFIX, HEARTBEAT_DIR, HEARTBEAT_SUFFIX
+
+    encoding = encoding or settings.HISTORY_OUTPUT_ENCODING
+    compression = compression or settings.HISTORY_OUTPUT_COMPRESSION
+    report: Dict[str, Tuple[int, int, int]] = {}
+    for directory, suffix in ((HISTORY_DIR, HISTORY_SUFFIX), (HEARTBEAT_DIR, HEARTBEAT_SUFFIX)):
+        files = before = after = 0
+        for root, dirs, names in os.walk(os.path.join(settings.AGENT_HOME_PATH, directory)):
+            for name in names:
+                if not name.endswith(suffix):
+                    continue
+                file_path = os.path.join(root, name)
+                try:
+                    size_before, size_after = convert_log(file_path, encoding, compression, dry_run)
+                except (OSError, UnicodeDecodeError, ValueError) as e:
+                    print(f"[history_codec] Error converting {file_path}: {e}")
+                    continue
+                files += 1
+                before += size_before
+                after += size_after
+        report[directory] = (files, before, after)
+
+    if not dry_run:
+        # Line positions changed
+        history_index.clear_line_offsets()
+    return report
@@ -0,0 +1,176 @@
+"""
+Live follow of a conversation's log as messages are appended.
+
+A Telegram conversation or heartbeat run in progress is written by the
+server while the web UI watches it. follow() pushes every message appended
+to the log, as a HistoryMessageSummary, from a byte offset on: the log is
+stat()ed every HISTORY_FOLLOW_POLL_INTERVAL and only the bytes past the
+offset are read, and only once a line is complete. Polling works the same
+on every platform and for archived logs, and a stat per follower per
+interval is cheap next to the output the runs produce.
+
+Every event carries the offset after its line as its SSE id, so a client
+that reconnects with Last-Event-ID (or ?offset=) resumes where it was, and
+watching a session costs only the new bytes. Message indices match the
+history APIs, /messages/{index}/output serves the output of a followed
+message.
+"""
+
+import os
+import asyncio
+from typing import Optional, List, Tuple, AsyncIterator
+
+from .history_index import history_index
+from .history_reader import line_spans, summarize_line
+from .history_archive import open_log, split_archived
+from ..config import settings
+
+# Bytes read at a time, more only when a single line is longer
+FOLLOW_READ_SIZE = 1024 * 1024
+
+
+class FollowPosition:
+    """Where a follower is in a log: the next byte to read and the index of the next message."""
+
+    def __init__(self, file_path: str, offset: int, index: int):
+        self.file_path = file_path
+        self.offset = offset
+        self.index = index
+
+
+def start_position(
+    source: str,
+    session_id: str,
+    offset: Optional[int] = None,
+    start: Optional[int] = None
+) -> Optional[FollowPosition]:
+    """
+    Find where to follow a conversation from.
+
+    Args:
+        source: Index source of the conversation
+        session_id: Session ID
+        offset: Byte offset, the id of the last event a client received
+        start: Index of the first message to send, when there is no offset
+            (default: only messages appended from now on)
+
+    Returns:
+        FollowPosition, or None if the conversation is not found
+
+    Raises:
+        ValueError: If the offset is not the end of a line of the log
+    """
+    resolved = history_index.resolve(source, session_id)
+    if resolved is None:
+        return None
+    file_path = resolved[0]
+
+    with open_log(file_path) as f:
+        spans = line_spans(source, session_id, file_path, f)
+        # The last line may still be being written
+        complete = len(spans)
+        if spans:
+            f.seek(spans[-1][1])
+            if f.read(1) != b'\n':
+                complete -= 1
+
+        if offset is not None:
+            end = spans[complete - 1][1] + 1 if complete else 0
+            if offset > end or (offset > 0 and not any(span[1] + 1 == offset for span in spans[:complete])):
+                raise ValueError(f"Offset {offset} is not the end of a message of {session_id}")
+            index = sum(1 for span in spans if span[1] < offset)
+            return FollowPosition(file_path, offset, index)
+
+        index = complete if start is None else min(start, len(spans))
+        if index < len(spans):
+            return FollowPosition(file_path, spans[index][0], index)
+        return FollowPosition(file_path, spans[-1][1] + 1 if spans else 0, index)
+
+
+def _read_lines(file_path: str, offset: int) -> Tuple[List[Tuple[bytes, int]], int]:
+    """
+    Read the complete lines of a log from byte `offset`.
+
+    Returns:
+        ([(line, offset after it), ...], offset after the last complete line)
+    """
+    with open_log(file_path) as f:
+        f.seek(offset)
+        data = f.read(FOLLOW_READ_SIZE)
+        while data and b'\n' not in data:
+            more = f.read(FOLLOW_READ_SIZE)
+            if not more:
+                break
+            data += more
+
+    lines = []
+    pos = 0
+    while True:
+        newline = data.find(b'\n', pos)
+        if newline < 0:
+            break
+        lines.append((data[pos:newline], offset + newline + 1))
+        pos = newline + 1
+    return lines, offset + pos
+
+
+async def follow(
+    source: str,
+    session_id: str,
+    position: FollowPosition
+) -> AsyncIterator[dict]:
+    """
+    Yield SSE events for the messages appended to a conversation's log.
+
+    "message" events carry a HistoryMessageSummary and the byte offset after
+    the message as their id. A "reset" event ends the stream if the log was
+    rewritten or removed, offsets no longer apply and the client should
+    reload the conversation.
+    """
+    size = None
+    while True:
+        file_path = position.file_path
+        if split_archived(file_path) is not None:
+            # Archived logs don't change, unless a new message thaws them back into the tree
+            resolved = await asyncio.to_thread(history_index.resolve, source, session_id)
+            if resolved is None:
+                yield {"event": "reset", "data": "{}"}
+                return
+            position.file_path = resolved[0]
+        else:
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:
+                # Moved, or archived meanwhile
+                resolved = await asyncio.to_thread(history_index.resolve, source, session_id)
+                if resolved is None or resolved[0] == file_path:
+                    yield {"event": "reset", "data": "{}"}
+                    return
+                position.file_path = resolved[0]
+                continue
+
+            if stat.st_size < position.offset:
+                print(f"[history_follow] Log of {session_id} was rewritten, stopping")
+                yield {"event": "reset", "data": "{}"}
+                return
+
+            if stat.st_size != size and stat.st_size > position.offset:
+                lines, offset = await asyncio.to_thread(_read_lines, file_path, position.offset)
+                for line, end in lines:
+                    if not line.strip():
+                        continue
+                    index = position.index
+                    position.index += 1
+                    try:
+                        summary = summarize_line(index, line)
+                    except ValueError:
+                        print(f"[history_follow] Skipping unreadable message {index} of {session_id}")
+                        continue
+                    yield {"event": "message", "id": str(end), "data": summary.model_dump_json()}
+                position.offset = offset
+                # Stat again right away while a long backlog is being read
+                size = stat.st_size if offset >= stat.st_size or not lines else None
+                if size is None:
+                    continue
+
+        await asyncio.sleep(settings.HISTORY_FOLLOW_POLL_INTERVAL)
@@ -0,0 +1,949 @@
+"""
+SQLite index over the history and heartbeat JSONL files.
+
+The JSONL files under AGENT_HOME_PATH stay the source of truth. This index
+keeps one row per conversation (session id, file path, creation time, preview,
+message count, source and last update) so the sidebar and conversation lookups
+are indexed queries instead of a walk over the whole tree. save_message()
+updates it on every append; rebuild() (`admin.py reindex`) recreates it from
+the files. It is built automatically the first time it is opened and whenever
+AGENT_HOME_PATH changes.
+
+resolve() maps a session to its log file for every append: an in-memory LRU
+answers repeat lookups with a single stat(), the index table is the persistent
+manifest behind it. A file that was moved by hand is looked up by name in its
+tree and the manifest is corrected.
+
+messages_fts is an FTS5 table with one row per message, filled by the same
+record_message() call. It holds the message content and, with
+HISTORY_SEARCH_INCLUDE_OUTPUT, the text of its serialized_output, and backs
+search() with bm25 ranking, snippets, source/date filters and cursor paging.
+A search ranks a window of the newest SEARCH_WINDOW matches and pages through
+a snapshot of that ranking, then continues with the next older window. The
+facets column holds the source and day/month/year tokens of each message, so
+source and date filters are part of the FTS match instead of a check of every
+matching row.
+
+line_offsets is the byte-offset sidecar of history_reader: the byte range of
+every line of a log, so single messages can be read with one seek.
+
+Logs rolled into a monthly archive by history_archive are recorded with the
+path `{dir}/archive/YYYY-MM.zip!{member}` and are indexed like any other.
+"""
+
+import io
+import os
+import re
+import calendar
+import json
+import base64
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+from typing import Optional, List, Tuple, Dict, Any, Iterator
+
+from ..config import settings
+from .history_codec import decode_output
+
+SOURCE_CHAT = "chat"
+SOURCE_TELEGRAM = "telegram"
+SOURCE_HEARTBEAT = "heartbeat"
+
+TELEGRAM_PREFIX = "telegram-"
+
+# Directory under AGENT_HOME_PATH and file suffix of each kind of log
+HISTORY_DIR = "history"
+HISTORY_SUFFIX = ".user.jsonl"
+HEARTBEAT_DIR = "heartbeat"
+HEARTBEAT_SUFFIX = ".heartbeat.jsonl"
+
+# Monthly archives live in {dir}/archive, archived paths are `{archive}!{member}`
+ARCHIVE_DIR = "archive"
+ARCHIVE_SEPARATOR = "!"
+
+# Length of the first message kept as the conversation preview
+PREVIEW_LENGTH = 100
+
+# Session -> file entries kept in memory for the append path
+PATH_CACHE_SIZE = 4096
+
+# Bump to rebuild indexes created by an older layout
+SCHEMA_VERSION = "4"
+
+# serialized_output tags that carry no searchable text
+UNSEARCHABLE_TAGS = ('meta', 'title', 'user', 'tokens_used', 'done', 'session')
+
+# Cap on the serialized_output text indexed per message
+MAX_OUTPUT_INDEX_CHARS = 100_000
+
+# Search score: bm25 with content weighing twice the output text, lower is better;
+# facets only filter
+SEARCH_RANK = "bm25(messages_fts, 1.0, 0.5, 0.0)"
+
+# Matches ranked together, the newest ones first; older matches follow in further windows
+SEARCH_WINDOW = 5000
+
+# Ranked windows kept for paging
+SEARCH_SNAPSHOTS = 16
+
+# Search result snippets: tokens of context and match markers (markdown bold)
+SNIPPET_TOKENS = 16
+SNIPPET_MARKERS = ('**', '**')
+
+# How long a writer waits for another process holding the database
+BUSY_TIMEOUT = 10.0
+
+# Recreated by every rebuild, so a layout change needs no migration
+MESSAGES_FTS = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    content,
+    output,
+    facets,
+    source UNINDEXED,
+    session_id UNINDEXED,
+    seq UNINDEXED,
+    role UNINDEXED,
+    timestamp UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+SCHEMA = MESSAGES_FTS + """
+CREATE TABLE IF NOT EXISTS conversations (
+    source TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    path TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    first_message TEXT NOT NULL DEFAULT '',
+    message_count INTEGER NOT NULL DEFAULT 0,
+    last_updated TEXT NOT NULL,
+    PRIMARY KEY (source, session_id)
+);
+CREATE INDEX IF NOT EXISTS conversations_by_source_created
+    ON conversations (source, created_at DESC, session_id DESC);
+CREATE INDEX IF NOT EXISTS conversations_by_created
+    ON conversations (created_at DESC, session_id DESC);
+CREATE TABLE IF NOT EXISTS line_offsets (
+    source TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    ranges BLOB NOT NULL,
+    PRIMARY KEY (source, session_id)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def history_source(session_id: str) -> str:
+    """Source of a conversation stored under history/"""
+    if session_id.startswith(TELEGRAM_PREFIX):
+        return SOURCE_TELEGRAM
+    return SOURCE_CHAT
+
+
+def parse_log_filename(filename: str) -> Optional[Tuple[str, str]]:
+    """
+    Split `{yyyy-mm-ddThh-MM-ss.sss}.{session_id}.{kind}.jsonl` into
+    (ISO timestamp, session_id), or None if the name does not match.
+    """
+    parts = filename.rsplit('.', 3)
+    if len(parts) < 4:
+        return None
+    timestamp_str, session_id = parts[0], parts[1]
+
+    # 2026-01-31T17-11-27.440 -> 2026-01-31T17:11:27.440
+    if 'T' in timestamp_str:
+        date_part, time_part = timestamp_str.split('T', 1)
+        timestamp_str = f"{date_part}T{time_part.replace('-', ':')}"
+    return timestamp_str, session_id
+
+
+def output_text(serialized_output: Optional[List[dict]]) -> str:
+    """Searchable text of a message's serialized_output"""
+    if not serialized_output or not settings.HISTORY_SEARCH_INCLUDE_OUTPUT:
+        return ''
+    parts = []
+    size = 0
+    for event in serialized_output:
+        if event.get('tag') in UNSEARCHABLE_TAGS:
+            continue
+        data = event.get('data')
+        if not isinstance(data, str):
+            continue
+        parts.append(data)
+        size += len(data)
+        if size >= MAX_OUTPUT_INDEX_CHARS:
+            break
+    return ''.join(parts)[:MAX_OUTPUT_INDEX_CHARS]
+
+
+def build_match_query(query: str, include_output: bool) -> Optional[str]:
+    """
+    Turn a search box query into an FTS5 expression.
+    
+    Words are ANDed prefix matches (so inflected and particle-suffixed words
+    are found), "quoted text" is an exact phrase. Anything else is quoted, so
+    user input can never be an FTS syntax error.
+    """
+    terms = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\S+)', query):
+        if phrase.strip():
+            terms.append('"' + phrase.strip() + '"')
+            continue
+        word = word.strip('"*')
+        if word:
+            terms.append('"' + word.replace('"', '""') + '"*')
+    if not terms:
+        return None
+    expression = ' '.join(terms)
+    return f'{{content output}} : ({expression})' if include_output else f'{{content}} : ({expression})'
+
+
+def message_facets(source: str, timestamp: str) -> str:
+    """facets column of a message: its source and the year, month and day of its timestamp"""
+    facets = [f"s{source}"]
+    day = timestamp[:10].replace('-', '')
+    if len(day) == 8 and day.isdigit():
+        facets += [f"y{day[:4]}", f"m{day[:6]}", f"d{day}"]
+    return ' '.join(facets)
+
+
+def _day_range_facets(first: date, last: date) -> List[str]:
+    """Fewest year, month and day facets covering the days first to last"""
+    facets = []
+    day = first
+    while day <= last:
+        month_end = day.replace(day=calendar.monthrange(day.year, day.month)[1])
+        if day.month == 1 and day.day == 1 and date(day.year, 12, 31) <= last:
+            facets.append(f"y{day.year:04d}")
+            day = date(day.year, 12, 31)
+        elif day.day == 1 and month_end <= last:
+            facets.append(f"m{day.year:04d}{day.month:02d}")
+            day = month_end
+        else:
+            facets.append(f"d{day.year:04d}{day.month:02d}{day.day:02d}")
+        if day == date.max:
+            break
+        day += timedelta(days=1)
+    return facets
+
+
+def _date_bound(value: str, last: bool) -> Optional[date]:
+    """First (or last) day of an ISO date, month or year prefix, None if it isn't one"""
+    try:
+        if len(value) >= 10:
+            return date.fromisoformat(value[:10])
+        if len(value) == 7:
+            first = date.fromisoformat(value + '-01')
+            return first.replace(day=calendar.monthrange(first.year, first.month)[1]) if last else first
+        if len(value) == 4 and value.isdigit():
+            return date(int(value), 12, 31) if last else date(int(value), 1, 1)
+    except ValueError:
+        pass
+    return None
+
+
+def encode_cursor(*key: Any) -> str:
+    """Opaque pagination cursor holding the sort key of the last row of a page"""
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_cursor(cursor: str, *types: type) -> Tuple:
+    """Inverse of encode_cursor(), converting each key part with types"""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(key, list) or len(key) != len(types):
+            raise ValueError
+        return tuple(kind(value) for kind, value in zip(types, key))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+def _stored_output(stored) -> Optional[List[dict]]:
+    """serialized_output of a log line in the API shape, None if it can't be expanded here"""
+    try:
+        return decode_output(stored)
+    except (ValueError, TypeError, IndexError) as e:
+        print(f"[history_index] Skipping unreadable serialized_output: {e}")
+        return None
+
+
+def _scan_log(file_path: str, any_role_preview: bool) -> Tuple[str, int, Optional[str], List[Tuple]]:
+    """Return (preview, message count, last message timestamp, messages) of a JSONL log"""
+    preview = ''
+    count = 0
+    last_timestamp = None
+    messages = []
+    # history_archive reads logs through this module
+    from .history_archive import open_log
+
+    with io.TextIOWrapper(open_log(file_path), encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            count += 1
+            try:
+                msg = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            content = msg.get('content') or ''
+            if not preview and (any_role_preview or msg.get('role') == 'user'):
+                preview = content[:PREVIEW_LENGTH]
+            last_timestamp = msg.get('timestamp') or last_timestamp
+            messages.append((
+                count - 1, msg.get('role') or '', msg.get('timestamp') or '', content,
+                output_text(_stored_output(msg.get('serialized_output')))
+            ))
+    return preview, count, last_timestamp, messages
+
+
+class HistoryIndex:
+    """Process-wide handle on the history index database."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_path: Optional[str] = None
+        self._agent_home: Optional[str] = None
+        # (source, session_id) -> (relative path, created_at)
+        self._paths: "OrderedDict[Tuple[str, str], Tuple[str, str]]" = OrderedDict()
+        # (db path, match, filters, upper rowid) -> (ranked (rowid, score), next window's upper rowid)
+        self._snapshots: "OrderedDict[Tuple, Tuple[List[Tuple[int, float]], Optional[int]]]" = OrderedDict()
+        self._snapshots_lock = threading.Lock()
+        # Bumped on every change to the conversations, see `version`
+        self._changes = 0
+        self._instance = os.urandom(4).hex()
+
+    @property
+    def version(self) -> str:
+        """
+        Token that changes whenever a conversation is added, appended to, moved
+        or dropped, for validating cached listings.
+
+        Changes made by another process (admin.py) are not seen, the token is
+        new on every start. Opens (and if needed builds) the index first, so
+        the token covers the build.
+        """
+        with self._lock:
+            self._connect()
+            return f"{self._instance}.{self._changes}"
+
+    @property
+    def db_path(self) -> str:
+        return os.path.join(settings.STORAGE_PATH, "history_index.sqlite3")
+
+    def _open(self) -> sqlite3.Connection:
+        """Return the open connection to the current database. Caller holds the lock."""
+        db_path = self.db_path
+        if self._conn is not None and self._db_path != db_path:
+            self._conn.close()
+            self._conn = None
+            self._paths.clear()
+            self._snapshots.clear()
+        if self._conn is None:
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+            conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._conn, self._db_path = conn, db_path
+        return self._conn
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return the open connection, (re)building the index when needed. Caller holds the lock."""
+        if self._conn is not None and self._db_path == self.db_path and self._agent_home == settings.AGENT_HOME_PATH:
+            return self._conn
+
+        self._open()
+        # The index describes one AGENT_HOME_PATH with one layout, build it if needed
+        agent_home = settings.AGENT_HOME_PATH
+        meta = dict(self._conn.execute("SELECT key, value FROM meta").fetchall())
+        if meta.get('agent_home') != agent_home or meta.get('schema') != SCHEMA_VERSION:
+            self._rebuild(agent_home)
+        self._agent_home = agent_home
+        return self._conn
+
+    def _rebuild(self, agent_home: str) -> Dict[str, int]:
+        """Recreate every row from the JSONL files. Caller holds the lock."""
+        # Pick one file per conversation, the oldest if a session somehow has several
+        chosen: Dict[Tuple[str, str], Tuple[str, str, bool]] = {}
+        for directory, suffix, any_role_preview in (
+            (HISTORY_DIR, HISTORY_SUFFIX, False),
+            (HEARTBEAT_DIR, HEARTBEAT_SUFFIX, True),
+        ):
+            for root, dirs, files in os.walk(os.path.join(agent_home, directory)):
+                for filename in files:
+                    if not filename.endswith(suffix):
+                        continue
+                    parsed = parse_log_filename(filename)
+                    if parsed is None:
+                        continue
+                    created_at, session_id = parsed
+                    source = SOURCE_HEARTBEAT if directory == HEARTBEAT_DIR else history_source(session_id)
+                    existing = chosen.get((source, session_id))
+                    if existing is not None and existing[1] <= created_at:
+                        continue
+                    chosen[(source, session_id)] = (os.path.join(root, filename), created_at, any_role_preview)
+
+            # Archived logs, a copy thawed back into the tree takes precedence
+            from .history_archive import archived_logs
+            for file_path, session_id, created_at in archived_logs(os.path.join(agent_home, directory)):
+                source = SOURCE_HEARTBEAT if directory == HEARTBEAT_DIR else history_source(session_id)
+                existing = chosen.get((source, session_id))
+                if existing is not None and existing[1] <= created_at:
+                    continue
+                chosen[(source, session_id)] = (file_path, created_at, any_role_preview)
+
+        counts: Dict[str, int] = {}
+        messages = 0
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM conversations")
+            conn.execute("DROP TABLE IF EXISTS messages_fts")
+            conn.execute(MESSAGES_FTS)
+            conn.execute("DELETE FROM line_offsets")
+            # Oldest first, so rowid order follows time like live inserts do
+            for (source, session_id), (file_path, created_at, any_role_preview) in sorted(
+                chosen.items(), key=lambda item: item[1][1]
+            ):
+                try:
+                    preview, count, last_timestamp, rows = _scan_log(file_path, any_role_preview)
+                except (OSError, UnicodeDecodeError) as e:
+                    print(f"[history_index] Error reading {file_path}: {e}")
+                    continue
+                conn.execute(
+                    "INSERT INTO conversations (source, session_id, path, created_at, first_message, message_count, last_updated) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (source, session_id, os.path.relpath(file_path, agent_home), created_at, preview, count,
+                     last_timestamp or created_at)
+                )
+                conn.executemany(
+                    "INSERT INTO messages_fts (content, output, facets, source, session_id, seq, role, timestamp) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    ((content, output, message_facets(source, timestamp), source, session_id, seq, role, timestamp)
+                     for seq, role, timestamp, content, output in rows)
+                )
+                counts[source] = counts.get(source, 0) + 1
+                messages += len(rows)
+            conn.executemany(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                (('agent_home', agent_home), ('schema', SCHEMA_VERSION))
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self._paths.clear()
+        self._snapshots.clear()
+        self._changes += 1
+
+        print(f"[history_index] Indexed {sum(counts.values())} conversations, {messages} messages from {agent_home}")
+        return counts
+
+    def rebuild(self) -> Dict[str, int]:
+        """Rebuild the index from the JSONL files, returning the number of conversations per source."""
+        with self._lock:
+            self._open()
+            counts = self._rebuild(settings.AGENT_HOME_PATH)
+            self._agent_home = settings.AGENT_HOME_PATH
+            return counts
+
+    def _remember(self, key: Tuple[str, str], rel_path: str, created_at: str):
+        self._paths[key] = (rel_path, created_at)
+        self._paths.move_to_end(key)
+        if len(self._paths) > PATH_CACHE_SIZE:
+            self._paths.popitem(last=False)
+
+    def _relocate(self, source: str, session_id: str, rel_path: str) -> Optional[str]:
+        """Find a log file that is no longer at rel_path. Caller holds the lock."""
+        directory, suffix = (HEARTBEAT_DIR, HEARTBEAT_SUFFIX) if source == SOURCE_HEARTBEAT else (HISTORY_DIR, HISTORY_SUFFIX)
+        filename = os.path.basename(rel_path)
+        tail = f".{session_id}{suffix}"
+        agent_home = settings.AGENT_HOME_PATH
+
+        # Most likely spot first: the date directory encoded in the file name
+        parsed = parse_log_filename(filename)
+        if parsed is not None:
+            date = parsed[0].split('T', 1)[0].split('-')
+            candidate = os.path.join(agent_home, directory, *date, filename)
+            if len(date) == 3 and os.path.exists(candidate):
+                return os.path.relpath(candidate, agent_home)
+
+        for root, dirs, files in os.walk(os.path.join(agent_home, directory)):
+            for name in files:
+                if name == filename or name.endswith(tail):
+                    return os.path.relpath(os.path.join(root, name), agent_home)
+
+        # Rolled into an archive, e.g. by `admin.py archive-history` while the server is up
+        from .history_archive import archived_logs
+        for file_path, archived_id, created_at in archived_logs(os.path.join(agent_home, directory)):
+            if archived_id == session_id:
+                return os.path.relpath(file_path, agent_home)
+        return None
+
+    @staticmethod
+    def _stored_path(conn: sqlite3.Connection, key: Tuple[str, str]) -> Optional[Tuple[str, str]]:
+        row = conn.execute(
+            "SELECT path, created_at FROM conversations WHERE source = ? AND session_id = ?", key
+        ).fetchone()
+        return (row["path"], row["created_at"]) if row is not None else None
+
+    @staticmethod
+    def _exists(rel_path: str) -> bool:
+        # An archived log exists as long as its archive does
+        return os.path.exists(os.path.join(settings.AGENT_HOME_PATH, rel_path.split(ARCHIVE_SEPARATOR, 1)[0]))
+
+    def resolve(self, source: str, session_id: str) -> Optional[Tuple[str, str]]:
+        """
+        Return (absolute path, created_at) of a conversation's log file, or None.
+        
+        Entries whose file was moved are repaired, ones whose file is gone are dropped.
+        """
+        key = (source, session_id)
+        with self._lock:
+            conn = self._connect()
+            cached = self._paths.get(key)
+            if cached is None:
+                cached = self._stored_path(conn, key)
+                if cached is None:
+                    return None
+            rel_path, created_at = cached
+
+            if not self._exists(rel_path) and key in self._paths:
+                # Another process (admin.py) may have moved it and updated the row
+                self._paths.pop(key, None)
+                stored = self._stored_path(conn, key)
+                if stored is None:
+                    return None
+                rel_path, created_at = stored
+
+            if not self._exists(rel_path):
+                moved = self._relocate(source, session_id, rel_path)
+                if moved is None:
+                    print(f"[history_index] Log of {session_id} is gone, dropping it from the index")
+                    self._paths.pop(key, None)
+                    conn.execute("DELETE FROM conversations WHERE source = ? AND session_id = ?", key)
+                    conn.execute("DELETE FROM messages_fts WHERE source = ? AND session_id = ?", key)
+                    conn.execute("DELETE FROM line_offsets WHERE source = ? AND session_id = ?", key)
+                    self._changes += 1
+                    return None
+                print(f"[history_index] Log of {session_id} moved to {moved}")
+                conn.execute(
+                    "UPDATE conversations SET path = ? WHERE source = ? AND session_id = ?", (moved, *key)
+                )
+                self._changes += 1
+                rel_path = moved
+
+            self._remember(key, rel_path, created_at)
+            return os.path.join(settings.AGENT_HOME_PATH, rel_path), created_at
+
+    def record_message(
+        self,
+        source: str,
+        session_id: str,
+        file_path: str,
+        created_at: str,
+        role: str,
+        content: str,
+        timestamp: str,
+        preview: Optional[str] = None,
+        serialized_output: Optional[List[dict]] = None
+    ):
+        """
+        Account for one message appended to a conversation log.
+
+        Args:
+            source: SOURCE_CHAT, SOURCE_TELEGRAM or SOURCE_HEARTBEAT
+            session_id: Conversation session ID
+            file_path: Absolute path of the JSONL file
+            created_at: Creation timestamp of the conversation (from the file name)
+            role: Role of the appended message
+            content: Content of the appended message
+            timestamp: Timestamp of the appended message
+            preview: Content of the message if it can serve as the conversation preview
+            serialized_output: Output events of the message, searchable with HISTORY_SEARCH_INCLUDE_OUTPUT
+        """
+        rel_path = os.path.relpath(file_path, settings.AGENT_HOME_PATH)
+        preview = (preview or '')[:PREVIEW_LENGTH]
+        output = output_text(serialized_output)
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                previous = conn.execute(
+                    "SELECT path FROM conversations WHERE source = ? AND session_id = ?", (source, session_id)
+                ).fetchone()
+                if previous is not None and previous["path"] != rel_path:
+                    # The conversation restarted in a new file
+                    conn.execute("DELETE FROM messages_fts WHERE source = ? AND session_id = ?", (source, session_id))
+                count = conn.execute(
+                    "INSERT INTO conversations (source, session_id, path, created_at, first_message, message_count, last_updated) "
+                    "VALUES (?, ?, ?, ?, ?, 1, ?) "
+                    "ON CONFLICT (source, session_id) DO UPDATE SET "
+                    "  message_count = CASE WHEN path = excluded.path THEN message_count + 1 ELSE 1 END, "
+                    "  first_message = CASE WHEN path = excluded.path AND first_message != '' "
+                    "    THEN first_message ELSE excluded.first_message END, "
+                    "  created_at = CASE WHEN path = excluded.path THEN created_at ELSE excluded.created_at END, "
+                    "  path = excluded.path, "
+                    "  last_updated = excluded.last_updated "
+                    "RETURNING message_count",
+                    (source, session_id, rel_path, created_at, preview, timestamp)
+                ).fetchone()[0]
+                conn.execute(
+                    "INSERT INTO messages_fts (content, output, facets, source, session_id, seq, role, timestamp) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (content, output, message_facets(source, timestamp), source, session_id, count - 1, role, timestamp)
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self._remember((source, session_id), rel_path, created_at)
+            self._changes += 1
+
+    def load_line_offsets(self, source: str, session_id: str) -> Optional[Tuple[str, int, bytes]]:
+        """Return the stored (absolute path, covered size, ranges) of a log's line offsets, or None."""
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT path, size, ranges FROM line_offsets WHERE source = ? AND session_id = ?", (source, session_id)
+            ).fetchone()
+        if row is None:
+            return None
+        return os.path.join(settings.AGENT_HOME_PATH, row["path"]), row["size"], row["ranges"]
+
+    def store_line_offsets(self, source: str, session_id: str, file_path: str, size: int, ranges: bytes):
+        """Save the line offsets of a log covering its first `size` bytes."""
+        rel_path = os.path.relpath(file_path, settings.AGENT_HOME_PATH)
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO line_offsets (source, session_id, path, size, ranges) VALUES (?, ?, ?, ?, ?)",
+                (source, session_id, rel_path, size, ranges)
+            )
+
+    def move_log(self, source: str, session_id: str, old_path: str, new_path: str):
+        """Point a conversation whose log was archived or thawed at its new path."""
+        old_rel = os.path.relpath(old_path, settings.AGENT_HOME_PATH)
+        new_rel = os.path.relpath(new_path, settings.AGENT_HOME_PATH)
+        key = (source, session_id)
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                moved = conn.execute(
+                    "UPDATE conversations SET path = ? WHERE source = ? AND session_id = ? AND path = ?",
+                    (new_rel, *key, old_rel)
+                ).rowcount
+                if moved:
+                    conn.execute("DELETE FROM line_offsets WHERE source = ? AND session_id = ?", key)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self._paths.pop(key, None)
+            self._changes += 1
+
+    def forget_log(self, source: str, session_id: str, file_path: str):
+        """Drop a conversation whose log was deleted by retention."""
+        rel_path = os.path.relpath(file_path, settings.AGENT_HOME_PATH)
+        key = (source, session_id)
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if conn.execute(
+                    "DELETE FROM conversations WHERE source = ? AND session_id = ? AND path = ?", (*key, rel_path)
+                ).rowcount:
+                    conn.execute("DELETE FROM messages_fts WHERE source = ? AND session_id = ?", key)
+                    conn.execute("DELETE FROM line_offsets WHERE source = ? AND session_id = ?", key)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self._paths.pop(key, None)
+            self._changes += 1
+
+    def clear_line_offsets(self):
+        """Forget every stored line offset, after logs were rewritten."""
+        with self._lock:
+            self._connect().execute("DELETE FROM line_offsets")
+
+    def _reader(self) -> sqlite3.Connection:
+        """
+        Separate connection for a long read, so it never holds up the writers.
+        
+        Builds the index first if needed. The caller closes it.
+        """
+        with self._lock:
+            self._connect()
+        conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _list_filter(self, sources: Tuple[str, ...], exclude_prefix: Optional[str]) -> Tuple[str, List[Any]]:
+        # One source walks its (source, created_at) index; for several, `+source`
+        # makes SQLite walk the created_at index in order instead of sorting every row
+        column = "source" if len(sources) == 1 else "+source"
+        where = f"{column} IN ({', '.join('?' for _ in sources)})"
+        params: List[Any] = list(sources)
+        if exclude_prefix:
+            where += " AND substr(session_id, 1, ?) != ?"
+            params += [len(exclude_prefix), exclude_prefix]
+        return where, params
+
+    def count_conversations(self, sources: Tuple[str, ...], exclude_prefix: Optional[str] = None) -> int:
+        where, params = self._list_filter(sources, exclude_prefix)
+        with self._lock:
+            conn = self._connect()
+            return conn.execute(f"SELECT COUNT(*) FROM conversations WHERE {where}", params).fetchone()[0]
+
+    def iter_conversations(
+        self,
+        sources: Tuple[str, ...],
+        limit: int,
+        offset: int = 0,
+        cursor: Optional[str] = None,
+        exclude_prefix: Optional[str] = None
+    ) -> Iterator[sqlite3.Row]:
+        """
+        Yield up to limit conversations, newest first, as they are read.
+        
+        With a cursor (see list_cursor()) the page starts right after the row
+        it was made from, an indexed range scan whose cost does not depend on
+        how much history precedes it; otherwise offset rows are skipped.
+        
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        where, params = self._list_filter(sources, exclude_prefix)
+        if cursor:
+            created_at, session_id = decode_cursor(cursor, str, str)
+            where += " AND (created_at, session_id) < (?, ?)"
+            params += [created_at, session_id]
+            offset = 0
+
+        conn = self._reader()
+        try:
+            rows = conn.execute(
+                f"SELECT * FROM conversations WHERE {where} "
+                "ORDER BY created_at DESC, session_id DESC LIMIT ? OFFSET ?",
+                params + [limit, offset]
+            )
+            while True:
+                batch = rows.fetchmany(100)
+                if not batch:
+                    break
+                yield from batch
+        finally:
+            conn.close()
+
+    @staticmethod
+    def list_cursor(row: sqlite3.Row) -> str:
+        """Cursor for the page following row"""
+        return encode_cursor(row["created_at"], row["session_id"])
+
+    def search(
+        self,
+        query: str,
+        sources: Tuple[str, ...],
+        limit: int,
+        cursor: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        include_output: bool = False
+    ) -> Tuple[List[Dict[str, Any]], Optional[str], bool]:
+        """
+        Full-text search over indexed messages, best matches first.
+
+        Matches are ranked in windows of the SEARCH_WINDOW newest, so a common
+        word costs about what a rare one does; the pages of a window are best
+        first, then the cursor continues with the next older window.
+        
+        Args:
+            query: Search box text, see build_match_query()
+            sources: Sources to search
+            limit: Maximum number of results
+            cursor: next_cursor of the previous page
+            date_from: Earliest message timestamp, ISO date or datetime (inclusive)
+            date_to: Latest message timestamp, ISO date or datetime prefix (inclusive)
+            include_output: Also match the text of serialized_output
+            
+        Returns:
+            (results, next_cursor, older_matches), next_cursor is None on the
+            last page, older_matches is set when it leads to an older window
+
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        match = build_match_query(query, include_output)
+        if match is None or not sources:
+            return [], None, False
+
+        where, params = self._search_filter(match, sources, date_from, date_to)
+
+        upper, offset = decode_cursor(cursor, int, int) if cursor else (None, 0)
+        if offset < 0:
+            raise ValueError("Invalid cursor")
+
+        conn = self._reader()
+        try:
+            upper, ranked, older = self._ranked_window(conn, where, params, upper)
+            page = ranked[offset:offset + limit]
+            # Cursors hold the window and a position in its ranking, not a bm25 score
+            older_matches = False
+            if offset + limit < len(ranked):
+                next_cursor = encode_cursor(upper, offset + limit)
+            elif older is not None:
+                next_cursor = encode_cursor(older, 0)
+                older_matches = True
+            else:
+                next_cursor = None
+            if not page:
+                return [], next_cursor, older_matches
+
+            # One pass over the rowid range of the page; `+rowid IN` keeps the list a
+            # filter, as an index constraint FTS5 would re-run a prefix query per rowid
+            ids = [rowid for rowid, score in page]
+            details = {
+                row["rowid"]: row
+                for row in conn.execute(
+                    f"SELECT rowid, source, session_id, seq, role, timestamp, "
+                    f"snippet(messages_fts, -1, ?, ?, '…', ?) AS snippet "
+                    f"FROM messages_fts WHERE messages_fts MATCH ? AND rowid BETWEEN ? AND ? "
+                    f"AND +rowid IN ({', '.join('?' for _ in ids)})",
+                    (*SNIPPET_MARKERS, SNIPPET_TOKENS, match, min(ids), max(ids), *ids)
+                )
+            }
+        finally:
+            conn.close()
+
+        results = []
+        for rowid, score in page:
+            detail = details.get(rowid)
+            if detail is None:
+                continue
+            results.append({
+                "session_id": detail["session_id"],
+                "source": detail["source"],
+                "message_index": detail["seq"],
+                "role": detail["role"],
+                "timestamp": detail["timestamp"],
+                "snippet": detail["snippet"],
+                "score": score
+            })
+        return results, next_cursor, older_matches
+
+    def _search_filter(
+        self,
+        match: str,
+        sources: Tuple[str, ...],
+        date_from: Optional[str],
+        date_to: Optional[str]
+    ) -> Tuple[str, List[Any]]:
+        """
+        WHERE clause of a search. Sources and whole days are matched on the
+        facets column; the stored source and timestamp are only checked for
+        what facets can't express (a time of day, an unparseable date).
+        """
+        facets = []
+        where = ""
+        params: List[Any] = []
+        if not {SOURCE_CHAT, SOURCE_TELEGRAM, SOURCE_HEARTBEAT} <= set(sources):
+            facets.append(' OR '.join(f"s{source}" for source in sources))
+
+        if date_from or date_to:
+            first = _date_bound(date_from, last=False) if date_from else None
+            last = _date_bound(date_to, last=True) if date_to else None
+            parsed = not ((date_from and first is None) or (date_to and last is None))
+            if parsed and (first is None or last is None):
+                # Open ended: from the oldest or up to the newest message indexed
+                with self._lock:
+                    oldest, newest = self._connect().execute(
+                        "SELECT MIN(created_at), MAX(last_updated) FROM conversations"
+                    ).fetchone()
+                if first is None:
+                    first = _date_bound(oldest or '', last=False)
+                else:
+                    last = _date_bound(newest or '', last=True)
+                    last = max(last, date.today()) if last is not None else None
+            narrowed = first is not None and last is not None
+            if narrowed:
+                days = _day_range_facets(first, last)
+                # An empty range matches nothing
+                facets.append(' OR '.join(days) if days else 'snone')
+            if date_from and (not narrowed or len(date_from) > 10):
+                where += " AND timestamp >= ?"
+                params.append(date_from)
+            if date_to and (not narrowed or len(date_to) > 10):
+                where += " AND substr(timestamp, 1, ?) <= ?"
+                params += [len(date_to), date_to]
+
+        expression = match + ''.join(f" AND {{facets}} : ({facet})" for facet in facets)
+        return "messages_fts MATCH ?" + where, [expression, *params]
+
+    def _ranked_window(
+        self,
+        conn: sqlite3.Connection,
+        where: str,
+        params: List[Any],
+        upper: Optional[int]
+    ) -> Tuple[int, List[Tuple[int, float]], Optional[int]]:
+        """
+        Rank the newest SEARCH_WINDOW matches up to rowid upper (the newest
+        match when None), reusing the snapshot of an earlier page. Pages of a
+        snapshot don't shift as messages are indexed and bm25 statistics change.
+
+        Returns:
+            (upper rowid, [(rowid, score)] best first, upper rowid of the next older window or None)
+        """
+        filters = (self.db_path, where, tuple(params))
+        if upper is not None:
+            with self._snapshots_lock:
+                snapshot = self._snapshots.get((*filters, upper))
+                if snapshot is not None:
+                    self._snapshots.move_to_end((*filters, upper))
+                    return (upper, *snapshot)
+            where += " AND rowid <= ?"
+            params = params + [upper]
+
+        # Walks the matches newest first, scoring only those in the window
+        rows = conn.execute(
+            f"SELECT rowid, {SEARCH_RANK} FROM messages_fts WHERE {where} ORDER BY rowid DESC LIMIT ?",
+            params + [SEARCH_WINDOW + 1]
+        ).fetchall()
+        if not rows:
+            return upper or 0, [], None
+        older = rows[SEARCH_WINDOW][0] if len(rows) > SEARCH_WINDOW else None
+        window = [tuple(row) for row in rows[:SEARCH_WINDOW]]
+        if upper is None:
+            upper = window[0][0]
+        ranked = sorted(window, key=lambda row: (row[1], row[0]))
+
+        with self._snapshots_lock:
+            self._snapshots[(*filters, upper)] = (ranked, older)
+            while len(self._snapshots) > SEARCH_SNAPSHOTS:
+                self._snapshots.popitem(last=False)
+        return upper, ranked, older
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+            self._conn = None
+            self._db_path = None
+            self._agent_home = None
+            self._paths.clear()
+            self._snapshots.clear()
+
+
+# Singleton instance
+history_index = HistoryIndex()
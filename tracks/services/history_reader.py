@@ -0,0 +1,402 @@
+"""
+Random access to the history and heartbeat JSONL logs.
+
+get_conversation() parses every line of a log into HistoryMessage, including
+serialized_output, which is most of the file after agent runs. This module
+serves the cheaper reads: a summary of every message (role, content,
+timestamp, size) with the output left unparsed, and single messages or ranges
+of messages read by seeking straight to their lines, and a passthrough of
+whole conversations that streams the stored lines as they are.
+
+Line positions come from a byte-offset sidecar kept in the history index: the
+(start, end) byte range of every non-blank line and the number of bytes they
+cover. Logs are only appended to, so a sidecar that is behind is brought up to
+date by scanning just the new bytes for newlines. One whose file moved, shrank
+or no longer ends a line where it should is rebuilt from the start. Archived
+logs (history_archive) are read whole from their archive instead.
+"""
+
+import os
+import json
+from array import array
+from typing import Optional, List, Tuple, BinaryIO, Iterator
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from ..models.history import HistoryMessage, HistoryMessageSummary
+from .history_index import history_index
+from .history_codec import load_message, decode_output
+from .history_archive import open_log, split_archived
+
+# Bytes read at a time when scanning a log for lines
+SCAN_CHUNK_SIZE = 1024 * 1024
+
+# Bytes read at a time, backwards, when looking for the last lines of a log
+TAIL_BLOCK_SIZE = 64 * 1024
+
+# How save_message writes the key that follows role, content and timestamp
+OUTPUT_KEY = b',"serialized_output":'
+
+# How every stored message line starts, a quote inside a JSON string is always escaped
+MESSAGE_START = b'{"role":'
+
+# Bytes of lines read at a time when streaming a conversation
+PASSTHROUGH_CHUNK_SIZE = 256 * 1024
+
+# (start, end) byte range of a line, newline excluded
+Span = Tuple[int, int]
+
+
+def _scan_lines(f, start: int, limit: Optional[int] = None) -> Tuple[array, int, Optional[Span]]:
+    """
+    Find the non-blank lines of an open binary file from byte `start`,
+    stopping after `limit` lines if given.
+
+    Returns (flat array of start/end offsets of the complete lines, offset
+    after the last newline, span of an unterminated last line or None).
+    """
+    ranges = array('Q')
+    f.seek(start)
+    pos = start
+    line_start = start
+    has_text = False
+    while True:
+        chunk = f.read(SCAN_CHUNK_SIZE)
+        if not chunk:
+            break
+        i = 0
+        while True:
+            newline = chunk.find(b'\n', i)
+            if newline < 0:
+                break
+            if has_text or chunk[i:newline].strip():
+                ranges.append(line_start)
+                ranges.append(pos + newline)
+                if limit is not None and len(ranges) // 2 >= limit:
+                    return ranges, pos + newline + 1, None
+            line_start = pos + newline + 1
+            has_text = False
+            i = newline + 1
+        if not has_text and chunk[i:].strip():
+            has_text = True
+        pos += len(chunk)
+
+    tail = (line_start, pos) if has_text else None
+    return ranges, line_start, tail
+
+
+def _scan_lines_reverse(f, end: int, count: int) -> List[Span]:
+    """
+    Find the last `count` non-blank lines of an open binary file before byte
+    `end`, reading blocks backwards from it. An unterminated last line counts.
+
+    Returns their spans in file order.
+    """
+    spans: List[Span] = []
+    line_end = end
+    pos = end
+    # Bytes of the line being assembled that sit in blocks already read
+    pending = b''
+    while pos > 0 and len(spans) < count:
+        size = min(TAIL_BLOCK_SIZE, pos)
+        pos -= size
+        f.seek(pos)
+        block = f.read(size) + pending
+        i = len(block)
+        while len(spans) < count:
+            newline = block.rfind(b'\n', 0, i)
+            if newline < 0:
+                break
+            if block[newline + 1:i].strip():
+                spans.append((pos + newline + 1, line_end))
+            line_end = pos + newline
+            i = newline
+        pending = block[:i]
+    if pos == 0 and len(spans) < count and pending.strip():
+        spans.append((0, line_end))
+    spans.reverse()
+    return spans
+
+
+def line_spans(source: str, session_id: str, file_path: str, f: BinaryIO) -> List[Span]:
+    """Byte spans of every message line of an open log, updating its sidecar as needed."""
+    if split_archived(file_path) is not None:
+        # Archived logs are read whole and never change, no sidecar needed
+        ranges, covered, tail = _scan_lines(f, 0)
+        spans = list(zip(ranges[0::2], ranges[1::2]))
+        return spans + [tail] if tail is not None else spans
+
+    stored = history_index.load_line_offsets(source, session_id)
+    size = os.fstat(f.fileno()).st_size
+    ranges = array('Q')
+    covered = 0
+    if stored is not None:
+        stored_path, stored_size, stored_ranges = stored
+        # Still the same append-only file if the covered part ends where a line did
+        if stored_path == file_path and stored_size <= size:
+            if stored_size > 0:
+                f.seek(stored_size - 1)
+            if stored_size == 0 or f.read(1) == b'\n':
+                ranges.frombytes(stored_ranges)
+                covered = stored_size
+
+    tail = None
+    if covered < size:
+        new_ranges, new_covered, tail = _scan_lines(f, covered)
+        ranges.extend(new_ranges)
+        if stored is None or new_covered != covered or covered != stored[1]:
+            history_index.store_line_offsets(source, session_id, file_path, new_covered, ranges.tobytes())
+    elif stored is None or covered != stored[1]:
+        history_index.store_line_offsets(source, session_id, file_path, covered, ranges.tobytes())
+
+    spans = list(zip(ranges[0::2], ranges[1::2]))
+    if tail is not None:
+        # A line still being written, the readers skip it until it parses
+        spans.append(tail)
+    return spans
+
+
+def _read_spans(f: BinaryIO, spans: List[Span]) -> List[bytes]:
+    """Read consecutive line spans with a single seek."""
+    if not spans:
+        return []
+    first = spans[0][0]
+    f.seek(first)
+    data = f.read(spans[-1][1] - first)
+    return [data[start - first:end - first] for start, end in spans]
+
+
+def summarize_line(index: int, line: bytes) -> HistoryMessageSummary:
+    """Summary of one stored message, parsing serialized_output only when it can't be skipped."""
+    has_output = None
+    key = line.find(OUTPUT_KEY)
+    if key >= 0:
+        # A quote inside a JSON string is always escaped, so the first match is
+        # the key itself and everything before it is an object on its own
+        try:
+            msg = json.loads(line[:key] + b'}')
+            value = line[key + len(OUTPUT_KEY):key + len(OUTPUT_KEY) + 4].lstrip()
+            has_output = not (value.startswith(b'null') or value.startswith(b'[]'))
+        except ValueError:
+            pass
+    if has_output is None:
+        msg = json.loads(line)
+        has_output = bool(msg.get('serialized_output'))
+
+    return HistoryMessageSummary(
+        index=index,
+        role=msg.get('role') or '',
+        content=msg.get('content') or '',
+        timestamp=msg.get('timestamp') or '',
+        size=len(line),
+        has_output=has_output
+    )
+
+
+def _summarize_lines(session_id: str, lines: List[bytes], indices, last: int) -> List[HistoryMessageSummary]:
+    """Summarize lines, skipping unreadable ones (quietly for line `last`, which may be partly written)."""
+    summaries = []
+    for index, line in zip(indices, lines):
+        try:
+            summaries.append(summarize_line(index, line))
+        except ValueError:
+            if index != last:
+                print(f"[history_reader] Skipping unreadable message {index} of {session_id}")
+    return summaries
+
+
+def read_summaries(
+    source: str,
+    session_id: str,
+    tail: Optional[int] = None,
+    before: Optional[int] = None
+) -> Optional[Tuple[str, List[HistoryMessageSummary]]]:
+    """
+    Summarize the messages of a conversation: all of them, or the last `tail`
+    before index `before` (the end of the conversation by default). Only the
+    lines returned are read.
+
+    Returns:
+        (created_at, summaries), or None if the conversation is not found
+    """
+    resolved = history_index.resolve(source, session_id)
+    if resolved is None:
+        return None
+    file_path, created_at = resolved
+
+    with open_log(file_path) as f:
+        spans = line_spans(source, session_id, file_path, f)
+        end = len(spans) if before is None else min(before, len(spans))
+        start = 0 if tail is None else max(end - tail, 0)
+        lines = _read_spans(f, spans[start:end])
+    return created_at, _summarize_lines(session_id, lines, range(start, end), len(spans) - 1)
+
+
+def read_edges(
+    source: str,
+    session_id: str,
+    head: int,
+    tail: int
+) -> Optional[Tuple[List[HistoryMessageSummary], List[HistoryMessageSummary]]]:
+    """
+    Summarize the first `head` and the last `tail` messages of a conversation,
+    reading forward from the start and backwards from the end of the log, so
+    that the cost doesn't grow with its length and no line offsets are needed.
+
+    The last messages are numbered from the end, -1 being the last one.
+
+    Returns:
+        (first summaries, last summaries), or None if the conversation is not found
+    """
+    resolved = history_index.resolve(source, session_id)
+    if resolved is None:
+        return None
+    file_path = resolved[0]
+
+    with open_log(file_path) as f:
+        ranges, covered, partial = _scan_lines(f, 0, head)
+        head_spans = list(zip(ranges[0::2], ranges[1::2]))
+        if partial is not None:
+            head_spans.append(partial)
+        # One more than needed, in case the last line is still being written
+        tail_spans = _scan_lines_reverse(f, f.seek(0, os.SEEK_END), tail + 1)
+        head_lines = _read_spans(f, head_spans)
+        tail_lines = _read_spans(f, tail_spans)
+
+    first = _summarize_lines(session_id, head_lines, range(len(head_lines)), len(head_lines) - 1 if partial else -1)
+    last = _summarize_lines(session_id, tail_lines, range(-len(tail_lines), 0), -1)
+    return first[:head], last[-tail:] if tail else []
+
+
+def read_messages(
+    source: str,
+    session_id: str,
+    start: int = 0,
+    end: Optional[int] = None
+) -> Optional[Tuple[str, int, List[HistoryMessage]]]:
+    """
+    Read messages start..end (exclusive) of a conversation in full.
+
+    Returns:
+        (created_at, number of messages in the conversation, messages),
+        or None if the conversation is not found
+    """
+    resolved = history_index.resolve(source, session_id)
+    if resolved is None:
+        return None
+    file_path, created_at = resolved
+
+    with open_log(file_path) as f:
+        spans = line_spans(source, session_id, file_path, f)
+        lines = _read_spans(f, spans[start:end])
+    messages = []
+    for offset, line in enumerate(lines):
+        try:
+            messages.append(load_message(json.loads(line)))
+        except ValueError:
+            if start + offset < len(spans) - 1:
+                print(f"[history_reader] Skipping unreadable message {start + offset} of {session_id}")
+    return created_at, len(spans), messages
+
+
+def read_message(source: str, session_id: str, index: int) -> Optional[HistoryMessage]:
+    """Read one message of a conversation in full, or None if there is no such message."""
+    resolved = history_index.resolve(source, session_id)
+    if resolved is None:
+        return None
+    file_path = resolved[0]
+
+    with open_log(file_path) as f:
+        spans = line_spans(source, session_id, file_path, f)
+        if not 0 <= index < len(spans):
+            return None
+        line = _read_spans(f, [spans[index]])[0]
+    try:
+        return load_message(json.loads(line))
+    except ValueError:
+        return None
+
+
+def _loads(data: bytes):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def _dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _passthrough(line: bytes, complete: bool) -> Optional[bytes]:
+    """
+    A stored line as HistoryMessage JSON, or None if it doesn't parse.
+
+    The server validated messages when it wrote them, so a complete line
+    holding one whole message whose serialized_output is in the API shape
+    already is returned as it is. Compact output is expanded without
+    building models.
+    """
+    key = line.find(OUTPUT_KEY)
+    if (complete and key >= 0 and line.startswith(MESSAGE_START) and line.endswith(b'}')
+            and line.find(MESSAGE_START, 1) < 0):
+        # One message, not a torn write with the next one appended to it
+        value = line[key + len(OUTPUT_KEY):key + len(OUTPUT_KEY) + 1]
+        if value in (b'[', b'n'):
+            return line
+    try:
+        msg = _loads(line)
+        if not isinstance(msg, dict):
+            return None
+        if isinstance(msg.get('serialized_output'), dict):
+            msg['serialized_output'] = decode_output(msg['serialized_output'])
+    except ValueError:
+        return None
+    return _dumps(msg)
+
+
+def stream_messages(source: str, session_id: str) -> Optional[Tuple[str, Iterator[bytes]]]:
+    """
+    Stream every message of a conversation as HistoryMessage JSON, without
+    revalidating what the server stored.
+
+    The log is opened and its lines located before returning, the lines are
+    read while the iterator is consumed.
+
+    Returns:
+        (created_at, iterator of message JSON), or None if the conversation is not found
+    """
+    resolved = history_index.resolve(source, session_id)
+    if resolved is None:
+        return None
+    file_path, created_at = resolved
+
+    f = open_log(file_path)
+    try:
+        spans = line_spans(source, session_id, file_path, f)
+    except BaseException:
+        f.close()
+        raise
+
+    def generate() -> Iterator[bytes]:
+        try:
+            index = 0
+            while index < len(spans):
+                # Consecutive lines up to PASSTHROUGH_CHUNK_SIZE in one read
+                end = index + 1
+                while end < len(spans) and spans[end][1] - spans[index][0] <= PASSTHROUGH_CHUNK_SIZE:
+                    end += 1
+                for offset, line in enumerate(_read_spans(f, spans[index:end])):
+                    # The last line may still be being written, it is always parsed
+                    message = _passthrough(line, index + offset < len(spans) - 1)
+                    if message is not None:
+                        yield message
+                    elif index + offset < len(spans) - 1:
+                        print(f"[history_reader] Skipping unreadable message {index + offset} of {session_id}")
+                index = end
+        finally:
+            f.close()
+
+    return created_at, generate()
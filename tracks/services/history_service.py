@@ -4,17 +4,55 @@ History service for managing chat conversation storage.
 
 import os
 import json
-from datetime import datetime
-from typing import List, Tuple, Optional
+import asyncio
+import sqlite3
+from datetime import datetime, timedelta
+from typing import List, Tuple, Optional, Iterator, AsyncIterator, Callable
 from pathlib import Path
 
 from ..models.history import (
-    HistoryMessage,
     HistoryMetadata,
     HistoryListResponse,
-    HistoryDetailResponse
+    HistoryDetailResponse,
+    HistorySummaryResponse,
+    HistoryMessageSummary,
+    HistoryMessageRange,
+    HistoryMessageOutput,
+    HistorySearchResult,
+    HistorySearchResponse
 )
 from ..config import settings
+from .history_writer import history_writer
+from .history_codec import dump_message
+from . import history_reader, history_archive, history_follow
+from .history_index import (
+    history_index,
+    history_source,
+    parse_log_filename,
+    decode_cursor,
+    SOURCE_CHAT,
+    SOURCE_TELEGRAM,
+    SOURCE_HEARTBEAT
+)
+
+# Source names accepted by the API
+SOURCE_NAMES = {
+    "chat": SOURCE_CHAT,
+    "web": SOURCE_CHAT,
+    "telegram": SOURCE_TELEGRAM,
+    "heartbeat": SOURCE_HEARTBEAT
+}
+
+# The main history list: everything under history/ except Telegram
+LIST_SOURCES = (SOURCE_CHAT,)
+
+SEARCH_SOURCES = (SOURCE_CHAT, SOURCE_TELEGRAM, SOURCE_HEARTBEAT)
+
+# Streamed listings are sent in chunks of about this many bytes
+STREAM_CHUNK_SIZE = 16 * 1024
+
+# Streamed conversations in larger ones, each chunk is a hop to the threadpool
+DETAIL_CHUNK_SIZE = 256 * 1024
 
 
 def get_history_file_path(session_id: str, timestamp: datetime) -> str:
@@ -45,6 +83,54 @@ def get_history_file_path(session_id: str, timestamp: datetime) -> str:
     return os.path.join(history_dir, filename)
 
 
+def resolve_log_file(session_id: str, timestamp: datetime) -> Tuple[str, str]:
+    """
+    Find the existing history file of a session, or pick a new one.
+    
+    Returns:
+        (absolute path, conversation creation timestamp)
+    """
+    source = history_source(session_id)
+    resolved = history_index.resolve(source, session_id)
+    if resolved is not None:
+        # Archived conversations are copied back into the tree to be appended to
+        return history_archive.thaw(source, session_id, *resolved)
+    
+    file_path = get_history_file_path(session_id, timestamp)
+    # Ensure directory exists
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    return file_path, parse_log_filename(os.path.basename(file_path))[0]
+
+
+def index_message(
+    session_id: str,
+    file_path: str,
+    created_at: str,
+    role: str,
+    content: str,
+    timestamp: str,
+    serialized_output: Optional[List[dict]] = None
+) -> bool:
+    """Record a message appended to file_path in the history index, returning whether it was."""
+    try:
+        history_index.record_message(
+            history_source(session_id),
+            session_id,
+            file_path,
+            created_at,
+            role,
+            content,
+            timestamp,
+            serialized_output=serialized_output,
+            preview=content if role == 'user' else None
+        )
+    except sqlite3.Error as e:
+        # The JSONL file is the source of truth, `admin.py reindex` repairs the index
+        print(f"[history] Failed to index message of {session_id}: {e}")
+        return False
+    return True
+
+
 def save_message(
     session_id: str,
     role: str,
@@ -56,6 +142,8 @@ def save_message(
     """
     Save a message to history JSONL file.
     
+    Blocks on file I/O, async callers should use asave_message().
+    
     Args:
         session_id: Codex session ID
         role: "user" or "assistant"
@@ -71,187 +159,474 @@ def save_message(
         timestamp = datetime.now()
     
     # Find existing file for this session or create new one
-    history_dir = os.path.join(settings.AGENT_HOME_PATH, "history")
-    file_path = None
-    
-    # Search for existing file with this session_id
-    if os.path.exists(history_dir):
-        for root, dirs, files in os.walk(history_dir):
-            for filename in files:
-                if session_id in filename and filename.endswith('.user.jsonl'):
-                    file_path = os.path.join(root, filename)
-                    break
-            if file_path:
-                break
-    
-    # If no existing file, create new one with current timestamp
-    if not file_path:
-        file_path = get_history_file_path(session_id, timestamp)
-        # Ensure directory exists
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-    
-    # Create message object
-    message = HistoryMessage(
-        role=role,
-        content=content,
-        timestamp=timestamp.isoformat(),
-        serialized_output=serialized_output,
-        metadata=metadata
-    )
+    file_path, created_at = resolve_log_file(session_id, timestamp)
     
     # Append to JSONL file
+    message_timestamp = timestamp.isoformat()
     with open(file_path, 'a', encoding='utf-8') as f:
-        f.write(message.model_dump_json() + '\n')
+        f.write(dump_message(role, content, message_timestamp, serialized_output, metadata) + '\n')
     
+    index_message(session_id, file_path, created_at, role, content, message_timestamp, serialized_output)
     return file_path
 
 
+def asave_message(
+    session_id: str,
+    role: str,
+    content: str,
+    timestamp: Optional[datetime] = None,
+    serialized_output: Optional[List[dict]] = None,
+    metadata: Optional[dict] = None
+) -> "asyncio.Future[str]":
+    """
+    Queue a message for the background history writer.
+    
+    Same arguments as save_message(). Must be called from the event loop.
+    
+    Returns:
+        Commit future resolving to the JSONL path once the message is
+        written with the durability of HISTORY_FLUSH_MODE. Awaiting it is optional.
+    """
+    return history_writer.submit(
+        resolve_log_file,
+        index_message,
+        session_id,
+        role,
+        content,
+        timestamp or datetime.now(),
+        serialized_output,
+        metadata
+    )
+
+
+def local_timestamp(timestamp_iso: str) -> str:
+    """Shift a heartbeat file name timestamp to the target timezone"""
+    try:
+        dt = datetime.fromisoformat(timestamp_iso)
+        return (dt + timedelta(hours=settings.UTC_OFFSET)).isoformat()
+    except ValueError:
+        return timestamp_iso
+
+
+def parse_sources(names: Optional[List[str]], default: Tuple[str, ...] = LIST_SOURCES) -> Tuple[str, ...]:
+    """
+    Map API source names ("chat" or "web", "telegram", "heartbeat") to index sources.
+    
+    Raises:
+        ValueError: On an unknown source name
+    """
+    if not names:
+        return default
+    sources = []
+    for name in names:
+        if name not in SOURCE_NAMES:
+            raise ValueError(f"Unknown source: {name}")
+        if SOURCE_NAMES[name] not in sources:
+            sources.append(SOURCE_NAMES[name])
+    return tuple(sources)
+
+
+def _row_metadata(row) -> HistoryMetadata:
+    timestamp = row["created_at"]
+    if row["source"] == SOURCE_HEARTBEAT:
+        timestamp = local_timestamp(timestamp)
+    return HistoryMetadata(
+        session_id=row["session_id"],
+        timestamp=timestamp,
+        first_message=row["first_message"],
+        file_path=row["path"]
+    )
+
+
+def list_version() -> str:
+    """Token that changes whenever a conversation listing may, see HistoryIndex.version."""
+    return history_index.version
+
+
 def list_conversations(
     limit: int = 30,
     offset: int = 0,
-    exclude_prefix: Optional[str] = None
+    exclude_prefix: Optional[str] = None,
+    cursor: Optional[str] = None,
+    sources: Tuple[str, ...] = LIST_SOURCES,
+    include_total: bool = False
 ) -> HistoryListResponse:
     """
-    List conversations with pagination.
+    List conversations with pagination, newest first.
     
     Args:
         limit: Maximum number of conversations to return
-        offset: Number of conversations to skip
+        offset: Number of conversations to skip (ignored with a cursor)
         exclude_prefix: Optional prefix to exclude from results (e.g. "telegram-")
+        cursor: next_cursor of the previous page
+        sources: Index sources to list
+        include_total: Count the conversations, a scan of every row listed
         
     Returns:
-        HistoryListResponse with conversation metadata
-    """
-    history_dir = os.path.join(settings.AGENT_HOME_PATH, "history")
-    
-    if not os.path.exists(history_dir):
-        return HistoryListResponse(conversations=[], total=0, has_more=False)
-    
-    # Find all JSONL files and group by session_id
-    conversations_dict = {}  # session_id -> HistoryMetadata
-    
-    for root, dirs, files in os.walk(history_dir):
-        for filename in files:
-            if filename.endswith('.user.jsonl'):
-                file_path = os.path.join(root, filename)
-                
-                try:
-                    # Parse filename: {timestamp}.{session_id}.user.jsonl
-                    parts = filename.rsplit('.', 3)
-                    if len(parts) >= 3:
-                        timestamp_str = parts[0]
-                        session_id = parts[1]
-                        
-                        # Apply exclusion filter if specified
-                        if exclude_prefix and session_id.startswith(exclude_prefix):
-                            continue
-                        
-                        # Skip if we already have this session (keep the first/oldest file)
-                        if session_id in conversations_dict:
-                            continue
-                        
-                        # Read first USER message for preview
-                        first_message = ''
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            for line in f:
-                                line = line.strip()
-                                if line:
-                                    msg = json.loads(line)
-                                    if msg.get('role') == 'user':
-                                        first_message = msg.get('content', '')[:100]
-                                        break
-                        
-                        # Parse timestamp: 2026-01-31T17-11-27.440 -> 2026-01-31T17:57:11.178
-                        # Split by T first to separate date and time
-                        if 'T' in timestamp_str:
-                            date_part, time_part = timestamp_str.split('T')
-                            # Replace hyphens in time part with colons
-                            time_part = time_part.replace('-', ':')
-                            timestamp_iso = f"{date_part}T{time_part}"
-                        else:
-                            timestamp_iso = timestamp_str
-                        
-                        # Get relative path
-                        rel_path = os.path.relpath(file_path, settings.AGENT_HOME_PATH)
-                        
-                        conversations_dict[session_id] = HistoryMetadata(
-                            session_id=session_id,
-                            timestamp=timestamp_iso,
-                            first_message=first_message,
-                            file_path=rel_path
-                        )
-                except Exception as e:
-                    print(f"Error parsing history file {filename}: {e}")
-                    continue
-    
-    # Convert to list
-    conversations = list(conversations_dict.values())
-    
-    # Sort by timestamp descending (most recent first)
-    conversations.sort(key=lambda x: x.timestamp, reverse=True)
-    
-    # Apply pagination
-    total = len(conversations)
-    paginated = conversations[offset:offset + limit]
-    has_more = (offset + limit) < total
+        HistoryListResponse with conversation metadata; total only with
+        include_total, so a cursor page costs the same at any depth
+        
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    rows = list(history_index.iter_conversations(sources, limit + 1, offset, cursor, exclude_prefix))
+    has_more = len(rows) > limit
+    rows = rows[:limit]
     
     return HistoryListResponse(
-        conversations=paginated,
-        total=total,
-        has_more=has_more
+        conversations=[_row_metadata(row) for row in rows],
+        total=history_index.count_conversations(sources, exclude_prefix) if include_total else None,
+        has_more=has_more,
+        next_cursor=history_index.list_cursor(rows[-1]) if has_more else None
+    )
+
+
+def stream_conversations(
+    limit: int = 30,
+    offset: int = 0,
+    exclude_prefix: Optional[str] = None,
+    cursor: Optional[str] = None,
+    sources: Tuple[str, ...] = LIST_SOURCES,
+    include_total: bool = False
+) -> Iterator[str]:
+    """
+    Same page as list_conversations(), as HistoryListResponse JSON text
+    produced while the rows are read, for large pages.
+    
+    Raises:
+        ValueError: If the cursor is malformed (checked before streaming starts)
+    """
+    if cursor:
+        decode_cursor(cursor, str, str)
+    total = history_index.count_conversations(sources, exclude_prefix) if include_total else None
+    rows = history_index.iter_conversations(sources, limit + 1, offset, cursor, exclude_prefix)
+    
+    def generate() -> Iterator[str]:
+        parts = ['{"conversations":[']
+        size = 0
+        count = 0
+        last = None
+        has_more = False
+        try:
+            for row in rows:
+                if count == limit:
+                    has_more = True
+                    break
+                item = _row_metadata(row).model_dump_json()
+                parts.append(item if count == 0 else ',' + item)
+                size += len(item)
+                count += 1
+                last = row
+                if size >= STREAM_CHUNK_SIZE:
+                    yield ''.join(parts)
+                    parts, size = [], 0
+        finally:
+            rows.close()
+        tail = {
+            "total": total,
+            "has_more": has_more,
+            "next_cursor": history_index.list_cursor(last) if has_more else None
+        }
+        parts.append('],' + json.dumps(tail)[1:])
+        yield ''.join(parts)
+    
+    return generate()
+
+
+def search_messages(
+    query: str,
+    sources: Optional[List[str]] = None,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    include_output: bool = False
+) -> HistorySearchResponse:
+    """
+    Full-text search over chat, Telegram and heartbeat messages.
+    
+    Args:
+        query: Words to find (prefix matches, ANDed), "quoted text" for phrases
+        sources: Any of "chat" (or "web"), "telegram", "heartbeat" (defaults to all)
+        limit: Maximum number of results
+        cursor: next_cursor of the previous page
+        date_from: Earliest message timestamp, ISO date or datetime (inclusive)
+        date_to: Latest message timestamp, ISO date or datetime (inclusive)
+        include_output: Also match agent output (needs HISTORY_SEARCH_INCLUDE_OUTPUT)
+        
+    Returns:
+        HistorySearchResponse with the best matches first, among the newest
+        SEARCH_WINDOW matches and then among each older window
+        
+    Raises:
+        ValueError: If the cursor or a source name is malformed
+    """
+    selected = parse_sources(sources, SEARCH_SOURCES)
+    results, next_cursor, older_matches = history_index.search(
+        query,
+        selected,
+        limit,
+        cursor=cursor,
+        date_from=date_from,
+        date_to=date_to,
+        include_output=include_output
+    )
+    return HistorySearchResponse(
+        results=[HistorySearchResult(**result) for result in results],
+        next_cursor=next_cursor,
+        older_matches=older_matches
     )
 
 
-def get_conversation(session_id: str) -> Optional[HistoryDetailResponse]:
+def log_version(session_id: str, source: Optional[str] = None) -> Optional[Tuple[str, int, int]]:
+    """
+    (path, size, modification time) of a conversation's log, which changes
+    whenever the conversation does; found without reading the log.
+    
+    Args:
+        session_id: Codex session ID
+        source: Index source of the conversation, by default found from the session ID
+        
+    Returns:
+        Version tuple, or None if not found
+    """
+    resolved = history_index.resolve(source or history_source(session_id), session_id)
+    if resolved is None:
+        return None
+    file_path = resolved[0]
+    archived = history_archive.split_archived(file_path)
+    try:
+        # Archives are replaced whenever one of their logs changes
+        stat = os.stat(archived[0] if archived is not None else file_path)
+    except OSError:
+        return None
+    return file_path, stat.st_size, stat.st_mtime_ns
+
+
+def get_conversation(
+    session_id: str,
+    source: Optional[str] = None,
+    created_at_format: Optional[Callable[[str], str]] = None
+) -> Optional[HistoryDetailResponse]:
     """
     Load full conversation by session ID.
     
     Args:
         session_id: Codex session ID
+        source: Index source of the conversation, by default found from the session ID
+        created_at_format: Applied to created_at before it is returned
         
     Returns:
         HistoryDetailResponse with all messages, or None if not found
     """
-    history_dir = os.path.join(settings.AGENT_HOME_PATH, "history")
+    try:
+        result = history_reader.read_messages(source or history_source(session_id), session_id)
+    except Exception as e:
+        print(f"Error loading conversation {session_id}: {e}")
+        return None
+    if result is None:
+        return None
+    
+    created_at, total, messages = result
+    return HistoryDetailResponse(
+        session_id=session_id,
+        messages=messages,
+        created_at=created_at_format(created_at) if created_at_format is not None else created_at
+    )
+
+
+def stream_conversation(
+    session_id: str,
+    source: Optional[str] = None,
+    created_at_format: Optional[Callable[[str], str]] = None
+) -> Optional[Iterator[bytes]]:
+    """
+    Same as get_conversation(), as HistoryDetailResponse JSON streamed from
+    the stored lines without revalidating them (history_reader.stream_messages).
+    
+    Args:
+        session_id: Codex session ID
+        source: Index source of the conversation, by default found from the session ID
+        created_at_format: Applied to created_at before it is written
+        
+    Returns:
+        Iterator of JSON chunks, or None if not found
+    """
+    try:
+        result = history_reader.stream_messages(source or history_source(session_id), session_id)
+    except Exception as e:
+        print(f"Error loading conversation {session_id}: {e}")
+        return None
+    if result is None:
+        return None
+    
+    created_at, messages = result
+    if created_at_format is not None:
+        created_at = created_at_format(created_at)
+    
+    def generate() -> Iterator[bytes]:
+        parts = [b'{"session_id":' + json.dumps(session_id).encode('utf-8') + b',"messages":[']
+        size = 0
+        count = 0
+        try:
+            for message in messages:
+                parts.append(message if count == 0 else b',' + message)
+                size += len(message)
+                count += 1
+                if size >= DETAIL_CHUNK_SIZE:
+                    yield b''.join(parts)
+                    parts, size = [], 0
+        finally:
+            messages.close()
+        parts.append(b'],"created_at":' + json.dumps(created_at).encode('utf-8') + b'}')
+        yield b''.join(parts)
+    
+    return generate()
+
+
+def get_conversation_summary(
+    session_id: str,
+    tail: Optional[int] = None,
+    before: Optional[int] = None,
+    source: Optional[str] = None,
+    created_at_format: Optional[Callable[[str], str]] = None
+) -> Optional[HistorySummaryResponse]:
+    """
+    Load a conversation without the serialized_output of its messages.
+    
+    Args:
+        session_id: Codex session ID
+        tail: Only the last `tail` messages
+        before: Only messages before this index, for paging back from a tail
+        source: Index source of the conversation, by default found from the session ID
+        created_at_format: Applied to created_at before it is returned
+        
+    Returns:
+        HistorySummaryResponse with lightweight messages, or None if not found
+    """
+    try:
+        summary = history_reader.read_summaries(source or history_source(session_id), session_id, tail, before)
+    except OSError as e:
+        print(f"Error loading conversation {session_id}: {e}")
+        return None
+    if summary is None:
+        return None
+    
+    created_at, messages = summary
+    if created_at_format is not None:
+        created_at = created_at_format(created_at)
+    return HistorySummaryResponse(session_id=session_id, messages=messages, created_at=created_at)
+
+
+def get_conversation_edges(
+    session_id: str,
+    head: int,
+    tail: int
+) -> Optional[Tuple[List[HistoryMessageSummary], List[HistoryMessageSummary]]]:
+    """
+    Load the first `head` and the last `tail` messages of a conversation,
+    without the serialized_output and without reading the rest of the log.
+    
+    Args:
+        session_id: Codex session ID
+        head: Number of messages from the start
+        tail: Number of messages from the end
+        
+    Returns:
+        (first messages, last messages), or None if not found
+    """
+    try:
+        return history_reader.read_edges(history_source(session_id), session_id, head, tail)
+    except OSError as e:
+        print(f"Error loading conversation {session_id}: {e}")
+        return None
+
+
+def get_messages(
+    session_id: str,
+    start: int = 0,
+    end: Optional[int] = None,
+    source: Optional[str] = None
+) -> Optional[HistoryMessageRange]:
+    """
+    Load messages start..end (exclusive) of a conversation in full.
+    
+    Args:
+        session_id: Codex session ID
+        start: Index of the first message
+        end: Index after the last message, the end of the conversation if None
+        source: Index source of the conversation, by default found from the session ID
+        
+    Returns:
+        HistoryMessageRange, or None if not found
+    """
+    try:
+        result = history_reader.read_messages(source or history_source(session_id), session_id, start, end)
+    except OSError as e:
+        print(f"Error loading conversation {session_id}: {e}")
+        return None
+    if result is None:
+        return None
+    
+    created_at, total, messages = result
+    return HistoryMessageRange(session_id=session_id, start=start, total=total, messages=messages)
+
+
+def follow_conversation(
+    session_id: str,
+    offset: Optional[int] = None,
+    start: Optional[int] = None,
+    source: Optional[str] = None
+) -> Optional[AsyncIterator[dict]]:
+    """
+    Follow a conversation's log, see history_follow.
+    
+    Args:
+        session_id: Codex session ID
+        offset: Byte offset to resume from, the id of the last event received
+        start: Index of the first message to send, without an offset
+            (default: only messages appended from now on)
+        source: Index source of the conversation, by default found from the session ID
+        
+    Returns:
+        Async iterator of SSE events, or None if not found
+        
+    Raises:
+        ValueError: If the offset doesn't fall between two messages
+    """
+    source = source or history_source(session_id)
+    position = history_follow.start_position(source, session_id, offset, start)
+    if position is None:
+        return None
+    return history_follow.follow(source, session_id, position)
+
+
+def get_message_output(
+    session_id: str,
+    index: int,
+    source: Optional[str] = None
+) -> Optional[HistoryMessageOutput]:
+    """
+    Load the serialized_output of one message.
     
-    if not os.path.exists(history_dir):
+    Args:
+        session_id: Codex session ID
+        index: Position of the message in the conversation
+        source: Index source of the conversation, by default found from the session ID
+        
+    Returns:
+        HistoryMessageOutput, or None if there is no such message
+    """
+    try:
+        message = history_reader.read_message(source or history_source(session_id), session_id, index)
+    except OSError as e:
+        print(f"Error loading conversation {session_id}: {e}")
+        return None
+    if message is None:
         return None
     
-    # Find file with matching session_id
-    for root, dirs, files in os.walk(history_dir):
-        for filename in files:
-            if session_id in filename and filename.endswith('.user.jsonl'):
-                file_path = os.path.join(root, filename)
-                
-                try:
-                    # Parse filename for timestamp
-                    parts = filename.rsplit('.', 3)
-                    timestamp_str = parts[0]
-                    
-                    # Parse timestamp: 2026-01-31T17-11-27.440 -> 2026-01-31T17:57:11.178
-                    if 'T' in timestamp_str:
-                        date_part, time_part = timestamp_str.split('T')
-                        time_part = time_part.replace('-', ':')
-                        timestamp_iso = f"{date_part}T{time_part}"
-                    else:
-                        timestamp_iso = timestamp_str
-                    
-                    # Read all messages
-                    messages = []
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        for line in f:
-                            line = line.strip()
-                            if line:
-                                msg_data = json.loads(line)
-                                messages.append(HistoryMessage(**msg_data))
-                    
-                    return HistoryDetailResponse(
-                        session_id=session_id,
-                        messages=messages,
-                        created_at=timestamp_iso
-                    )
-                except Exception as e:
-                    print(f"Error loading conversation {session_id}: {e}")
-                    return None
-    
-    return None
+    return HistoryMessageOutput(
+        session_id=session_id,
+        message_index=index,
+        serialized_output=message.serialized_output
+    )
@@ -0,0 +1,294 @@
+"""
+Background group-commit writer for the history and heartbeat logs.
+
+asave_message() in the history services puts messages on a queue instead of
+doing file I/O and pydantic serialization inside the event loop. One writer
+task drains the queue in batches and hands each batch to a single worker
+thread, which encodes the messages (history_codec), appends them grouped per file and
+updates the history index once they are flushed, so the index never points
+past what readers of the file can see. Messages of a session therefore stay
+in order, and sessions writing at the same time share their flushes.
+
+Archival moves logs out of the tree while the server runs: it holds `lock`,
+which every batch holds too, and release()s the logs it moves so no handle
+to a moved file stays open. A log archived by another process is noticed by
+its inode when it is next appended to.
+
+HISTORY_FLUSH_MODE decides when a message is committed and its future resolves:
+  "message"  - every batch is flushed to the OS before its futures resolve
+  "interval" - files stay buffered and are flushed every HISTORY_FLUSH_INTERVAL_MS
+  "run_end"  - as "interval", and a file is also flushed and fsynced as soon as
+               the final (assistant) message of a run is written to it
+"""
+
+import os
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional, List, Dict, Tuple, Callable, NamedTuple, IO
+
+from ..config import settings
+from .history_codec import dump_message
+
+FLUSH_MODES = ("message", "interval", "run_end")
+
+# Most messages written by one batch
+MAX_BATCH = 256
+
+# Log files kept open between batches in the buffered modes
+MAX_OPEN_FILES = 64
+
+
+class PendingMessage(NamedTuple):
+    resolve: Callable[[str, datetime], Tuple[str, str]]
+    index: Callable[[str, str, str, str, str, str, Optional[List[dict]]], bool]
+    session_id: str
+    role: str
+    content: str
+    timestamp: datetime
+    serialized_output: Optional[List[dict]]
+    metadata: Optional[dict]
+    future: asyncio.Future
+
+
+# (future, path or None, error or None), settled back on the event loop
+Settlement = Tuple[asyncio.Future, Optional[str], Optional[BaseException]]
+
+
+class WrittenMessage(NamedTuple):
+    """A message appended to its log, to be indexed once flushed."""
+    item: PendingMessage
+    file_path: str
+    created_at: str
+    timestamp: str
+
+
+def _mark_retrieved(future: asyncio.Future):
+    # Commit futures are optional to await, don't warn about unobserved errors
+    if not future.cancelled():
+        future.exception()
+
+
+class HistoryWriter:
+    """Queue and writer task shared by history_service and heartbeat_history_service."""
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history_writer")
+        # Held by every batch, and by archival while it moves logs
+        self.lock = threading.Lock()
+
+        # Only touched under lock
+        self._files: "OrderedDict[str, IO]" = OrderedDict()
+        self._unflushed: Dict[str, List[WrittenMessage]] = {}
+        self._dirty_since: Optional[float] = None
+        # (resolve, session_id) -> (path, created_at) of logs written to but not indexed yet
+        self._unindexed: Dict[Tuple[Callable, str], Tuple[str, str]] = {}
+
+    def submit(
+        self,
+        resolve: Callable[[str, datetime], Tuple[str, str]],
+        index: Callable[[str, str, str, str, str, str, Optional[List[dict]]], bool],
+        session_id: str,
+        role: str,
+        content: str,
+        timestamp: datetime,
+        serialized_output: Optional[List[dict]] = None,
+        metadata: Optional[dict] = None
+    ) -> asyncio.Future:
+        """Queue one message, returning its commit future. Must be called from the event loop."""
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run())
+
+        future = loop.create_future()
+        future.add_done_callback(_mark_retrieved)
+        self._queue.put_nowait(PendingMessage(
+            resolve, index, session_id, role, content, timestamp, serialized_output, metadata, future
+        ))
+        return future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        queue = self._queue
+        stopping = False
+        while not stopping:
+            timeout = None
+            if self._dirty_since is not None:
+                timeout = max(self._dirty_since + settings.HISTORY_FLUSH_INTERVAL_MS / 1000 - time.monotonic(), 0)
+
+            batch: List[PendingMessage] = []
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout)
+                while True:
+                    if item is None:
+                        stopping = True
+                        break
+                    batch.append(item)
+                    if len(batch) >= MAX_BATCH or queue.empty():
+                        break
+                    item = queue.get_nowait()
+            except asyncio.TimeoutError:
+                pass
+
+            flush_due = stopping or (
+                self._dirty_since is not None
+                and time.monotonic() - self._dirty_since >= settings.HISTORY_FLUSH_INTERVAL_MS / 1000
+            )
+            try:
+                settled = await loop.run_in_executor(self._executor, self._write_batch, batch, flush_due, stopping)
+            except Exception as e:
+                print(f"[history_writer] Batch failed: {e}")
+                settled = [(item.future, None, e) for item in batch]
+
+            for future, path, error in settled:
+                if future.done():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(path)
+
+    def _open(self, path: str) -> IO:
+        handle = self._files.get(path)
+        if handle is not None and path not in self._unflushed:
+            # Moved away by another process (archived, then maybe thawed), reopen
+            try:
+                stat = os.stat(path)
+                current = os.fstat(handle.fileno())
+                moved = (stat.st_dev, stat.st_ino) != (current.st_dev, current.st_ino)
+            except OSError:
+                moved = True
+            if moved:
+                del self._files[path]
+                handle.close()
+                handle = None
+        if handle is None:
+            handle = open(path, 'a', encoding='utf-8')
+            self._files[path] = handle
+        self._files.move_to_end(path)
+        return handle
+
+    def _flush(self, paths: List[str], fsync: bool = False, close: bool = False) -> List[Settlement]:
+        settled: List[Settlement] = []
+        for path in paths:
+            written = self._unflushed.pop(path, [])
+            handle = self._files.get(path)
+            error = None
+            if handle is not None:
+                try:
+                    handle.flush()
+                    if fsync:
+                        os.fsync(handle.fileno())
+                except OSError as e:
+                    print(f"[history_writer] Failed to flush {path}: {e}")
+                    error = e
+                if close or error is not None:
+                    del self._files[path]
+                    try:
+                        handle.close()
+                    except OSError:
+                        pass
+            for message in written:
+                item = message.item
+                if error is not None:
+                    settled.append((item.future, None, error))
+                    continue
+                try:
+                    indexed = item.index(
+                        item.session_id, message.file_path, message.created_at, item.role, item.content,
+                        message.timestamp, item.serialized_output
+                    )
+                except Exception as e:
+                    print(f"[history_writer] Failed to index message of {item.session_id}: {e}")
+                    settled.append((item.future, None, e))
+                    continue
+                if indexed:
+                    # resolve() finds the log from now on; until then appends keep going to it
+                    self._unindexed.pop((item.resolve, item.session_id), None)
+                settled.append((item.future, path, None))
+        if not self._unflushed:
+            self._dirty_since = None
+        return settled
+
+    def release(self, path: str) -> bool:
+        """
+        Close the handle of a log about to be moved out of the tree. Call with lock held.
+
+        Returns:
+            False if the log has messages not flushed or not indexed yet, it must stay
+        """
+        if path in self._unflushed or any(file_path == path for file_path, _ in self._unindexed.values()):
+            return False
+        handle = self._files.pop(path, None)
+        if handle is not None:
+            try:
+                handle.close()
+            except OSError:
+                pass
+        return True
+
+    def _write_batch(self, batch: List[PendingMessage], flush_due: bool, stopping: bool) -> List[Settlement]:
+        """Append a batch and flush per HISTORY_FLUSH_MODE. Runs in the writer thread."""
+        with self.lock:
+            return self._write_batch_locked(batch, flush_due, stopping)
+
+    def _write_batch_locked(self, batch: List[PendingMessage], flush_due: bool, stopping: bool) -> List[Settlement]:
+        mode = settings.HISTORY_FLUSH_MODE
+        if mode not in FLUSH_MODES:
+            mode = "message"
+
+        settled: List[Settlement] = []
+        run_ends = []
+        for item in batch:
+            key = (item.resolve, item.session_id)
+            try:
+                # The index doesn't know a log until its first messages are flushed
+                file_path, created_at = self._unindexed.get(key) or item.resolve(item.session_id, item.timestamp)
+                timestamp = item.timestamp.isoformat()
+                line = dump_message(item.role, item.content, timestamp, item.serialized_output, item.metadata)
+                self._open(file_path).write(line + '\n')
+            except Exception as e:
+                print(f"[history_writer] Failed to save message of {item.session_id}: {e}")
+                settled.append((item.future, None, e))
+                continue
+            self._unindexed[key] = (file_path, created_at)
+            self._unflushed.setdefault(file_path, []).append(WrittenMessage(item, file_path, created_at, timestamp))
+            if item.role == "assistant" and file_path not in run_ends:
+                run_ends.append(file_path)
+
+        if self._unflushed and self._dirty_since is None:
+            self._dirty_since = time.monotonic()
+
+        if stopping:
+            settled.extend(self._flush(list(self._files), fsync=mode == "run_end", close=True))
+        elif mode == "message":
+            settled.extend(self._flush(list(self._files), close=True))
+        else:
+            if mode == "run_end" and run_ends:
+                settled.extend(self._flush(run_ends, fsync=True, close=True))
+            if flush_due:
+                settled.extend(self._flush(list(self._unflushed)))
+            # Bound the open handles, flushing the least recently used ones
+            while len(self._files) > MAX_OPEN_FILES:
+                settled.extend(self._flush([next(iter(self._files))], close=True))
+        return settled
+
+    async def close(self):
+        """Write everything queued, flush and close the files and stop the writer task."""
+        if self._task is None or self._task.done():
+            return
+        self._queue.put_nowait(None)
+        await self._task
+        self._task = None
+
+
+# Singleton instance
+history_writer = HistoryWriter()
@@ -0,0 +1,363 @@
+"""
+Chat runs that outlive the HTTP connection that started them.
+
+Each chat turn is a Run: the agent executes in a background task and every
+SSE event it produces is appended to the run's event log with a sequence
+number. Clients attach to a run and read the log from any point, so a page
+refresh or a network blip only costs a reconnect with Last-Event-ID, and the
+turn is saved to history whether or not anyone is listening.
+
+The log keeps the last RUN_EVENT_LOG_SIZE events. A client that resumes from
+before the oldest one gets a "reset" event and the log from there on; the
+complete turn is in the history once the run is done. Finished runs can be
+attached to for RUN_RETENTION_SECONDS.
+
+Any number of clients can watch one run, the agent runs once. Attached
+clients receive new events through the run's BroadcastHub, each with a
+queue of RUN_SUBSCRIBER_QUEUE_SIZE events: the output of a client that falls
+behind is merged per tag, and a client that falls further behind leaves the
+hub and reads the log until it has caught up.
+
+cancel() cancels the task and waits for it, closing the agent's output
+kills its process group (or cancels the call on a warm agent session), so
+the process is gone when cancel() returns, not when a generator is collected.
+"""
+
+import json
+import time
+import uuid
+import asyncio
+from collections import deque
+from datetime import datetime
+from typing import Optional, Dict, List, AsyncIterator
+
+from . import history_service
+from .broadcast_hub import BroadcastHub
+from .heartbeat_service import heartbeat_state
+from .client_service import client_state
+from ..config import settings
+
+RUN_RUNNING = "running"
+RUN_DONE = "done"
+RUN_CANCELLED = "cancelled"
+RUN_FAILED = "failed"
+
+# How long cancel() waits for the run to stop its agent and save the partial turn
+CANCEL_TIMEOUT = 10.0
+
+# Largest output event made by merging the output of a client that is behind
+COALESCE_MAX_CHARS = 64 * 1024
+
+
+class RunConflictError(Exception):
+    """Raised when a conversation already has a run in progress."""
+
+
+class _MergedOutput:
+    """Consecutive output events of one tag, merged for a client that is behind."""
+
+    __slots__ = ("first", "seq", "tag", "parts", "size")
+
+    def __init__(self, first: int, seq: int, tag: str, parts: List[str]):
+        self.first = first
+        self.seq = seq
+        self.tag = tag
+        self.parts = parts
+        self.size = sum(len(part) for part in parts)
+
+    def item(self) -> tuple:
+        data = json.dumps({"tag": self.tag, "data": "".join(self.parts)})
+        return (self.first, self.seq, "output", data, None)
+
+
+def _coalesce(previous, item: tuple):
+    """Merge an output event into the previous one queued for a client, see BroadcastHub."""
+    output = item[4]
+    if output is None:
+        return None
+    tag, text = output
+    if isinstance(previous, _MergedOutput):
+        # Only ever queued for one client, extended in place
+        if previous.tag != tag or previous.size + len(text) > COALESCE_MAX_CHARS:
+            return None
+        previous.parts.append(text)
+        previous.size += len(text)
+        previous.seq = item[1]
+        return previous
+    if previous[4] is None or previous[4][0] != tag or len(previous[4][1]) + len(text) > COALESCE_MAX_CHARS:
+        return None
+    return _MergedOutput(previous[0], item[1], tag, [previous[4][1], text])
+
+
+class Run:
+    """One chat turn and the log of events it produced."""
+
+    def __init__(self, message: str, session_id: Optional[str]):
+        self.run_id = uuid.uuid4().hex
+        self.message = message
+        self.session_id = session_id
+        self.status = RUN_RUNNING
+        self.created_at = datetime.now()
+        self.finished_at: Optional[datetime] = None
+        # Monotonic time the run finished, for retention
+        self.finished = None
+        self.cancel_reason = "Stopped by user"
+        self.cancelling = False
+
+        # (seq, event, data), and (first seq, seq, event, data, (tag, text) of output) to the hub
+        self.events = deque(maxlen=max(settings.RUN_EVENT_LOG_SIZE, 1))
+        self.last_seq = 0
+        self.hub = BroadcastHub(settings.RUN_SUBSCRIBER_QUEUE_SIZE, _coalesce)
+        self.task: Optional[asyncio.Task] = None
+
+    def append(self, event: str, data: dict):
+        """Add an event to the log and send it to the attached clients."""
+        self.last_seq += 1
+        output = (data["tag"], data["data"]) if event == "output" else None
+        data = json.dumps(data)
+        self.events.append((self.last_seq, event, data))
+        self.hub.publish((self.last_seq, self.last_seq, event, data, output))
+
+    def finish(self, status: str, **data):
+        """Record the outcome of the run, its final event."""
+        self.status = status
+        self.finished_at = datetime.now()
+        self.finished = time.monotonic()
+        self.append(status, {"run_id": self.run_id, "session_id": self.session_id, **data})
+        self.hub.close()
+
+    def info(self) -> dict:
+        """Status of the run, see RunInfo."""
+        return {
+            "run_id": self.run_id,
+            "session_id": self.session_id,
+            "status": self.status,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "last_event_id": self.last_seq,
+            "viewers": self.hub.subscriber_count
+        }
+
+    async def attach(self, after: int = 0) -> AsyncIterator[dict]:
+        """
+        Yield SSE events of the run from sequence number `after` on.
+
+        Ends after the final event (done, cancelled or failed). Detaching, by
+        closing the generator, doesn't affect the run.
+        """
+        subscription = None
+        try:
+            while True:
+                if subscription is None:
+                    # Events from now on through the hub, those before from the log
+                    subscription = self.hub.subscribe()
+                    if self.events and self.events[0][0] > after + 1:
+                        # The events in between were dropped from the log
+                        yield {"event": "reset", "data": json.dumps({"run_id": self.run_id, "from": self.events[0][0]})}
+                        after = self.events[0][0] - 1
+                    backlog = [entry for entry in self.events if entry[0] > after] if self.last_seq > after else []
+                    for seq, event, data in backlog:
+                        yield {"event": event, "id": str(seq), "data": data}
+                        after = seq
+
+                item = await subscription.get()
+                if item is None:
+                    if not subscription.dropped:
+                        return
+                    # Fell behind, catch up from the log
+                    subscription = None
+                    continue
+                if isinstance(item, _MergedOutput):
+                    item = item.item()
+                first, seq, event, data, _ = item
+                if seq <= after:
+                    continue
+                if first <= after:
+                    # Merged with events already sent, take the rest from the log
+                    subscription.close()
+                    subscription = None
+                    continue
+                yield {"event": event, "id": str(seq), "data": data}
+                after = seq
+        finally:
+            if subscription is not None:
+                subscription.close()
+
+
+class RunManager:
+    """Registry of the chat runs in progress and recently finished."""
+
+    def __init__(self):
+        self._runs: Dict[str, Run] = {}
+
+    def _prune(self):
+        """Forget finished runs past their retention."""
+        now = time.monotonic()
+        expired = [
+            run_id for run_id, run in self._runs.items()
+            if run.finished is not None and now - run.finished > settings.RUN_RETENTION_SECONDS
+        ]
+        for run_id in expired:
+            del self._runs[run_id]
+
+    def start(self, message: str, session_id: Optional[str] = None) -> Run:
+        """
+        Start a chat turn in the background.
+
+        Raises:
+            RunConflictError: If the conversation already has a run in progress
+        """
+        self._prune()
+        if session_id and any(
+            run.session_id == session_id and run.status == RUN_RUNNING for run in self._runs.values()
+        ):
+            raise RunConflictError(f"Conversation {session_id} already has a run in progress")
+
+        run = Run(message, session_id)
+        self._runs[run.run_id] = run
+        run.append("run", {"run_id": run.run_id})
+        run.task = asyncio.create_task(self._execute(run))
+        print(f"[run_manager] Started run {run.run_id} ({session_id or 'new conversation'})")
+        return run
+
+    def get(self, run_id: str) -> Optional[Run]:
+        self._prune()
+        return self._runs.get(run_id)
+
+    def list(self, session_id: Optional[str] = None, active: bool = False) -> List[Run]:
+        """Runs, oldest first, optionally of one conversation or only those in progress."""
+        self._prune()
+        return [
+            run for run in self._runs.values()
+            if (session_id is None or run.session_id == session_id) and (not active or run.status == RUN_RUNNING)
+        ]
+
+    async def cancel(self, run: Run, reason: Optional[str] = None) -> Run:
+        """Stop a run and wait until its agent process is gone."""
+        if run.task is None or run.task.done():
+            return run
+        if not run.cancelling:
+            # Only once, a second cancel() would interrupt the cleanup
+            run.cancelling = True
+            if reason:
+                run.cancel_reason = reason
+            run.task.cancel()
+        try:
+            await asyncio.wait_for(asyncio.shield(run.task), CANCEL_TIMEOUT)
+        except asyncio.TimeoutError:
+            print(f"[run_manager] Run {run.run_id} did not stop within {CANCEL_TIMEOUT}s")
+        except asyncio.CancelledError:
+            if not run.task.cancelled():
+                raise
+            # Cancelled before it started
+            run.finish(RUN_CANCELLED)
+        return run
+
+    async def shutdown(self):
+        """Cancel every run in progress."""
+        runs = [run for run in self._runs.values() if run.status == RUN_RUNNING]
+        await asyncio.gather(*(self.cancel(run, "Stopped by server shutdown") for run in runs))
+
+    async def _execute(self, run: Run):
+        """Run the agent for one chat turn, logging its events and saving it to history."""
+        status = RUN_FAILED
+        agent_content = []
+        serialized_output = []  # Store all serialized output
+        metadata = None
+        serialized = None
+        try:
+            # Mark on_demand as active (user is interacting)
+            await heartbeat_state.start_on_demand()
+
+            client = client_state.get_client(cwd=settings.AGENT_HOME_PATH)
+            user_timestamp = datetime.now()
+
+            cli_output = client.aexec_prompt(
+                run.message,
+                session_id=run.session_id,
+                skip_git_repo_check=True,
+                allow_edit=True
+            )
+            serialized = client.aserialize_output(cli_output)
+
+            async for tag, line in serialized:
+                # Store all serialized output
+                serialized_output.append({"tag": tag, "data": line})
+
+                # Check for usage limits
+                if client_state.check_event(tag, line):
+                    run.append("output", {
+                        "tag": "error",
+                        "data": "Usage limit exceeded. Please start a new chat to use another available agent.\n\n"
+                    })
+
+                run.append("output", {"tag": tag, "data": line})
+
+                if tag == "meta":
+                    # Extract session_id from metadata
+                    try:
+                        meta = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    run.session_id = meta.get("session_id", run.session_id)
+                    metadata = meta
+
+                    # Save user message now that we have session_id (written in the background)
+                    if run.session_id:
+                        history_service.asave_message(
+                            session_id=run.session_id,
+                            role="user",
+                            content=run.message,
+                            timestamp=user_timestamp
+                        )
+                    run.append("session", {"session_id": run.session_id})
+
+                elif tag == "agent":
+                    # Accumulate agent response for history content
+                    agent_content.append(line)
+
+                elif tag == "done":
+                    # Save assistant message to history, committed before the client sees done
+                    assistant_content = "".join(agent_content)
+                    if run.session_id:
+                        await history_service.asave_message(
+                            session_id=run.session_id,
+                            role="assistant",
+                            content=assistant_content or "Complete",  # Fallback if no agent content
+                            serialized_output=serialized_output,
+                            metadata=metadata
+                        )
+                    status = RUN_DONE
+        except asyncio.CancelledError:
+            status = RUN_CANCELLED
+            print(f"[run_manager] Run {run.run_id} cancelled: {run.cancel_reason}")
+        except Exception as e:
+            print(f"[run_manager] Run {run.run_id} failed: {e}")
+            run.append("output", {"tag": "error", "data": f"Run failed: {e}\n"})
+        finally:
+            # Stop the agent process if it is still running
+            if serialized is not None:
+                await serialized.aclose()
+
+            # Keep what the agent produced of an unfinished turn
+            if status != RUN_DONE and run.session_id:
+                assistant_content = "".join(agent_content)
+                if assistant_content:
+                    suffix = run.cancel_reason if status == RUN_CANCELLED else "Failed"
+                    history_service.asave_message(
+                        session_id=run.session_id,
+                        role="assistant",
+                        content=assistant_content + f"\n\n[{suffix}]",
+                        serialized_output=serialized_output,
+                        metadata=metadata
+                    )
+
+            if status == RUN_DONE:
+                run.finish(status, full_content="".join(agent_content))
+            else:
+                run.finish(status)
+            # Mark on_demand as complete (starts cooldown timer)
+            await heartbeat_state.end_on_demand()
+
+
+run_manager = RunManager()
@@ -42,6 +42,8 @@ class TelegramService:
         self.allowed_user_ids = []
         self.offset = 0
         self.is_running = False
+        self.enabled = settings.ENABLE_TELEGRAM
+        settings.subscribe(self._on_settings_changed)
         
         # Session management
         # Map telegram_user_id -> current_session_id
@@ -49,6 +51,12 @@ class TelegramService:
         # Map session_id -> message_count (user messages only)
         self.session_message_counts: Dict[str, int] = {}
 
+    def _on_settings_changed(self, old_settings, new_settings):
+        """Pick up ENABLE_TELEGRAM changes pushed from the settings layer."""
+        if self.enabled != new_settings.ENABLE_TELEGRAM:
+            logger.info(f"[telegram] ENABLE_TELEGRAM changed to {new_settings.ENABLE_TELEGRAM}")
+        self.enabled = new_settings.ENABLE_TELEGRAM
+
     async def start_polling(self):
         """Start the polling loop."""
         self.is_running = True
@@ -56,7 +64,7 @@ class TelegramService:
         
         while self.is_running:
             # Re-evaluate conditions dynamically
-            enable_telegram = getattr(settings, "ENABLE_TELEGRAM", False)
+            enable_telegram = self.enabled
             current_bot_token = vault.get("TELEGRAM_BOT_TOKEN")
             
             if not enable_telegram or not current_bot_token:
@@ -268,22 +276,22 @@ curl -X POST https://api.telegram.org/bot{self.bot_token}/sendMessage \\
             
             user_timestamp = datetime.now()
             
-            # Save user message first
-            history_service.save_message(
+            # Save user message first (written in the background)
+            history_service.asave_message(
                 session_id=current_session_id,
                 role="user",
                 content=text, # Save original text, not the prompt with instruction/summary
                 timestamp=user_timestamp
             )
             
-            cli_output = client.exec_prompt(
+            cli_output = client.aexec_prompt(
                 final_prompt,
                 session_id=current_session_id,
                 skip_git_repo_check=True,
                 allow_edit=True
             )
             
-            serialized = client.serialize_output(cli_output)
+            serialized = client.aserialize_output(cli_output)
             
             agent_chunks = []
             stdout_chunks = []
@@ -291,21 +299,24 @@ curl -X POST https://api.telegram.org/bot{self.bot_token}/sendMessage \\
             metadata = None
             
             switched = False
-            for tag, line in serialized:
-                serialized_output.append({"tag": tag, "data": line})
-                switched = client_state.check_and_update_state([{"tag": tag, "data": line}])
-                if switched:
-                    break
-                
-                if tag == "agent":
-                    agent_chunks.append(line)
-                elif tag == "stdout":
-                    stdout_chunks.append(line)
-                elif tag == "meta":
-                    try:
-                        metadata = json.loads(line)
-                    except:
-                        pass
+            try:
+                async for tag, line in serialized:
+                    serialized_output.append({"tag": tag, "data": line})
+                    switched = client_state.check_event(tag, line)
+                    if switched:
+                        break
+                    
+                    if tag == "agent":
+                        agent_chunks.append(line)
+                    elif tag == "stdout":
+                        stdout_chunks.append(line)
+                    elif tag == "meta":
+                        try:
+                            metadata = json.loads(line)
+                        except:
+                            pass
+            finally:
+                await serialized.aclose()
             
             if switched:
                 full_response = "Usage limit exceeded. Please send message again to use another available agent.\n\n" + line
@@ -321,7 +332,7 @@ curl -X POST https://api.telegram.org/bot{self.bot_token}/sendMessage \\
                     full_response = agent_body + "\n" + stdout_body
             
             # Save assistant message
-            history_service.save_message(
+            await history_service.asave_message(
                 session_id=current_session_id,
                 role="assistant",
                 content=full_response or "Complete",
@@ -384,12 +395,12 @@ curl -X POST https://api.telegram.org/bot{self.bot_token}/sendMessage \\
         (1) Summary of first 15 messages.
         (2) Raw full bodies of last 10 messages.
         """
-        history = history_service.get_conversation(old_session_id)
-        if not history or not history.messages:
+        # Only the ends of the log are read, however long the session got
+        edges = await asyncio.to_thread(history_service.get_conversation_edges, old_session_id, 15, 20)
+        if not edges or not edges[1]:
             return "No previous context."
         
-        messages = history.messages
-        total_msgs = len(messages)
+        first_chunk, last_chunk = edges
         
         # We need ping-pongs (User+Assistant pairs usually, but history is flat list)
         # Let's just treat them as individual messages for slicing simplicity
@@ -404,13 +415,6 @@ curl -X POST https://api.telegram.org/bot{self.bot_token}/sendMessage \\
         # Last 10 exchanges (20 messages) -> Keep raw.
         # Any overlap? If total is small, just keep raw.
         
-        if total_msgs < 20: 
-            # Just keep everything raw if it's short, though we rotated at 25 user messages (so ~50 total)
-            pass
-            
-        first_chunk = messages[:15]
-        last_chunk = messages[-20:] # Last 10 ping-pongs approx 20 msgs
-        
         summary_text = await self._summarize_messages(first_chunk)
         
         raw_text = "\n[Latest Conversation]\n"
@@ -441,14 +445,14 @@ curl -X POST https://api.telegram.org/bot{self.bot_token}/sendMessage \\
             # But exec_prompt requires session_id usually for history tracking if we want it.
             # Here we just want a one-off.
              
-            cli_output = client.exec_prompt(
+            cli_output = client.aexec_prompt(
                 prompt,
                 session_id=None, # One-off
                 skip_git_repo_check=True
             )
             
             output_text = ""
-            for tag, line in client.serialize_output(cli_output):
+            async for tag, line in client.aserialize_output(cli_output):
                 if tag == "agent":
                     output_text += line
             
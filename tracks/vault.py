@@ -1,31 +1,125 @@
+import os
 import json
+import stat
+import fcntl
+import tempfile
+import threading
+from contextlib import contextmanager
 
-from .config import settings
+from .config import settings, _stat_signature
 
 
 class Vault:
-    def __init__(self):
-        self.vault_path = settings.VAULT_PATH
+    """
+    Cached view of vault.json.
+
+    The parsed file is kept in memory and only re-read when its inode, size or
+    mtime changes. Writes go to a temp file that is renamed over vault.json
+    while holding an exclusive fcntl lock on vault.json.lock, so the API
+    process, the standalone workers and skill scripts never see partial JSON
+    or lose each other's updates.
+    """
+    def __init__(self, vault_path=None):
+        self.vault_path = vault_path or settings.VAULT_PATH
+        self.lock_path = self.vault_path + ".lock"
+        self._data = {}
+        self._signature = None
+        self._lock = threading.RLock()
+        self._pending = None
+        self._txn_owner = None
+
+    def _load(self):
+        """Return cached data, re-reading vault.json if it changed on disk."""
+        signature = _stat_signature(self.vault_path)
+        if signature is None:
+            self._data, self._signature = {}, None
+            return self._data
+        if signature != self._signature:
+            with open(self.vault_path, "r", encoding="utf-8") as f:
+                content = f.read()
+            self._data = json.loads(content) if content.strip() else {}
+            self._signature = signature
+        return self._data
+
+    def _write(self, data):
+        """Atomically replace vault.json with data. Caller must hold the file lock."""
+        directory = os.path.dirname(self.vault_path) or "."
+        fd, temp_path = tempfile.mkstemp(prefix=".vault.", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=4, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            try:
+                os.chmod(temp_path, stat.S_IMODE(os.stat(self.vault_path).st_mode))
+            except FileNotFoundError:
+                pass
+            os.replace(temp_path, self.vault_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self._data = data
+        self._signature = _stat_signature(self.vault_path)
+
+    def _in_transaction(self):
+        return self._pending is not None and self._txn_owner == threading.get_ident()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Batch several mutations into a single locked read-modify-write.
+
+        Yields a dict holding the current vault contents; vault.set()/delete()
+        calls made by the same thread inside the block also apply to it.
+        The file is written once on exit, and only if something changed.
+        """
+        with self._lock:
+            if self._in_transaction():
+                yield self._pending
+                return
+
+            with open(self.lock_path, "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    original = self._load()
+                    self._pending = dict(original)
+                    self._txn_owner = threading.get_ident()
+                    try:
+                        yield self._pending
+                        if self._pending != original:
+                            self._write(self._pending)
+                    finally:
+                        self._pending = None
+                        self._txn_owner = None
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def signature(self):
+        """Return the stat signature of the current vault.json (None if missing)."""
+        with self._lock:
+            self._load()
+            return self._signature
 
     def to_dict(self):
-        with open(self.vault_path, "r", encoding="utf-8") as f:
-            return json.load(f)
-        
+        if self._in_transaction():
+            return dict(self._pending)
+        with self._lock:
+            return dict(self._load())
+
     def get(self, key):
-        return self.to_dict().get(key, None)
+        if self._in_transaction():
+            return self._pending.get(key, None)
+        with self._lock:
+            return self._load().get(key, None)
 
     def set(self, key, value):
-        data = self.to_dict()
-        data[key] = value
-        with open(self.vault_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=4, ensure_ascii=False)
+        with self.transaction() as data:
+            data[key] = value
 
     def delete(self, key):
-        data = self.to_dict()
-        if key in data:
-            del data[key]
-            with open(self.vault_path, "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=4, ensure_ascii=False)
+        with self.transaction() as data:
+            data.pop(key, None)
 
 
-vault = Vault()
\ No newline at end of file
+vault = Vault()